@@ -0,0 +1,159 @@
+# backend/assignment_content.py
+"""
+Assignment text storage.
+
+Uploaded text lives in assignment_contents, compressed and keyed by the
+sha256 of the exact text, so identical submissions are stored once and the
+hot assignments table only carries the 64-character content_hash. Text is
+read only by code that needs it (analysis, plagiarism comparison,
+?include=original_text).
+"""
+import os
+import zlib
+import hashlib
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+try:
+    import zstandard
+except ImportError:  # optional; zlib is used without it
+    zstandard = None
+
+# zstd when the zstandard package is installed, else zlib; each row records its
+# codec, so changing this never breaks reading older rows
+TEXT_COMPRESSION = os.getenv("TEXT_COMPRESSION", "zstd" if zstandard else "zlib")
+if TEXT_COMPRESSION not in ("zstd", "zlib", "none"):
+    raise ValueError("TEXT_COMPRESSION must be zstd, zlib or none")
+if TEXT_COMPRESSION == "zstd" and zstandard is None:
+    print("⚠️ TEXT_COMPRESSION=zstd but zstandard is not installed; using zlib")
+    TEXT_COMPRESSION = "zlib"
+
+ZSTD_LEVEL = 6
+ZLIB_LEVEL = 6
+
+def text_hash(content: str) -> str:
+    """sha256 of the exact text (unlike result_cache.content_hash, no normalization)"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def compress_text(content: str, codec: str = TEXT_COMPRESSION) -> Tuple[str, bytes]:
+    raw = content.encode("utf-8")
+    if codec == "zstd":
+        return codec, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    if codec == "zlib":
+        return codec, zlib.compress(raw, ZLIB_LEVEL)
+    return "none", raw
+
+def decompress_text(codec: Optional[str], data: Optional[bytes]) -> str:
+    if data is None:
+        return ""
+    data = bytes(data)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd-compressed assignment text needs the zstandard package")
+        raw = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == "zlib":
+        raw = zlib.decompress(data)
+    else:
+        raw = data
+    return raw.decode("utf-8")
+
+def prepare_text(content: str) -> Tuple[str, str, bytes, int]:
+    """
+    (content_hash, codec, data, original_size) for store_prepared_text.
+
+    Hashing and compression are CPU work; routes run this on the I/O pool so
+    the run_db callback (on the event loop with DB_ASYNC) only executes SQL.
+    """
+    codec, data = compress_text(content)
+    return text_hash(content), codec, data, len(content)
+
+def store_prepared_text(db: Session, prepared: Tuple[str, str, bytes, int]) -> str:
+    """Store prepared content once (deduplicated by hash) and return its content_hash; caller commits"""
+    digest, codec, data, size = prepared
+    db.execute(text("""
+        INSERT INTO assignment_contents (content_hash, compression, data, original_size)
+        VALUES (:hash, :codec, :data, :size)
+        ON CONFLICT (content_hash) DO NOTHING
+    """), {"hash": digest, "codec": codec, "data": data, "size": size})
+    return digest
+
+def store_text(db: Session, content: str) -> str:
+    return store_prepared_text(db, prepare_text(content))
+
+def load_compressed_texts(db: Session, assignment_ids: Iterable[int]) -> Dict[int, Tuple[str, bytes]]:
+    """{assignment id: (codec, data)}, for callers that decompress off the DB callback"""
+    rows = db.execute(text("""
+        SELECT a.id, c.compression, c.data
+        FROM assignments a
+        JOIN assignment_contents c ON c.content_hash = a.content_hash
+        WHERE a.id = ANY(:ids)
+    """), {"ids": list(assignment_ids)}).fetchall()
+    return {r[0]: (r[1], r[2]) for r in rows}
+
+def load_texts(db: Session, assignment_ids: Iterable[int]) -> Dict[int, str]:
+    """{assignment id: text} for the given assignments"""
+    return {
+        assignment_id: decompress_text(codec, data)
+        for assignment_id, (codec, data) in load_compressed_texts(db, assignment_ids).items()
+    }
+
+def load_text(db: Session, assignment_id: int) -> str:
+    return load_texts(db, [assignment_id]).get(assignment_id, "")
+
+def _has_legacy_column(db: Session) -> bool:
+    return db.execute(text("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'assignments'
+          AND column_name = 'original_text'
+    """)).first() is not None
+
+def migrate_assignment_texts(session_factory, batch_size: int = 500) -> int:
+    """
+    Move the legacy assignments.original_text column into assignment_contents.
+
+    Runs in keyset batches before the analysis workers start. The column
+    itself is kept (old deployments may still read it) until an operator
+    runs finalize_migrations.py. Safe to run from several processes at once.
+    """
+    moved = 0
+    last_id = 0
+    with session_factory() as db:
+        if not _has_legacy_column(db):
+            return 0
+        while True:
+            rows = db.execute(text("""
+                SELECT id, original_text FROM assignments
+                WHERE id > :after AND content_hash IS NULL
+                ORDER BY id
+                LIMIT :limit
+            """), {"after": last_id, "limit": batch_size}).fetchall()
+            if not rows:
+                break
+            db.execute(text("UPDATE assignments SET content_hash = :hash WHERE id = :id"), [
+                {"id": assignment_id, "hash": store_text(db, content or "")}
+                for assignment_id, content in rows
+            ])
+            db.commit()
+            moved += len(rows)
+            last_id = rows[-1][0]
+    if moved:
+        print(f"🗜️ Moved {moved} assignment texts to assignment_contents ({TEXT_COMPRESSION})")
+    return moved
+
+def drop_legacy_text_column(session_factory) -> bool:
+    """
+    Drop assignments.original_text once every row has been moved to
+    assignment_contents. Returns False, leaving the column, otherwise.
+    """
+    with session_factory() as db:
+        if not _has_legacy_column(db):
+            return True
+        remaining = db.execute(text("SELECT count(*) FROM assignments WHERE content_hash IS NULL")).scalar()
+        if remaining:
+            print(f"⚠️ {remaining} assignments still have no content_hash; original_text kept")
+            return False
+        db.execute(text("ALTER TABLE assignments DROP COLUMN IF EXISTS original_text"))
+        db.commit()
+    print("🗑️ Dropped assignments.original_text")
+    return True
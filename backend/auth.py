@@ -1,18 +1,28 @@
 #backend\auth.py
 # backend/auth.py
 from datetime import datetime, timedelta
+from collections import OrderedDict
 from typing import Optional, Dict, Any
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import bcrypt
 from fastapi import HTTPException, status
+from sqlalchemy import event
 import os
+import time
+import threading
+
+from models import Student
 
 # Security
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Verified principals are cached briefly so protected routes skip the students lookup
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_MAX_ITEMS = int(os.getenv("AUTH_CACHE_MAX_ITEMS", "10000"))
+
 # Fix for bcrypt issues - use specific configuration
 pwd_context = CryptContext(
     schemes=["bcrypt"],
@@ -74,7 +84,7 @@ def verify_token(token: str):
                 detail="Invalid authentication credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        return {"email": email, "role": role}
+        return {"email": email, "role": role, "user_id": payload.get("user_id")}
     except JWTError as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -86,4 +96,74 @@ def verify_token(token: str):
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Token verification failed: {str(e)}",
             headers={"WWW-Authenticate": "Bearer"},
-        )
\ No newline at end of file
+        )
+
+class Principal:
+    """Authenticated user handed to routes; a plain object, not tied to a session"""
+    __slots__ = ("id", "email", "full_name", "student_id", "role")
+
+    def __init__(self, id: int, email: str, full_name: Optional[str],
+                 student_id: Optional[str], role: str = "student"):
+        self.id = id
+        self.email = email
+        self.full_name = full_name
+        self.student_id = student_id
+        self.role = role
+
+    @classmethod
+    def from_student(cls, student: Student, role: str = "student") -> "Principal":
+        return cls(student.id, student.email, student.full_name, student.student_id, role)
+
+class PrincipalCache:
+    """
+    Size-bounded LRU of verified principals keyed by user id.
+
+    Entries expire after AUTH_CACHE_TTL seconds and are dropped as soon as
+    the student row is updated (e.g. a password change) or deleted through
+    the ORM in this process; other processes see the change within the TTL.
+    """
+
+    def __init__(self, ttl: float = AUTH_CACHE_TTL, max_items: int = AUTH_CACHE_MAX_ITEMS):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, user_id: Optional[int], email: str) -> Optional[Principal]:
+        """Cached principal for a verified token's claims, or None"""
+        with self._lock:
+            entry = self._items.get(user_id) if user_id is not None else None
+            if entry is not None:
+                stored_at, principal = entry
+                if time.monotonic() - stored_at <= self.ttl and principal.email == email:
+                    self._items.move_to_end(user_id)
+                    self._hits += 1
+                    return principal
+                del self._items[user_id]
+            self._misses += 1
+            return None
+
+    def put(self, principal: Principal) -> Principal:
+        with self._lock:
+            self._items[principal.id] = (time.monotonic(), principal)
+            self._items.move_to_end(principal.id)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return principal
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._items.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"items": len(self._items), "hits": self._hits, "misses": self._misses}
+
+principal_cache = PrincipalCache()
+
+@event.listens_for(Student, "after_update")
+@event.listens_for(Student, "after_delete")
+def _invalidate_principal(mapper, connection, target):
+    principal_cache.invalidate(target.id)
@@ -0,0 +1,269 @@
+# backend/batch_upload.py
+import os
+import json
+import zipfile
+from collections import deque
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from uploads import MAX_UPLOAD_BYTES
+from executors import sandbox_pool, run_isolated, PARSE_WORKERS
+from text_extraction import extract_document, PDF_EXTRACT_TIMEOUT, PDF_KILL_GRACE
+from assignment_content import compress_text, text_hash
+from plagiarism import assignment_fingerprints
+
+SUPPORTED_EXTENSIONS = ("pdf", "docx", "txt")
+
+# Documents accepted per batch (files plus ZIP entries)
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "1000"))
+
+# Documents being extracted at once; bounds the memory held for entries
+EXTRACT_WINDOW = 2 * PARSE_WORKERS
+
+def _extension(filename: str) -> str:
+    return filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+
+def iter_documents(files: List[Tuple[str, BinaryIO]]) -> Iterator[Tuple[str, str, Optional[bytes], Optional[str]]]:
+    """
+    (filename, extension, data, error) for every document in the upload.
+
+    ZIP archives are read entry by entry from the spooled upload, so only
+    the entries being extracted are held in memory and nothing is written
+    to disk. An entry is never read past MAX_UPLOAD_BYTES, whatever its
+    header claims. After MAX_BATCH_FILES documents the next one is reported
+    as over the limit and nothing further is opened or read.
+    """
+    accepted = 0
+
+    def limit_reached(name: str, extension: str):
+        return name, extension, None, f"Batch limit of {MAX_BATCH_FILES} files reached; later files were skipped"
+
+    for filename, stream in files:
+        extension = _extension(filename)
+        if extension == "zip":
+            try:
+                archive = zipfile.ZipFile(stream)
+            except zipfile.BadZipFile:
+                yield filename, extension, None, "Not a valid ZIP archive"
+                continue
+            with archive:
+                for info in archive.infolist():
+                    name = info.filename
+                    base = os.path.basename(name)
+                    # Folders and macOS metadata
+                    if info.is_dir() or name.startswith("__MACOSX/") or base.startswith("."):
+                        continue
+                    entry_extension = _extension(base)
+                    if entry_extension not in SUPPORTED_EXTENSIONS:
+                        yield name, entry_extension, None, "Unsupported file format"
+                    elif info.file_size > MAX_UPLOAD_BYTES:
+                        yield name, entry_extension, None, "File too large"
+                    elif accepted >= MAX_BATCH_FILES:
+                        yield limit_reached(name, entry_extension)
+                        return
+                    else:
+                        try:
+                            with archive.open(info) as entry:
+                                data = entry.read(MAX_UPLOAD_BYTES + 1)
+                        except (zipfile.BadZipFile, RuntimeError, NotImplementedError, OSError) as e:
+                            yield name, entry_extension, None, f"Could not read entry: {e}"
+                            continue
+                        if len(data) > MAX_UPLOAD_BYTES:
+                            yield name, entry_extension, None, "File too large"
+                        else:
+                            accepted += 1
+                            yield name, entry_extension, data, None
+        elif extension not in SUPPORTED_EXTENSIONS:
+            yield filename, extension, None, "Unsupported file format"
+        elif accepted >= MAX_BATCH_FILES:
+            yield limit_reached(filename, extension)
+            return
+        else:
+            data = stream.read(MAX_UPLOAD_BYTES + 1)
+            if len(data) > MAX_UPLOAD_BYTES:
+                yield filename, extension, None, "File too large"
+            else:
+                accepted += 1
+                yield filename, extension, data, None
+
+def extract_batch(files: List[Tuple[str, BinaryIO]]) -> Tuple[List[Tuple[str, str]], List[Dict[str, str]]]:
+    """
+    Extract every document; returns ([(filename, text)], [rejected]).
+
+    PDF and DOCX parsing runs in sandboxed processes (one per document,
+    killed at the time limit) with up to EXTRACT_WINDOW documents in
+    flight; plain text is decoded here.
+    Accepted documents keep their upload order.
+    """
+    results: List[Optional[Tuple[str, str]]] = []
+    rejected: List[Dict[str, str]] = []
+    pending = deque()
+
+    def collect(index: int, filename: str, future):
+        try:
+            content = future.result().strip()
+        except Exception as e:
+            rejected.append({"filename": filename, "error": f"Error reading file: {e}"})
+            return
+        if not content:
+            rejected.append({"filename": filename, "error": "No text could be extracted"})
+            return
+        results[index] = (filename, content)
+
+    for filename, extension, data, error in iter_documents(files):
+        if error is not None:
+            rejected.append({"filename": filename, "error": error})
+            continue
+        results.append(None)
+        index = len(results) - 1
+        if extension == "txt":
+            try:
+                content = data.decode("utf-8").strip()
+            except UnicodeDecodeError as e:
+                rejected.append({"filename": filename, "error": f"Error reading file: {e}"})
+                continue
+            if content:
+                results[index] = (filename, content)
+            else:
+                rejected.append({"filename": filename, "error": "No text could be extracted"})
+            continue
+        pending.append((index, filename, sandbox_pool.submit(
+            run_isolated, PDF_EXTRACT_TIMEOUT + PDF_KILL_GRACE, extract_document, data, extension
+        )))
+        while len(pending) >= EXTRACT_WINDOW:
+            collect(*pending.popleft())
+    while pending:
+        collect(*pending.popleft())
+
+    return [r for r in results if r is not None], rejected
+
+def prepare_batch(documents: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """
+    CPU work for queue_batch, run on the I/O pool: a hash and word count per
+    document, and one compressed copy and fingerprint set per distinct text.
+    """
+    items = []
+    contents = {}
+    fingerprints = {}
+    for filename, content in documents:
+        digest = text_hash(content)
+        if digest not in contents:
+            codec, data = compress_text(content)
+            contents[digest] = (codec, data, len(content))
+            fingerprints[digest] = assignment_fingerprints(content)
+        items.append((filename, digest, len(content.split())))
+    return {"documents": items, "contents": contents, "fingerprints": fingerprints}
+
+def queue_batch(db: Session, student_id: int, prepared: Dict[str, Any],
+                rejected: List[Dict[str, str]]) -> Dict[str, Any]:
+    """
+    Store a prepare_batch() result and queue one analysis job per document in
+    a single transaction; only SQL runs here.
+
+    Contents, assignments, fingerprints and jobs are each written with one
+    multi-row INSERT (unnest of arrays) rather than a statement per file.
+    """
+    documents = prepared["documents"]
+    batch_id = db.execute(text("""
+        INSERT INTO upload_batches (student_id, file_count, rejected, created_at)
+        VALUES (:student_id, :file_count, CAST(:rejected AS json), now())
+        RETURNING id
+    """), {"student_id": student_id, "file_count": len(documents), "rejected": json.dumps(rejected)}).scalar()
+
+    assignments = []
+    if documents:
+        contents = prepared["contents"]
+        db.execute(text("""
+            INSERT INTO assignment_contents (content_hash, compression, data, original_size, created_at)
+            SELECT h, c, d, s, now()
+            FROM unnest(CAST(:hashes AS text[]), CAST(:codecs AS text[]), CAST(:data AS bytea[]),
+                        CAST(:sizes AS integer[])) AS t(h, c, d, s)
+            ON CONFLICT (content_hash) DO NOTHING
+        """), {
+            "hashes": list(contents),
+            "codecs": [codec for codec, _, _ in contents.values()],
+            "data": [data for _, data, _ in contents.values()],
+            "sizes": [size for _, _, size in contents.values()]
+        })
+        fingerprints = prepared["fingerprints"]
+        rows = db.execute(text("""
+            WITH new AS (
+                INSERT INTO assignments (student_id, batch_id, filename, content_hash, word_count, uploaded_at)
+                SELECT :student_id, :batch_id, t.filename, t.content_hash, t.word_count, now()
+                FROM unnest(CAST(:filenames AS text[]), CAST(:hashes AS text[]), CAST(:word_counts AS integer[]))
+                     WITH ORDINALITY AS t(filename, content_hash, word_count, position)
+                ORDER BY t.position
+                RETURNING id, filename, content_hash
+            ),
+            -- Searchable before analysis runs, by later submissions and by the
+            -- other files of this batch (see plagiarism.OWNER_FILTER)
+            indexed AS (
+                INSERT INTO assignment_fingerprints (fingerprint, assignment_id)
+                SELECT f.fingerprint, new.id
+                FROM new
+                JOIN unnest(CAST(:fingerprint_hashes AS text[]), CAST(:fingerprints AS bigint[]))
+                     AS f(content_hash, fingerprint) ON f.content_hash = new.content_hash
+            ),
+            jobs AS (
+                INSERT INTO analysis_jobs (assignment_id, batch_id, status, attempts, created_at)
+                SELECT id, :batch_id, 'pending', 0, now() FROM new
+                ORDER BY id
+                RETURNING id, assignment_id
+            )
+            SELECT new.id, new.filename, jobs.id
+            FROM new JOIN jobs ON jobs.assignment_id = new.id
+            ORDER BY new.id
+        """), {
+            "student_id": student_id,
+            "batch_id": batch_id,
+            "filenames": [filename for filename, _, _ in documents],
+            "hashes": [digest for _, digest, _ in documents],
+            "word_counts": [word_count for _, _, word_count in documents],
+            "fingerprint_hashes": [digest for digest, values in fingerprints.items() for _ in range(values.size)],
+            "fingerprints": [int(value) for values in fingerprints.values() for value in values]
+        }).fetchall()
+        assignments = [
+            {"assignment_id": r[0], "filename": r[1], "job_id": str(r[2])} for r in rows
+        ]
+    db.commit()
+    return {
+        "batch_id": batch_id,
+        "status": "pending",
+        "accepted": len(assignments),
+        "rejected": rejected,
+        "assignments": assignments
+    }
+
+def load_batch(db: Session, batch_id: int, student_id: int) -> Optional[Dict[str, Any]]:
+    """Batch progress: job counts by status, plus each file's job status"""
+    batch = db.execute(text("""
+        SELECT id, file_count, rejected, created_at FROM upload_batches
+        WHERE id = :id AND student_id = :student_id
+    """), {"id": batch_id, "student_id": student_id}).first()
+    if batch is None:
+        return None
+    rows = db.execute(text("""
+        SELECT j.id, j.assignment_id, a.filename, j.status, j.analysis_id
+        FROM analysis_jobs j
+        JOIN assignments a ON a.id = j.assignment_id
+        WHERE j.batch_id = :id
+        ORDER BY j.assignment_id
+    """), {"id": batch_id}).fetchall()
+
+    progress = {"pending": 0, "running": 0, "completed": 0, "failed": 0}
+    for r in rows:
+        progress[r[3]] = progress.get(r[3], 0) + 1
+    finished = progress["completed"] + progress["failed"]
+    return {
+        "batch_id": batch.id,
+        "status": "completed" if finished == len(rows) else "running" if finished or progress["running"] else "pending",
+        "created_at": batch.created_at.isoformat() if batch.created_at else "",
+        "accepted": batch.file_count,
+        "rejected": batch.rejected or [],
+        "progress": dict(progress, total=len(rows), percent=round(100.0 * finished / len(rows), 1) if rows else 100.0),
+        "assignments": [
+            {"assignment_id": r[1], "filename": r[2], "job_id": str(r[0]), "status": r[3], "analysis_id": r[4]}
+            for r in rows
+        ]
+    }
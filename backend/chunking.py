@@ -0,0 +1,120 @@
+# backend/chunking.py
+import os
+import re
+from typing import List, Optional, Sequence, Tuple
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from embeddings import USE_VECTOR, EMBEDDING_DIM, to_pgvector
+
+# Passages of academic_sources.full_text indexed for retrieval
+CHUNK_WORDS = int(os.getenv("CHUNK_WORDS", "200"))
+CHUNK_OVERLAP_WORDS = int(os.getenv("CHUNK_OVERLAP_WORDS", "50"))
+
+# Chunks sent to the embedder per call
+EMBED_BATCH_SIZE = 256
+
+_WORD = re.compile(r"\S+")
+
+if not 0 <= CHUNK_OVERLAP_WORDS < CHUNK_WORDS:
+    raise ValueError("CHUNK_OVERLAP_WORDS must be smaller than CHUNK_WORDS")
+
+def chunk_text(content: Optional[str], size: int = CHUNK_WORDS,
+               overlap: int = CHUNK_OVERLAP_WORDS) -> List[Tuple[int, int, str]]:
+    """
+    Split text into overlapping passages of `size` words.
+
+    Returns (start, end, passage) with character offsets into content, so a
+    match can be located in full_text without storing it twice.
+    """
+    spans = [m.span() for m in _WORD.finditer(content or "")]
+    chunks = []
+    step = size - overlap
+    for first in range(0, len(spans), step):
+        last = min(first + size, len(spans)) - 1
+        start, end = spans[first][0], spans[last][1]
+        chunks.append((start, end, content[start:end]))
+        if last == len(spans) - 1:
+            break
+    return chunks
+
+def vector_chunk_statements() -> List[str]:
+    """DDL for chunk embeddings (applied with the other pgvector DDL)"""
+    return [
+        f"ALTER TABLE source_chunks ADD COLUMN IF NOT EXISTS embedding vector({EMBEDDING_DIM})",
+        "CREATE INDEX IF NOT EXISTS ix_source_chunks_embedding "
+        "ON source_chunks USING hnsw (embedding vector_cosine_ops)",
+    ]
+
+def _embed_chunks(db: Session, embedder, rows: Sequence):
+    """Store embeddings for (chunk_id, content) rows in batches"""
+    for offset in range(0, len(rows), EMBED_BATCH_SIZE):
+        batch = rows[offset:offset + EMBED_BATCH_SIZE]
+        vectors = embedder.embed([r[1] for r in batch])
+        db.execute(
+            text("UPDATE source_chunks SET embedding = CAST(CAST(:embedding AS text) AS vector) WHERE id = :id"),
+            [{"id": r[0], "embedding": to_pgvector(v)} for r, v in zip(batch, vectors)]
+        )
+
+def index_source_chunks(db: Session, source_id: int, full_text: Optional[str], embedder=None) -> int:
+    """Replace a source's chunks (and their embeddings); caller commits"""
+    db.execute(text("DELETE FROM source_chunks WHERE source_id = :id"), {"id": source_id})
+    chunks = chunk_text(full_text)
+    if not chunks:
+        return 0
+    rows = db.execute(text("""
+        INSERT INTO source_chunks (source_id, chunk_index, start_offset, end_offset, content)
+        SELECT :source_id, chunk_index - 1, start_offset, end_offset, content
+        FROM unnest(CAST(:starts AS integer[]), CAST(:ends AS integer[]), CAST(:contents AS text[]))
+             WITH ORDINALITY AS c(start_offset, end_offset, content, chunk_index)
+        RETURNING id, content
+    """), {
+        "source_id": source_id,
+        "starts": [c[0] for c in chunks],
+        "ends": [c[1] for c in chunks],
+        "contents": [c[2] for c in chunks],
+    }).fetchall()
+    if embedder is not None and USE_VECTOR:
+        _embed_chunks(db, embedder, rows)
+    return len(rows)
+
+def chunk_unindexed_sources(session_factory, embedder=None, batch_size: int = 50):
+    """Chunk sources whose full_text has no chunks yet, and embed unembedded chunks"""
+    chunked = sources = 0
+    last_id = 0
+    try:
+        with session_factory() as db:
+            # Keyset scan so sources whose text yields no chunks are not revisited
+            while True:
+                rows = db.execute(text("""
+                    SELECT s.id, s.full_text FROM academic_sources s
+                    WHERE s.id > :after
+                      AND s.full_text IS NOT NULL AND s.full_text <> ''
+                      AND NOT EXISTS (SELECT 1 FROM source_chunks c WHERE c.source_id = s.id)
+                    ORDER BY s.id
+                    LIMIT :limit
+                """), {"after": last_id, "limit": batch_size}).fetchall()
+                if not rows:
+                    break
+                for source_id, full_text in rows:
+                    chunked += index_source_chunks(db, source_id, full_text, embedder)
+                db.commit()
+                sources += len(rows)
+                last_id = rows[-1][0]
+            
+            if embedder is not None and USE_VECTOR:
+                while True:
+                    rows = db.execute(text("""
+                        SELECT id, content FROM source_chunks
+                        WHERE embedding IS NULL
+                        ORDER BY id
+                        LIMIT :limit
+                    """), {"limit": EMBED_BATCH_SIZE * 4}).fetchall()
+                    if not rows:
+                        break
+                    _embed_chunks(db, embedder, rows)
+                    db.commit()
+    except Exception as e:
+        print(f"⚠️ Source chunking stopped: {e}")
+    if sources:
+        print(f"🧩 Split {sources} sources into {chunked} passages")
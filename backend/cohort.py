@@ -0,0 +1,237 @@
+# backend/cohort.py
+"""
+Cross-submission similarity for a cohort of assignments.
+
+Every pair in the cohort is considered without an O(n²) loop: the stored
+MinHash signatures (plagiarism.py) are banded with NumPy, submissions
+sharing a band become candidate pairs, candidates are scored by estimated
+Jaccard in one vectorized comparison, and pairs above the threshold are
+grouped into clusters by connected components.
+"""
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from plagiarism import MINHASH_PERMUTATIONS, minhash_signature, signature_for_text, signature_from_bytes
+from assignment_content import load_compressed_texts, decompress_text
+from executors import parse_pool, PARSE_WORKERS
+
+# Estimated Jaccard (shared 5-word shingles) from which a pair is reported
+COHORT_SIMILARITY_THRESHOLD = float(os.getenv("COHORT_SIMILARITY_THRESHOLD", "0.5"))
+# Assignments compared per request
+COHORT_MAX_ASSIGNMENTS = int(os.getenv("COHORT_MAX_ASSIGNMENTS", "10000"))
+
+# Pairs returned, most similar first (clusters always cover every pair)
+COHORT_MAX_PAIRS = 500
+# Banding is chosen so a pair exactly at the threshold is a candidate with at
+# least this probability; more similar pairs are found almost surely
+LSH_RECALL_AT_THRESHOLD = 0.8
+# Buckets larger than this (shared boilerplate) are linked to their first
+# member instead of expanded into every pair
+MAX_BUCKET_SIZE = 200
+# Candidate pairs scored per NumPy comparison
+SCORE_CHUNK = 200000
+# Unsigned assignments fingerprinted per parse-pool task
+SIGNATURE_CHUNK = 100
+
+# Signature of a document without words (every slot at its maximum)
+EMPTY_SIGNATURE = minhash_signature(np.empty(0, dtype=np.uint64))
+_BAND_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+def banding(threshold: float, permutations: int = MINHASH_PERMUTATIONS) -> Tuple[int, int]:
+    """(bands, rows per band) with the fewest candidates that still meets LSH_RECALL_AT_THRESHOLD"""
+    best = (permutations, 1)
+    for rows in range(1, permutations + 1):
+        if permutations % rows:
+            continue
+        bands = permutations // rows
+        if 1 - (1 - threshold ** rows) ** bands >= LSH_RECALL_AT_THRESHOLD:
+            best = (bands, rows)
+    return best
+
+def candidate_pairs(signatures: np.ndarray, bands: int, rows: int) -> np.ndarray:
+    """Unique (i, j), i < j, of signature rows that agree on every row of some band"""
+    n = len(signatures)
+    banded = signatures[:, :bands * rows].astype(np.uint64).reshape(n, bands, rows)
+    # One 64-bit key per (document, band); the band number is mixed in so
+    # equal values in different bands do not collide
+    keys = np.broadcast_to(np.arange(bands, dtype=np.uint64), (n, bands)).copy()
+    for r in range(rows):
+        keys = (keys ^ banded[:, :, r]) * _BAND_MULTIPLIER
+    keys = keys.ravel()
+    docs = np.repeat(np.arange(n, dtype=np.int64), bands)
+
+    order = np.argsort(keys, kind="stable")
+    keys, docs = keys[order], docs[order]
+    boundaries = np.flatnonzero(np.diff(keys)) + 1
+    starts = np.concatenate(([0], boundaries))
+    sizes = np.diff(np.concatenate((starts, [len(keys)])))
+
+    pairs = []
+    shared = sizes >= 2
+    for size in np.unique(sizes[shared]):
+        bucket_starts = starts[sizes == size]
+        if size > MAX_BUCKET_SIZE:
+            first = np.repeat(docs[bucket_starts], size - 1)
+            rest = docs[(bucket_starts[:, None] + np.arange(1, size)).ravel()]
+            pairs.append(np.stack((first, rest), axis=1))
+            continue
+        members = docs[bucket_starts[:, None] + np.arange(size)]
+        a, b = np.triu_indices(size, 1)
+        pairs.append(np.stack((members[:, a].ravel(), members[:, b].ravel()), axis=1))
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64)
+    pairs = np.concatenate(pairs)
+    pairs.sort(axis=1)
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    codes = np.unique(pairs[:, 0] * n + pairs[:, 1])
+    return np.stack((codes // n, codes % n), axis=1)
+
+def estimated_similarity(signatures: np.ndarray, pairs: np.ndarray) -> np.ndarray:
+    """Fraction of equal MinHash slots (estimated Jaccard) for each pair"""
+    similarity = np.empty(len(pairs), dtype=np.float32)
+    for offset in range(0, len(pairs), SCORE_CHUNK):
+        chunk = pairs[offset:offset + SCORE_CHUNK]
+        equal = signatures[chunk[:, 0]] == signatures[chunk[:, 1]]
+        similarity[offset:offset + len(chunk)] = equal.mean(axis=1)
+    return similarity
+
+def connected_components(n: int, pairs: np.ndarray) -> np.ndarray:
+    """Component label (its smallest member) per node, by min-label propagation"""
+    labels = np.arange(n, dtype=np.int64)
+    if not len(pairs):
+        return labels
+    a, b = pairs[:, 0], pairs[:, 1]
+    while True:
+        low = np.minimum(labels[a], labels[b])
+        updated = labels.copy()
+        np.minimum.at(updated, a, low)
+        np.minimum.at(updated, b, low)
+        # Pointer jumping: follow labels to their own label
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+def signatures_for_texts(texts: Sequence[str]) -> np.ndarray:
+    """Parse-pool task: MinHash signature matrix for a chunk of texts"""
+    return np.stack([signature_for_text(content) for content in texts]) if texts else \
+        np.empty((0, MINHASH_PERMUTATIONS), dtype=np.uint32)
+
+def _sign_texts(texts: List[str]) -> np.ndarray:
+    """Signatures for texts, fanned out over the parse pool when it has several processes"""
+    if PARSE_WORKERS < 2 or len(texts) <= SIGNATURE_CHUNK:
+        return signatures_for_texts(texts)
+    futures = [
+        parse_pool.submit(signatures_for_texts, texts[offset:offset + SIGNATURE_CHUNK])
+        for offset in range(0, len(texts), SIGNATURE_CHUNK)
+    ]
+    return np.concatenate([future.result() for future in futures])
+
+def load_cohort(db: Session, student_id: int, assignment_ids: Optional[Sequence[int]] = None,
+                batch_id: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Rows for score_cohort: the caller's assignments among assignment_ids
+    and/or a batch upload, with their stored signatures and, for those not
+    signed yet, their compressed text. Only SQL runs here (run_db callback).
+    """
+    ids = list(dict.fromkeys(assignment_ids or []))
+    if batch_id is not None:
+        ids.extend(db.execute(text("""
+            SELECT j.assignment_id FROM analysis_jobs j
+            JOIN upload_batches b ON b.id = j.batch_id
+            WHERE j.batch_id = :batch_id AND b.student_id = :student_id
+        """), {"batch_id": batch_id, "student_id": student_id}).scalars().all())
+        ids = list(dict.fromkeys(ids))
+    if len(ids) > COHORT_MAX_ASSIGNMENTS:
+        raise ValueError(f"At most {COHORT_MAX_ASSIGNMENTS} assignments can be compared at once")
+
+    rows = db.execute(text("""
+        SELECT id, filename, minhash_signature FROM assignments
+        WHERE id = ANY(:ids) AND student_id = :student_id
+        ORDER BY id
+    """), {"ids": ids, "student_id": student_id}).fetchall()
+    # Assignments whose analysis has not run yet have no signature; the
+    # analysis job stores it, so it is not written here
+    unsigned = [r[0] for r in rows if r[2] is None]
+    return {
+        "requested": ids,
+        "ids": [r[0] for r in rows],
+        "filenames": [r[1] or "" for r in rows],
+        "signatures": [r[2] for r in rows],
+        "unsigned_texts": load_compressed_texts(db, unsigned) if unsigned else {}
+    }
+
+def _signature_matrix(cohort: Dict[str, Any]) -> np.ndarray:
+    """Signature matrix for load_cohort rows, signing the unsigned texts"""
+    signatures = np.tile(EMPTY_SIGNATURE, (len(cohort["ids"]), 1))
+    for i, data in enumerate(cohort["signatures"]):
+        # Signatures made with another MINHASH_PERMUTATIONS stay empty
+        if data is not None and len(data) == 4 * MINHASH_PERMUTATIONS:
+            signatures[i] = signature_from_bytes(data)
+    unsigned = [i for i, data in enumerate(cohort["signatures"]) if data is None]
+    if unsigned:
+        texts = cohort["unsigned_texts"]
+        signatures[unsigned] = _sign_texts([
+            decompress_text(*texts[cohort["ids"][i]]) if cohort["ids"][i] in texts else ""
+            for i in unsigned
+        ])
+    return signatures
+
+def score_cohort(cohort: Dict[str, Any], threshold: float = COHORT_SIMILARITY_THRESHOLD) -> Dict[str, Any]:
+    """
+    Similar pairs and clusters among load_cohort() rows (CPU work, for the I/O pool).
+
+    Only the caller's own assignments are compared; ids that are unknown or
+    belong to someone else are returned under "missing".
+    """
+    if not 0 < threshold <= 1:
+        raise ValueError("threshold must be in (0, 1]")
+    found, filenames = cohort["ids"], cohort["filenames"]
+    signatures = _signature_matrix(cohort)
+    missing = sorted(set(cohort["requested"]) - set(found))
+    # Empty documents would all look identical
+    usable = np.flatnonzero((signatures != EMPTY_SIGNATURE).any(axis=1))
+    signatures = signatures[usable]
+
+    bands, rows = banding(threshold)
+    pairs = candidate_pairs(signatures, bands, rows)
+    similarity = estimated_similarity(signatures, pairs)
+    similar = similarity >= threshold
+    pairs, similarity = pairs[similar], similarity[similar]
+
+    labels = connected_components(len(signatures), pairs)
+    clustered = np.unique(labels[pairs.ravel()]) if len(pairs) else np.empty(0, dtype=np.int64)
+    pair_clusters = labels[pairs[:, 0]] if len(pairs) else np.empty(0, dtype=np.int64)
+    clusters = []
+    for label in clustered:
+        members = usable[np.flatnonzero(labels == label)]
+        scores = similarity[pair_clusters == label]
+        clusters.append({
+            "assignment_ids": [found[m] for m in members],
+            "filenames": [filenames[m] for m in members],
+            "size": len(members),
+            "max_similarity": round(float(scores.max()), 4),
+            "mean_similarity": round(float(scores.mean()), 4)
+        })
+    clusters.sort(key=lambda c: (-c["size"], -c["max_similarity"]))
+
+    top = np.argsort(-similarity, kind="stable")[:COHORT_MAX_PAIRS]
+    return {
+        "compared": len(found),
+        "threshold": threshold,
+        "lsh": {"bands": bands, "rows": rows, "candidate_pairs": int(similar.size)},
+        "similar_pairs": int(len(pairs)),
+        "pairs": [
+            {
+                "assignment_ids": [found[usable[pairs[p, 0]]], found[usable[pairs[p, 1]]]],
+                "filenames": [filenames[usable[pairs[p, 0]]], filenames[usable[pairs[p, 1]]]],
+                "similarity": round(float(similarity[p]), 4)
+            }
+            for p in top
+        ],
+        "clusters": clusters,
+        "missing": missing
+    }
@@ -0,0 +1,113 @@
+# backend/database.py
+import os
+from typing import Any, Callable, Union
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker, Session
+from dotenv import load_dotenv
+
+from executors import io_pool
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+if not DATABASE_URL:
+    raise ValueError("DATABASE_URL environment variable is not set")
+
+# Ensure DATABASE_URL uses correct dialect for psycopg2
+if DATABASE_URL.startswith("postgresql+psycopg://"):
+    # Convert to psycopg2 format if using psycopg2-binary
+    DATABASE_URL = DATABASE_URL.replace("postgresql+psycopg://", "postgresql+psycopg2://")
+    print(f"📝 Converted DATABASE_URL to psycopg2 format")
+
+# Connection pool (applies to both the sync and the async engine)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+# Serve request queries through asyncpg instead of psycopg2 on the I/O pool
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() == "true"
+
+POOL_OPTIONS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
+engine = create_engine(DATABASE_URL, **POOL_OPTIONS)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def async_database_url(url: str):
+    """
+    Rewrite a libpq-style URL for asyncpg.
+
+    asyncpg does not understand sslmode, so it is moved into connect_args.
+    """
+    parsed = make_url(url).set(drivername="postgresql+asyncpg")
+    connect_args = {}
+    sslmode = parsed.query.get("sslmode")
+    if sslmode:
+        parsed = parsed.difference_update_query(["sslmode"])
+        if sslmode != "disable":
+            connect_args["ssl"] = sslmode
+    return parsed, connect_args
+
+async_engine = None
+AsyncSessionLocal = None
+
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    _async_url, _connect_args = async_database_url(DATABASE_URL)
+    async_engine = create_async_engine(_async_url, connect_args=_connect_args, **POOL_OPTIONS)
+    # expire_on_commit=False: expired attributes cannot lazy-load outside run_sync
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    print("⚡ Using asyncpg for request queries")
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Session type handed to routes: AsyncSession when DB_ASYNC, else Session
+get_request_db = get_async_db if DB_ASYNC else get_db
+
+async def run_db(db: Union[Session, Any], fn: Callable, *args) -> Any:
+    """
+    Await fn(session, *args) without blocking the event loop.
+
+    Query code is written once against a sync Session: with asyncpg it runs
+    through AsyncSession.run_sync, otherwise on the bounded I/O pool.
+    """
+    if isinstance(db, Session):
+        return await io_pool.run(fn, db, *args)
+    return await db.run_sync(fn, *args)
+
+def _pool_status(pool) -> dict:
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "idle": pool.checkedin()
+    }
+
+def pool_stats() -> dict:
+    stats = {"mode": "async" if DB_ASYNC else "sync", "sync": _pool_status(engine.pool)}
+    if async_engine is not None:
+        stats["async"] = _pool_status(async_engine.pool)
+    return stats
+
+async def dispose_engines():
+    if async_engine is not None:
+        await async_engine.dispose()
+    engine.dispose()
@@ -0,0 +1,263 @@
+# backend/embedding_service.py
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Sequence
+import numpy as np
+from sqlalchemy import text
+
+from embeddings import EMBEDDING_STORAGE_DTYPE, vector_to_bytes, vector_from_bytes
+
+# Cache configuration
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "4096"))
+EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "1000000"))
+
+# Most texts sent to the embedder in one call (OpenAI accepts up to 2048)
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "256"))
+
+# Check the table against EMBEDDING_CACHE_MAX_ROWS after this many writes
+EVICT_EVERY_N_PUTS = 50
+
+# A hit rewrites last_used_at only if it is older than this (seconds), so
+# hot rows are not updated on every lookup
+TOUCH_INTERVAL = 3600
+
+class _Request:
+    """Texts one caller is waiting on"""
+
+    __slots__ = ("texts", "vectors", "error", "done", "lead")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.vectors = None
+        self.error = None
+        self.done = threading.Event()
+        self.lead = False
+
+class EmbeddingService:
+    """
+    Cached, batched front for an embedder (same embed() interface).
+
+    Each text is looked up by the sha256 of embedder, model, dimension,
+    storage format and text: first in an in-process LRU, then in the
+    embedding_cache table, so identical text is embedded once across
+    processes and restarts. Vectors are stored as EMBEDDING_STORAGE_DTYPE
+    bytes and always returned rounded through that format, so a cached and
+    a fresh vector for the same text are identical. The table is trimmed to
+    max_rows by last use.
+
+    Misses from concurrent callers are combined: while one call to the
+    embedder runs, later callers queue, and the next call serves all of
+    them (up to EMBED_MAX_BATCH texts). A single caller is never delayed.
+    """
+
+    def __init__(self, embedder, session_factory=None,
+                 memory_items: int = EMBEDDING_CACHE_MEMORY_ITEMS,
+                 max_rows: int = EMBEDDING_CACHE_MAX_ROWS,
+                 max_batch: int = EMBED_MAX_BATCH,
+                 dtype: str = EMBEDDING_STORAGE_DTYPE):
+        self.embedder = embedder
+        self.name = embedder.name
+        self.dim = embedder.dim
+        self.session_factory = session_factory
+        self.memory_items = memory_items
+        self.max_rows = max_rows
+        self.max_batch = max_batch
+        self.dtype = dtype
+        self._namespace = f"{embedder.name}:{getattr(embedder, 'model', '')}:{embedder.dim}:{dtype}\0"
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue: List[_Request] = []
+        self._computing = False
+        self._puts = 0
+        self._stats = {"memory_hits": 0, "db_hits": 0, "computed": 0, "embed_calls": 0, "largest_batch": 0}
+
+    def cache_key(self, content: str) -> str:
+        return hashlib.sha256((self._namespace + content).encode("utf-8")).hexdigest()
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """float32 matrix with one row per text"""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dim), np.float32)
+        keys = [self.cache_key(t) for t in texts]
+        found = self._memory_get(keys)
+        missing = {k: t for k, t in zip(keys, texts) if k not in found}
+
+        if missing and self.session_factory is not None:
+            stored = self._db_get(list(missing))
+            found.update(stored)
+            self._memory_put(stored)
+            for key in stored:
+                del missing[key]
+
+        if missing:
+            vectors = self._compute(list(missing.values()))
+            fresh = {key: self._round(v) for key, v in zip(missing, vectors)}
+            found.update(fresh)
+            self._memory_put(fresh)
+            if self.session_factory is not None:
+                self._db_put(fresh)
+
+        return np.vstack([found[k] for k in keys]).astype(np.float32)
+
+    def stats(self) -> Dict[str, int]:
+        """Cache and batching counters, for /health"""
+        with self._lock:
+            return dict(self._stats, memory_items=len(self._memory))
+
+    def _round(self, vector: np.ndarray) -> np.ndarray:
+        return vector_from_bytes(vector_to_bytes(vector, self.dtype), self.dtype)
+
+    def _compute(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts, sharing embedder calls with concurrent callers.
+
+        The first caller becomes the leader and runs batches until its own
+        texts are done; it then hands leadership to the oldest waiting
+        caller, whose texts go first in the next batch.
+        """
+        request = _Request(texts)
+        with self._lock:
+            self._queue.append(request)
+            if not self._computing:
+                self._computing = request.lead = True
+        if not request.lead:
+            request.done.wait()
+        if request.lead:
+            self._lead(request)
+        if request.error is not None:
+            raise request.error
+        return request.vectors
+
+    def _lead(self, own: _Request):
+        while own.vectors is None and own.error is None:
+            with self._lock:
+                batch = [self._queue.pop(0)]
+                size = len(batch[0].texts)
+                while self._queue and size + len(self._queue[0].texts) <= self.max_batch:
+                    size += len(self._queue[0].texts)
+                    batch.append(self._queue.pop(0))
+            self._run(batch)
+        with self._lock:
+            if self._queue:
+                successor = self._queue[0]
+                successor.lead = True
+                successor.done.set()
+            else:
+                self._computing = False
+
+    def _run(self, batch: List[_Request]):
+        texts = [t for request in batch for t in request.texts]
+        try:
+            vectors = np.vstack([
+                self.embedder.embed(texts[offset:offset + self.max_batch])
+                for offset in range(0, len(texts), self.max_batch)
+            ])
+        except Exception as e:
+            for request in batch:
+                request.error = e
+                request.done.set()
+            return
+        with self._lock:
+            self._stats["computed"] += len(texts)
+            self._stats["embed_calls"] += 1
+            self._stats["largest_batch"] = max(self._stats["largest_batch"], len(texts))
+        offset = 0
+        for request in batch:
+            request.vectors = vectors[offset:offset + len(request.texts)]
+            offset += len(request.texts)
+            request.done.set()
+
+    def _memory_get(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+            self._stats["memory_hits"] += len(found)
+        return found
+
+    def _memory_put(self, vectors: Dict[str, np.ndarray]):
+        with self._lock:
+            for key, vector in vectors.items():
+                self._memory[key] = vector
+                self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _db_get(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        try:
+            with self.session_factory() as db:
+                rows = db.execute(text("""
+                    WITH hits AS (
+                        SELECT cache_key, vector, last_used_at FROM embedding_cache
+                        WHERE cache_key = ANY(:keys)
+                    ), touched AS (
+                        UPDATE embedding_cache e SET last_used_at = now()
+                        FROM hits
+                        WHERE e.cache_key = hits.cache_key
+                          AND hits.last_used_at < now() - make_interval(secs => :touch)
+                    )
+                    SELECT cache_key, vector FROM hits
+                """), {"keys": keys, "touch": TOUCH_INTERVAL}).fetchall()
+                db.commit()
+        except Exception as e:
+            print(f"⚠️  Embedding cache lookup failed: {e}")
+            return {}
+        with self._lock:
+            self._stats["db_hits"] += len(rows)
+        return {key: vector_from_bytes(bytes(data), self.dtype) for key, data in rows}
+
+    def _db_put(self, vectors: Dict[str, np.ndarray]):
+        try:
+            with self.session_factory() as db:
+                db.execute(text("""
+                    INSERT INTO embedding_cache (cache_key, vector, created_at, last_used_at)
+                    VALUES (:key, :vector, now(), now())
+                    ON CONFLICT (cache_key) DO NOTHING
+                """), [{"key": key, "vector": vector_to_bytes(v, self.dtype)} for key, v in vectors.items()])
+                db.commit()
+                with self._lock:
+                    self._puts += 1
+                    evict = self._puts % EVICT_EVERY_N_PUTS == 0
+                if evict:
+                    self.evict(db)
+        except Exception as e:
+            print(f"⚠️  Embedding cache write failed: {e}")
+
+    def evict(self, db) -> int:
+        """
+        Drop the least recently used rows over max_rows; returns how many.
+
+        The row count comes from the planner's estimate (pg_class.reltuples,
+        or the live-tuple counter if it is higher), so a table under the cap
+        costs one catalog lookup, and a table over it reads only the excess
+        rows through the last_used_at index.
+        """
+        try:
+            estimate = db.execute(text("""
+                SELECT GREATEST(c.reltuples, s.n_live_tup, 0)::bigint
+                FROM pg_class c
+                LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+                WHERE c.oid = 'embedding_cache'::regclass
+            """)).scalar() or 0
+            if estimate <= self.max_rows:
+                return 0
+            deleted = db.execute(text("""
+                DELETE FROM embedding_cache
+                WHERE cache_key IN (
+                    SELECT cache_key FROM embedding_cache
+                    ORDER BY last_used_at
+                    LIMIT :excess
+                )
+            """), {"excess": estimate - self.max_rows}).rowcount
+            db.commit()
+            return deleted
+        except Exception as e:
+            print(f"⚠️  Embedding cache eviction failed: {e}")
+            db.rollback()
+            return 0
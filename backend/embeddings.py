@@ -0,0 +1,279 @@
+# backend/embeddings.py
+import os
+import re
+import json
+import hashlib
+from collections import Counter
+from typing import List, Optional, Sequence
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Vector search needs the pgvector extension (docker-compose runs ankane/pgvector)
+USE_VECTOR = os.getenv("USE_VECTOR", "false").lower() == "true"
+# Without pgvector (Neon, Render), embeddings can be kept in embedding_blob and
+# searched by an in-process NumPy index (vector_index.py); ignored with USE_VECTOR
+MEMORY_VECTOR_INDEX = not USE_VECTOR and os.getenv("MEMORY_VECTOR_INDEX", "false").lower() == "true"
+# Sources are embedded in either case
+EMBED_SOURCES = USE_VECTOR or MEMORY_VECTOR_INDEX
+
+# "local" hashes words into a fixed-size vector (offline, deterministic);
+# "openai" calls the embeddings API
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "local")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "384"))
+
+# hnsw or ivfflat; ef_search trades recall for latency at query time
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "hnsw")
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+
+# Binary format of stored embeddings (embedding cache, embedding_blob): float16 halves the
+# size of float32 and is well within the precision cosine ranking needs
+EMBEDDING_STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "float16")
+if EMBEDDING_STORAGE_DTYPE not in ("float16", "float32"):
+    raise ValueError("EMBEDDING_STORAGE_DTYPE must be float16 or float32")
+
+# Characters of title + abstract sent to the embedder per source
+EMBED_MAX_CHARS = 8000
+
+_WORD = re.compile(r"\w+")
+
+class LocalHashEmbedder:
+    """
+    Feature-hashing embedder: word unigrams and bigrams hashed into dim
+    signed buckets with sublinear term frequency, L2-normalized.
+
+    Captures lexical overlap only, but needs no network or model download,
+    so search can be exercised offline and in tests.
+    """
+
+    name = "local"
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def _embed_one(self, content: str) -> np.ndarray:
+        words = _WORD.findall((content or "").lower())
+        features = Counter(words)
+        features.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if not features:
+            return vector
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "little")
+             for f in features],
+            dtype=np.uint64
+        )
+        weights = 1.0 + np.log(np.array(list(features.values()), dtype=np.float32))
+        signs = np.where(hashes >> np.uint64(63), -1.0, 1.0).astype(np.float32)
+        np.add.at(vector, (hashes % np.uint64(self.dim)).astype(np.int64), signs * weights)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        return np.vstack([self._embed_one(t) for t in texts]) if texts else np.zeros((0, self.dim), np.float32)
+
+class OpenAIEmbedder:
+    """OpenAI embeddings, truncated to dim with the API's dimensions parameter"""
+
+    name = "openai"
+
+    def __init__(self, dim: int = EMBEDDING_DIM, model: str = EMBEDDING_MODEL):
+        from openai import OpenAI
+        self.dim = dim
+        self.model = model
+        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=30.0)
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), np.float32)
+        response = self.client.embeddings.create(
+            model=self.model, input=[t or " " for t in texts], dimensions=self.dim
+        )
+        vectors = np.array([item.embedding for item in response.data], dtype=np.float32)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(
+                f"{self.model} returned {vectors.shape[1]}-dimensional embeddings, not EMBEDDING_DIM={self.dim}"
+            )
+        return vectors
+
+def get_embedder():
+    """Embedder selected by EMBEDDING_BACKEND (falls back to local without an API key)"""
+    if EMBEDDING_BACKEND == "openai":
+        if os.getenv("OPENAI_API_KEY"):
+            return OpenAIEmbedder()
+        print("⚠️ EMBEDDING_BACKEND=openai but OPENAI_API_KEY is not set; using local embeddings")
+    return LocalHashEmbedder()
+
+def to_pgvector(vector: np.ndarray) -> str:
+    """pgvector text literal, e.g. '[0.1,0.2]'"""
+    return "[" + ",".join(f"{x:.6g}" for x in vector.tolist()) + "]"
+
+def vector_to_bytes(vector: np.ndarray, dtype: str = EMBEDDING_STORAGE_DTYPE) -> bytes:
+    """Little-endian float16/float32 bytes of a vector"""
+    return np.asarray(vector, dtype="<f2" if dtype == "float16" else "<f4").tobytes()
+
+def vector_from_bytes(data: bytes, dtype: str = EMBEDDING_STORAGE_DTYPE) -> np.ndarray:
+    """Read-only view of vector_to_bytes output (no copy)"""
+    return np.frombuffer(data, dtype="<f2" if dtype == "float16" else "<f4")
+
+def source_embedding_text(title: Optional[str], abstract: Optional[str]) -> str:
+    """Text that represents a source in vector search"""
+    return f"{title or ''}. {abstract or ''}"[:EMBED_MAX_CHARS]
+
+def vector_schema_statements() -> List[str]:
+    """DDL for the embedding column and its ANN index (applied when USE_VECTOR)"""
+    if VECTOR_INDEX == "ivfflat":
+        index = ("CREATE INDEX IF NOT EXISTS ix_academic_sources_embedding "
+                 "ON academic_sources USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100)")
+    else:
+        index = ("CREATE INDEX IF NOT EXISTS ix_academic_sources_embedding "
+                 "ON academic_sources USING hnsw (embedding vector_cosine_ops)")
+    return [
+        "CREATE EXTENSION IF NOT EXISTS vector",
+        f"ALTER TABLE academic_sources ADD COLUMN IF NOT EXISTS embedding vector({EMBEDDING_DIM})",
+        index,
+    ]
+
+def check_vector_dimensions(engine, dim: int = EMBEDDING_DIM):
+    """
+    Raise if an existing pgvector embedding column was created with another
+    size than EMBEDDING_DIM (ADD COLUMN IF NOT EXISTS leaves it as it is,
+    and every insert or search would then fail)
+    """
+    with engine.connect() as conn:
+        columns = conn.execute(text("""
+            SELECT attrelid::regclass::text, atttypmod FROM pg_attribute
+            WHERE attrelid IN (to_regclass('academic_sources'), to_regclass('source_chunks'))
+              AND attname = 'embedding' AND NOT attisdropped
+              AND format_type(atttypid, NULL) = 'vector'
+        """)).fetchall()
+    wrong = [f"{table}.embedding is vector({size})" for table, size in columns if size != dim]
+    if wrong:
+        raise RuntimeError(
+            f"{', '.join(wrong)} but EMBEDDING_DIM={dim}. Set EMBEDDING_DIM to match, or drop "
+            f"the column (ALTER TABLE ... DROP COLUMN embedding) and restart to re-create and re-embed it"
+        )
+
+def embed_sources(db: Session, embedder, rows: Sequence) -> int:
+    """
+    Embed (id, title, abstract) rows and store their vectors; caller commits.
+
+    Vectors go to the pgvector column with USE_VECTOR, else to embedding_blob.
+    """
+    if not rows:
+        return 0
+    vectors = embedder.embed([source_embedding_text(r[1], r[2]) for r in rows])
+    if USE_VECTOR:
+        db.execute(
+            text("UPDATE academic_sources SET embedding = CAST(CAST(:embedding AS text) AS vector) WHERE id = :id"),
+            [{"id": r[0], "embedding": to_pgvector(v)} for r, v in zip(rows, vectors)]
+        )
+    else:
+        db.execute(
+            text("UPDATE academic_sources SET embedding_blob = :blob WHERE id = :id"),
+            [{"id": r[0], "blob": vector_to_bytes(v)} for r, v in zip(rows, vectors)]
+        )
+    return len(rows)
+
+def _has_json_column(db: Session) -> bool:
+    return db.execute(text("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'academic_sources'
+          AND column_name = 'embedding_data'
+    """)).first() is not None
+
+def migrate_json_embeddings(session_factory, batch_size: int = 1000) -> int:
+    """
+    Convert the legacy JSON embedding_data column to embedding_blob bytes.
+
+    Rows are converted in keyset batches at startup. Values that are not
+    numeric arrays are left for inspection. The column itself is only
+    dropped by an operator, with finalize_migrations.py.
+    """
+    converted = skipped = 0
+    last_id = 0
+    try:
+        with session_factory() as db:
+            if not _has_json_column(db):
+                return 0
+            while True:
+                rows = db.execute(text("""
+                    SELECT id, embedding_data FROM academic_sources
+                    WHERE id > :after AND embedding_data IS NOT NULL
+                    ORDER BY id
+                    LIMIT :limit
+                """), {"after": last_id, "limit": batch_size}).fetchall()
+                if not rows:
+                    break
+                updates = []
+                for source_id, data in rows:
+                    try:
+                        if isinstance(data, str):
+                            data = json.loads(data)
+                        vector = np.asarray(data, dtype=np.float32)
+                    except (TypeError, ValueError):
+                        vector = None
+                    if vector is None or vector.ndim != 1 or not vector.size:
+                        skipped += 1
+                        continue
+                    updates.append({"id": source_id, "blob": vector_to_bytes(vector)})
+                if updates:
+                    db.execute(text("""
+                        UPDATE academic_sources
+                        SET embedding_blob = :blob, embedding_data = NULL
+                        WHERE id = :id
+                    """), updates)
+                db.commit()
+                converted += len(updates)
+                last_id = rows[-1][0]
+        if converted or skipped:
+            print(f"📦 Converted {converted} JSON embeddings to {EMBEDDING_STORAGE_DTYPE} bytes"
+                  + (f"; {skipped} unreadable values kept in embedding_data" if skipped else ""))
+    except Exception as e:
+        print(f"⚠️ JSON embedding migration stopped: {e}")
+    return converted
+
+def drop_json_embedding_column(session_factory) -> bool:
+    """
+    Drop academic_sources.embedding_data once every value has been converted.
+    Returns False, leaving the column, while unconverted values remain.
+    """
+    with session_factory() as db:
+        if not _has_json_column(db):
+            return True
+        remaining = db.execute(text(
+            "SELECT count(*) FROM academic_sources WHERE embedding_data IS NOT NULL"
+        )).scalar()
+        if remaining:
+            print(f"⚠️ {remaining} sources still have JSON embedding_data; column kept")
+            return False
+        db.execute(text("ALTER TABLE academic_sources DROP COLUMN IF EXISTS embedding_data"))
+        db.commit()
+    print("🗑️ Dropped academic_sources.embedding_data")
+    return True
+
+def embed_unindexed_sources(session_factory, embedder=None, batch_size: int = 256):
+    """Backfill embeddings for sources stored before they were embedded"""
+    if not EMBED_SOURCES:
+        return
+    embedder = embedder or get_embedder()
+    column = "embedding" if USE_VECTOR else "embedding_blob"
+    total = 0
+    try:
+        with session_factory() as db:
+            while True:
+                rows = db.execute(text(f"""
+                    SELECT id, title, abstract FROM academic_sources
+                    WHERE {column} IS NULL
+                    ORDER BY id
+                    LIMIT :limit
+                """), {"limit": batch_size}).fetchall()
+                if not rows:
+                    break
+                total += embed_sources(db, embedder, rows)
+                db.commit()
+        if total:
+            print(f"🧭 Embedded {total} academic sources ({embedder.name}, dim {embedder.dim})")
+    except Exception as e:
+        print(f"⚠️ Source embedding backfill failed: {e}")
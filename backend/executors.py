@@ -0,0 +1,189 @@
+# backend/executors.py
+import os
+import time
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import Future, Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# Bounded pools for blocking work so the event loop never runs it directly
+IO_WORKERS = int(os.getenv("IO_WORKERS", "16"))
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(min(os.cpu_count() or 1, 4))))
+
+# Worker processes (parse pool and sandboxed jobs) are forked from a clean
+# server process rather than from this (threaded) one, whose other threads
+# may hold locks a forked child would inherit; spawn where forkserver is
+# unavailable. Scripts that parse documents or sign cohorts need the usual
+# `if __name__ == "__main__":` guard.
+_SANDBOX_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+def _timed_call(submitted_at: float, fn: Callable, *args) -> Any:
+    """Run fn and report how long it waited in the queue (wall clock, works across processes)"""
+    waited = time.time() - submitted_at
+    return waited, fn(*args)
+
+class InstrumentedExecutor:
+    """
+    Thread or process pool that reports queue depth and queue wait time.
+
+    The underlying executor is created lazily so importing this module
+    does not fork processes.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Executor], max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._factory = factory
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @property
+    def executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._factory()
+            return self._executor
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Submit fn(*args); the returned future resolves to fn's result"""
+        outer: Future = Future()
+        with self._lock:
+            self._submitted += 1
+        try:
+            inner = self.executor.submit(_timed_call, time.time(), fn, *args)
+        except Exception:
+            self._record(None)
+            raise
+
+        def relay(done: Future):
+            waited = None
+            try:
+                if done.cancelled():
+                    outer.cancel()
+                    return
+                error = done.exception()
+                if error is not None:
+                    outer.set_exception(error)
+                    return
+                waited, result = done.result()
+                outer.set_result(result)
+            except Exception:
+                pass  # outer was cancelled by the caller
+            finally:
+                self._record(waited)
+
+        inner.add_done_callback(relay)
+        outer.add_done_callback(lambda f: f.cancelled() and inner.cancel())
+        return outer
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Await fn(*args) on this pool"""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def _record(self, waited: Optional[float]):
+        with self._lock:
+            if waited is None:
+                self._failed += 1
+                return
+            self._completed += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_flight = self._submitted - self._completed - self._failed
+            return {
+                "max_workers": self.max_workers,
+                "in_flight": in_flight,
+                "queue_depth": max(in_flight - self.max_workers, 0),
+                "completed": self._completed,
+                "failed": self._failed,
+                "avg_wait_ms": round(1000 * self._total_wait / self._completed, 2) if self._completed else 0.0,
+                "max_wait_ms": round(1000 * self._max_wait, 2)
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+# Blocking I/O: database sessions, file reads, small-document parsing
+io_pool = InstrumentedExecutor(
+    "io", lambda: ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io"), IO_WORKERS
+)
+
+# CPU-bound work on trusted data (e.g. MinHash signing in cohort.py)
+parse_pool = InstrumentedExecutor(
+    "parse", lambda: ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=_SANDBOX_CONTEXT), PARSE_WORKERS
+)
+
+def _sandbox_main(conn, fn: Callable, args: tuple):
+    """Child side of run_isolated: send (ok, result or exception) to the parent"""
+    try:
+        outcome = (True, fn(*args))
+    except Exception as e:
+        outcome = (False, e)
+    try:
+        conn.send(outcome)
+    except Exception as e:  # result or exception could not be pickled
+        conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+    conn.close()
+
+def run_isolated(timeout: float, fn: Callable, *args) -> Any:
+    """
+    Run fn(*args) in a new process and return its result.
+
+    The process is killed once timeout seconds have passed, so a parser stuck
+    inside a single call cannot hold a worker (TimeoutError is raised). A
+    worker that dies (e.g. out of memory) raises RuntimeError.
+    """
+    reader, writer = _SANDBOX_CONTEXT.Pipe(duplex=False)
+    process = _SANDBOX_CONTEXT.Process(target=_sandbox_main, args=(writer, fn, args), daemon=True)
+    process.start()
+    writer.close()
+    try:
+        if not reader.poll(timeout):
+            raise TimeoutError(f"{getattr(fn, '__name__', fn)} did not finish within {timeout:g}s; worker killed")
+        try:
+            ok, value = reader.recv()
+        except EOFError:
+            process.join()
+            raise RuntimeError(f"{getattr(fn, '__name__', fn)} worker exited with code {process.exitcode}")
+    finally:
+        if process.is_alive():
+            process.kill()
+        process.join()
+        reader.close()
+    if not ok:
+        raise value
+    return value
+
+# Untrusted documents: each job in its own process via run_isolated, e.g.
+# sandbox_pool.submit(run_isolated, timeout, fn, *args). The threads only
+# wait on those processes and bound how many run at once.
+sandbox_pool = InstrumentedExecutor(
+    "sandbox", lambda: ThreadPoolExecutor(max_workers=PARSE_WORKERS, thread_name_prefix="sandbox"), PARSE_WORKERS
+)
+
+def preload_in_sandbox(*modules: str):
+    """Import modules once in the fork server so sandboxed jobs start with them loaded"""
+    if _SANDBOX_CONTEXT.get_start_method() == "forkserver":
+        _SANDBOX_CONTEXT.set_forkserver_preload(["__main__", *modules])
+
+def executor_stats() -> Dict[str, Any]:
+    return {"io": io_pool.stats(), "parse": parse_pool.stats(), "sandbox": sandbox_pool.stats()}
+
+def shutdown_executors():
+    """Stop the pools (called on app shutdown)"""
+    io_pool.shutdown()
+    parse_pool.shutdown()
+    sandbox_pool.shutdown()
@@ -0,0 +1,162 @@
+# backend/history.py
+import json
+import base64
+import binascii
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from assignment_content import decompress_text
+
+# Page size for GET /assignments and GET /analyses
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+# Columns left out of list responses unless named in ?include=
+ASSIGNMENT_OPTIONAL_COLUMNS = ("original_text",)
+ANALYSIS_OPTIONAL_COLUMNS = ("suggested_sources", "flagged_sections")
+
+def encode_cursor(*values) -> str:
+    """Opaque cursor holding the sort key of the last row on a page"""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """(uploaded_at, id, ...) from encode_cursor; ValueError if it was not made by it"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError("wrong cursor length")
+        return [datetime.fromisoformat(values[0])] + [int(v) for v in values[1:]]
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+def parse_include(include: Optional[str], allowed: Sequence[str]) -> Tuple[str, ...]:
+    """Optional columns named in a comma-separated ?include="""
+    names = tuple(dict.fromkeys(n.strip() for n in (include or "").split(",") if n.strip()))
+    unknown = [n for n in names if n not in allowed]
+    if unknown:
+        raise ValueError(f"include accepts: {', '.join(allowed)}")
+    return names
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+def list_assignments(db: Session, student_id: int, limit: int = HISTORY_PAGE_SIZE,
+                     cursor: Optional[list] = None, include: Sequence[str] = ()) -> Dict[str, Any]:
+    """
+    A student's assignments, newest first, with their latest analysis job.
+
+    Keyset pagination on (uploaded_at, id) walks ix_assignments_student_uploaded
+    from the cursor, so every page costs the same however deep it is.
+    """
+    with_text = "original_text" in include
+    # Text is only read (and decompressed) when asked for
+    columns = ", c.compression, c.data" if with_text else ""
+    contents = "LEFT JOIN assignment_contents c ON c.content_hash = a.content_hash" if with_text else ""
+    after = "AND (a.uploaded_at, a.id) < (:uploaded_at, :id)" if cursor else ""
+    rows = db.execute(text(f"""
+        SELECT a.id, a.filename, a.topic, a.academic_level, a.word_count, a.uploaded_at,
+               j.id AS job_id, j.status, j.analysis_id{columns}
+        FROM assignments a
+        {contents}
+        LEFT JOIN LATERAL (
+            SELECT id, status, analysis_id FROM analysis_jobs
+            WHERE assignment_id = a.id
+            ORDER BY id DESC
+            LIMIT 1
+        ) j ON true
+        WHERE a.student_id = :student_id {after}
+        ORDER BY a.uploaded_at DESC, a.id DESC
+        LIMIT :limit
+    """), {
+        "student_id": student_id,
+        "uploaded_at": cursor[0] if cursor else None,
+        "id": cursor[1] if cursor else None,
+        "limit": limit + 1
+    }).fetchall()
+
+    assignments = []
+    for r in rows[:limit]:
+        item = {
+            "id": r.id,
+            "filename": r.filename,
+            "topic": r.topic,
+            "academic_level": r.academic_level,
+            "word_count": r.word_count,
+            "uploaded_at": _isoformat(r.uploaded_at),
+            "job_id": str(r.job_id) if r.job_id else None,
+            "status": r.status,
+            "analysis_id": r.analysis_id
+        }
+        if with_text:
+            # (codec, data): decompress_page runs off the run_db callback
+            item["original_text"] = (r.compression, r.data)
+        assignments.append(item)
+    last = rows[limit - 1] if len(rows) > limit else None
+    return {
+        "assignments": assignments,
+        "next_cursor": encode_cursor(last.uploaded_at, last.id) if last else None
+    }
+
+def decompress_page(page: Dict[str, Any]) -> Dict[str, Any]:
+    """Decompress the original_text of a list_assignments page (CPU work, for the I/O pool)"""
+    for item in page["assignments"]:
+        if "original_text" in item:
+            item["original_text"] = decompress_text(*item["original_text"])
+    return page
+
+def list_analyses(db: Session, student_id: int, limit: int = HISTORY_PAGE_SIZE,
+                  cursor: Optional[list] = None, include: Sequence[str] = ()) -> Dict[str, Any]:
+    """
+    Analysis results for a student's assignments, newest assignment first.
+
+    Same keyset as list_assignments plus the result id, since an
+    assignment can be analyzed more than once; results are joined through
+    ix_analysis_results_assignment.
+    """
+    columns = "".join(f", r.{name}" for name in include)
+    # The first condition bounds the index scan; the second skips results of
+    # the cursor's assignment that were already returned
+    after = """
+        AND (a.uploaded_at, a.id) <= (:uploaded_at, :assignment_id)
+        AND ((a.uploaded_at, a.id) < (:uploaded_at, :assignment_id) OR r.id < :id)
+    """ if cursor else ""
+    rows = db.execute(text(f"""
+        SELECT r.id, r.assignment_id, a.filename, a.uploaded_at, r.plagiarism_score,
+               r.confidence_score, r.research_suggestions, r.citation_recommendations,
+               r.analyzed_at{columns}
+        FROM assignments a
+        JOIN analysis_results r ON r.assignment_id = a.id
+        WHERE a.student_id = :student_id {after}
+        ORDER BY a.uploaded_at DESC, a.id DESC, r.id DESC
+        LIMIT :limit
+    """), {
+        "student_id": student_id,
+        "uploaded_at": cursor[0] if cursor else None,
+        "assignment_id": cursor[1] if cursor else None,
+        "id": cursor[2] if cursor else None,
+        "limit": limit + 1
+    }).fetchall()
+
+    analyses = []
+    for r in rows[:limit]:
+        item = {
+            "id": r.id,
+            "assignment_id": r.assignment_id,
+            "filename": r.filename,
+            "uploaded_at": _isoformat(r.uploaded_at),
+            "plagiarism_score": r.plagiarism_score or 0.0,
+            "confidence_score": r.confidence_score or 0.0,
+            "research_suggestions": r.research_suggestions or "",
+            "citation_recommendations": r.citation_recommendations or "",
+            "analyzed_at": _isoformat(r.analyzed_at)
+        }
+        item.update({name: getattr(r, name) or [] for name in include})
+        analyses.append(item)
+    last = rows[limit - 1] if len(rows) > limit else None
+    return {
+        "analyses": analyses,
+        "next_cursor": encode_cursor(last.uploaded_at, last.assignment_id, last.id) if last else None
+    }
@@ -0,0 +1,304 @@
+# backend/job_queue.py
+import asyncio
+import os
+from typing import Optional, Dict, Any, List, Tuple
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import logging
+
+from models import Assignment, AnalysisResult, AnalysisJob
+from rag_service import RAGService
+from result_cache import ResultCache, analysis_digest
+from assignment_content import load_text
+from executors import io_pool
+from plagiarism import PLAGIARISM_ENGINE, DOC_ASSIGNMENT, detect_plagiarism_local, index_document
+
+logger = logging.getLogger(__name__)
+
+# Worker configuration
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2.0"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "600"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Seconds before a failed job is retried; doubled on each further attempt
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "30"))
+
+def enqueue_job(db: Session, assignment_id: int) -> AnalysisJob:
+    """Add a pending analysis job for an assignment (caller commits)"""
+    job = AnalysisJob(assignment_id=assignment_id, status="pending", attempts=0)
+    db.add(job)
+    return job
+
+def claim_job(db: Session) -> Optional[Dict[str, Any]]:
+    """
+    Atomically claim the oldest runnable job.
+
+    Uses SELECT ... FOR UPDATE SKIP LOCKED so concurrent workers (in this or
+    any other backend process) never pick the same row. Jobs left 'running'
+    by a crashed worker become claimable again once their lease expires, and
+    failed jobs waiting to be retried once their run_after has passed.
+    """
+    params = {"lease": JOB_LEASE_SECONDS, "max_attempts": JOB_MAX_ATTEMPTS}
+
+    # Give up on jobs whose lease expired too many times
+    db.execute(text("""
+        UPDATE analysis_jobs
+        SET status = 'failed', error = 'Worker lease expired', finished_at = now()
+        WHERE status = 'running'
+          AND started_at < now() - make_interval(secs => :lease)
+          AND attempts >= :max_attempts
+    """), params)
+
+    row = db.execute(text("""
+        UPDATE analysis_jobs
+        SET status = 'running', started_at = now(), attempts = attempts + 1
+        WHERE id = (
+            SELECT id FROM analysis_jobs
+            WHERE (status = 'pending' AND (run_after IS NULL OR run_after <= now()))
+               OR (status = 'running' AND started_at < now() - make_interval(secs => :lease))
+            ORDER BY created_at, id
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING id, assignment_id, attempts
+    """), params).fetchone()
+    db.commit()
+
+    if not row:
+        return None
+    return {"id": row[0], "assignment_id": row[1], "attempts": row[2]}
+
+def _load_context(db: Session, rag_service: RAGService, job: Dict[str, Any]) -> Tuple[str, int, List[Dict]]:
+    """Load the assignment text and owner and retrieve candidate sources"""
+    assignment = db.query(Assignment).filter(Assignment.id == job["assignment_id"]).first()
+    if not assignment:
+        raise ValueError(f"Assignment {job['assignment_id']} not found")
+
+    text_content = load_text(db, assignment.id)
+    # A batch file is compared with all of the uploader's other assignments
+    student_id = None if assignment.batch_id else assignment.student_id
+    # Every part of the assignment is searched, not just its opening
+    sources = rag_service.search_sources_multi(db, text_content)
+
+    # End the read transaction so no connection sits idle during LLM calls
+    db.commit()
+    return text_content, student_id, sources
+
+def _claimed_by(db: Session, job: Dict[str, Any]):
+    """
+    Query for the job row as long as this claim still holds it: once a lease
+    expires another worker may re-claim the job, which bumps attempts
+    """
+    return db.query(AnalysisJob).filter(
+        AnalysisJob.id == job["id"],
+        AnalysisJob.status == "running",
+        AnalysisJob.attempts == job["attempts"]
+    )
+
+def _store_result(db: Session, job: Dict[str, Any], text_content: str, sources: List[Dict],
+                  analysis: Dict[str, Any], plagiarism: Dict[str, Any]) -> Optional[AnalysisResult]:
+    """
+    Write the AnalysisResult, fingerprint the assignment and complete the job
+    in one transaction. Returns None, writing nothing, if the job was
+    re-claimed by another worker meanwhile.
+    """
+    # Completing the job first locks its row, so no other worker can claim it until commit
+    completed = _claimed_by(db, job).update({
+        "status": "completed",
+        "error": None,
+        "finished_at": text("now()")
+    }, synchronize_session=False)
+    if not completed:
+        db.rollback()
+        print(f"⚠️ Analysis job {job['id']} was re-claimed by another worker; result discarded")
+        return None
+
+    analysis_result = AnalysisResult(
+        assignment_id=job["assignment_id"],
+        suggested_sources=sources,
+        plagiarism_score=plagiarism.get("plagiarism_score", 0.0),
+        flagged_sections=plagiarism.get("flagged_sections", []),
+        research_suggestions=analysis.get("suggestions", "Analysis complete."),
+        citation_recommendations=analysis.get("citation_recommendation", "APA"),
+        confidence_score=0.8 if plagiarism.get("confidence") == "high" else 0.5
+    )
+    db.add(analysis_result)
+    db.flush()
+
+    # Make this submission a plagiarism candidate for later ones
+    index_document(db, DOC_ASSIGNMENT, job["assignment_id"], text_content)
+
+    db.query(AnalysisJob).filter(AnalysisJob.id == job["id"]).update(
+        {"analysis_id": analysis_result.id}, synchronize_session=False
+    )
+    db.commit()
+    return analysis_result
+
+async def run_analysis(db: Session, rag_service: RAGService, result_cache: ResultCache,
+                       job: Dict[str, Any]) -> Optional[AnalysisResult]:
+    """
+    Run RAG analysis for a claimed job and store the result.
+
+    Database work runs on the I/O pool. The analysis LLM call and the plagiarism
+    check (local engine in a thread, or LLM) run concurrently, so the job
+    takes max() of their latencies, not sum().
+    """
+    text_content, student_id, sources = await io_pool.run(_load_context, db, rag_service, job)
+    # The same text retrieved against other (or edited) sources is a new analysis
+    digest = analysis_digest(text_content, sources)
+
+    cached_analysis = await io_pool.run(result_cache.get, db, "analyze_assignment", digest)
+    cached_plagiarism = None
+    if PLAGIARISM_ENGINE == "llm":
+        cached_plagiarism = await io_pool.run(result_cache.get, db, "detect_plagiarism", digest)
+
+    async def analysis_step():
+        if cached_analysis is not None:
+            return cached_analysis
+        return await rag_service.analyze_assignment(text_content, sources)
+
+    async def plagiarism_step():
+        if cached_plagiarism is not None:
+            return cached_plagiarism
+        if PLAGIARISM_ENGINE == "llm":
+            return await rag_service.detect_plagiarism(text_content, sources)
+        # Local results depend on the growing corpus, so they are not cached
+        return await io_pool.run(
+            detect_plagiarism_local, db, text_content, sources, student_id, job["assignment_id"]
+        )
+
+    analysis, plagiarism = await asyncio.gather(analysis_step(), plagiarism_step())
+
+    # Fallback results (no API key, timeout, error) are never cached
+    if cached_analysis is None and not analysis.get("fallback"):
+        await io_pool.run(result_cache.put, db, "analyze_assignment", digest, analysis)
+    if PLAGIARISM_ENGINE == "llm" and cached_plagiarism is None and not plagiarism.get("fallback"):
+        await io_pool.run(result_cache.put, db, "detect_plagiarism", digest, plagiarism)
+
+    return await io_pool.run(_store_result, db, job, text_content, sources, analysis, plagiarism)
+
+def mark_failed(db: Session, job: Dict[str, Any], error: str) -> Optional[bool]:
+    """
+    Record a job failure. Until JOB_MAX_ATTEMPTS the job goes back to
+    'pending' and is retried after JOB_RETRY_DELAY, doubled per attempt;
+    returns True if it will be retried, or None if another worker has
+    re-claimed it (nothing is recorded).
+    """
+    db.rollback()
+    retry = job["attempts"] < JOB_MAX_ATTEMPTS
+    if retry:
+        delay = JOB_RETRY_DELAY * 2 ** (job["attempts"] - 1)
+        update = {
+            "status": "pending",
+            "started_at": None,
+            "run_after": text("now() + make_interval(secs => :delay)").bindparams(delay=delay)
+        }
+    else:
+        update = {"status": "failed", "finished_at": text("now()")}
+    update["error"] = error[:1000]
+    if not _claimed_by(db, job).update(update, synchronize_session=False):
+        db.rollback()
+        return None
+    db.commit()
+    return retry
+
+def release_jobs(db: Session, jobs: List[Dict[str, Any]]):
+    """
+    Return claimed jobs interrupted by shutdown to the queue; the interrupted
+    attempt is not counted. Jobs re-claimed by another worker are left alone.
+    """
+    db.execute(text("""
+        UPDATE analysis_jobs
+        SET status = 'pending', started_at = NULL, attempts = greatest(attempts - 1, 0)
+        WHERE id = :id AND status = 'running' AND attempts = :attempts
+    """), [{"id": job["id"], "attempts": job["attempts"]} for job in jobs])
+    db.commit()
+
+class JobWorkerPool:
+    """Background workers that drain the analysis_jobs table"""
+
+    def __init__(self, session_factory, rag_service: RAGService, result_cache: ResultCache,
+                 num_workers: int = ANALYSIS_WORKERS):
+        self.session_factory = session_factory
+        self.rag_service = rag_service
+        self.result_cache = result_cache
+        self.num_workers = num_workers
+        self._tasks = []
+        # Jobs claimed by this process and not yet completed or failed, by id
+        self._claimed: Dict[int, Dict[str, Any]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._tasks = [
+            asyncio.create_task(self._worker_loop(i)) for i in range(self.num_workers)
+        ]
+        print(f"👷 Started {self.num_workers} analysis workers")
+
+    async def stop(self):
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        # Requeue jobs whose workers were cancelled mid-analysis rather than
+        # leaving them 'running' until their lease expires
+        if self._claimed:
+            db = self.session_factory()
+            try:
+                await io_pool.run(release_jobs, db, list(self._claimed.values()))
+                print(f"↩️ Released {len(self._claimed)} unfinished analysis jobs")
+            except Exception as e:
+                print(f"⚠️ Could not release analysis jobs {sorted(self._claimed)}: {e}")
+            finally:
+                db.close()
+            self._claimed.clear()
+
+    def notify(self):
+        """Wake idle workers after a job has been enqueued"""
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def _worker_loop(self, worker_id: int):
+        while not self._stopping:
+            try:
+                processed = await self._process_next()
+            except Exception as e:
+                print(f"⚠️ Worker {worker_id} error: {e}")
+                processed = False
+
+            if processed:
+                continue
+
+            # Idle: sleep until notified or the poll interval elapses
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _process_next(self) -> bool:
+        """Claim and process a single job; returns False when the queue is empty"""
+        db = self.session_factory()
+        try:
+            job = await io_pool.run(claim_job, db)
+            if not job:
+                return False
+
+            self._claimed[job["id"]] = job
+            try:
+                await run_analysis(db, self.rag_service, self.result_cache, job)
+            except Exception as e:
+                retry = await io_pool.run(mark_failed, db, job, str(e))
+                if retry is None:
+                    outcome = "failed after another worker re-claimed it"
+                else:
+                    outcome = "will be retried" if retry else f"failed after {job['attempts']} attempts"
+                print(f"❌ Analysis job {job['id']} {outcome}: {e}")
+            self._claimed.pop(job["id"], None)
+            return True
+        finally:
+            db.close()
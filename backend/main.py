@@ -1,17 +1,14 @@
 # backend/main.py (updated imports)
 # backend/main.py (fixed imports)
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, status, Body
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, status, Body, Request, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker, Session
-from typing import Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import List, Optional
 import os
 import sys
 from datetime import timedelta
-import uuid
-import PyPDF2
-import docx
-import json
+import asyncio
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
 
@@ -20,33 +17,40 @@ load_dotenv()
 
 # Import modules
 from auth import *
-from models import Base, Student, Assignment, AnalysisResult, AcademicSource
-from rag_service import RAGService
+from models import Base, Student, Assignment, AnalysisResult, AcademicSource, AnalysisJob
+from rag_service import RAGService, SEARCH_MODE, SEARCH_MODES
+from job_queue import JobWorkerPool, enqueue_job
+from history import (
+    HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE, ASSIGNMENT_OPTIONAL_COLUMNS, ANALYSIS_OPTIONAL_COLUMNS,
+    decode_cursor, parse_include, list_assignments, decompress_page, list_analyses
+)
+from result_cache import ResultCache
+from schema import upgrade_schema
+from plagiarism import index_unsigned_documents, index_unfingerprinted_assignments, index_fingerprints, assignment_fingerprints
+from embeddings import embed_unindexed_sources, migrate_json_embeddings
+from assignment_content import prepare_text, store_prepared_text, migrate_assignment_texts
+from batch_upload import extract_batch, prepare_batch, queue_batch, load_batch
+from cohort import COHORT_SIMILARITY_THRESHOLD, load_cohort, score_cohort
+from vector_index import VECTOR_INDEX_SYNC_SECONDS
+from chunking import chunk_unindexed_sources
+from text_extraction import extract_text
+from executors import io_pool, executor_stats, shutdown_executors
+from uploads import MaxUploadSizeMiddleware
+from database import engine, SessionLocal, get_db, get_request_db, run_db, pool_stats, dispose_engines
 
 # Add paths for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-# Database setup
-DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL environment variable is not set")
-
-# Ensure DATABASE_URL uses correct dialect for psycopg2
-if DATABASE_URL.startswith("postgresql+psycopg://"):
-    # Convert to psycopg2 format if using psycopg2-binary
-    DATABASE_URL = DATABASE_URL.replace("postgresql+psycopg://", "postgresql+psycopg2://")
-    print(f"📝 Converted DATABASE_URL to psycopg2 format")
-
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
 # Lifespan manager
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     try:
         Base.metadata.create_all(bind=engine)
+        upgrade_schema(engine)
         print("✅ Database tables created/verified")
+        # Workers read text from assignment_contents, so move it before they start
+        migrate_assignment_texts(SessionLocal)
         
         # Add test data if needed
         with SessionLocal() as db:
@@ -88,10 +92,62 @@ async def lifespan(app: FastAPI):
                     })
                 db.commit()
                 print("✅ Sample data inserted!")
+    except RuntimeError as e:
+        # A schema the API cannot run against (e.g. an embedding column whose size is not EMBEDDING_DIM)
+        print(f"❌ Database setup failed: {e}")
+        raise
     except Exception as e:
         print(f"⚠️ Database setup warning: {e}")
+    
+    # Fingerprint documents stored before plagiarism indexing existed
+    app.state.fingerprint_backfill = asyncio.create_task(backfill_fingerprints())
+    
+    # Shared RAG service (one pooled LLM client per process)
+    app.state.rag_service = RAGService(SessionLocal)
+    app.state.result_cache = ResultCache()
+    
+    # Convert legacy JSON embeddings, embed sources that have no vector yet (no-op
+    # unless USE_VECTOR or MEMORY_VECTOR_INDEX), then keep the in-process index current
+    app.state.embedding_backfill = asyncio.create_task(
+        prepare_source_embeddings(app.state.rag_service)
+    )
+    # Split full_text of new sources into searchable passages
+    app.state.chunk_backfill = asyncio.create_task(
+        io_pool.run(chunk_unindexed_sources, SessionLocal, app.state.rag_service.embedder)
+    )
+    
+    # Start analysis workers
+    app.state.job_pool = JobWorkerPool(SessionLocal, app.state.rag_service, app.state.result_cache)
+    app.state.job_pool.start()
     yield
-    # Shutdown logic would go here
+    # Shutdown
+    app.state.embedding_backfill.cancel()
+    await app.state.job_pool.stop()
+    if app.state.rag_service.vector_index is not None:
+        await io_pool.run(app.state.rag_service.vector_index.save)
+    await app.state.rag_service.aclose()
+    await dispose_engines()
+    shutdown_executors()
+
+async def backfill_fingerprints():
+    await asyncio.to_thread(index_unsigned_documents, SessionLocal)
+    await asyncio.to_thread(index_unfingerprinted_assignments, SessionLocal)
+
+async def prepare_source_embeddings(rag_service: RAGService):
+    await io_pool.run(migrate_json_embeddings, SessionLocal)
+    await io_pool.run(embed_unindexed_sources, SessionLocal, rag_service.embedder)
+    index = rag_service.vector_index
+    if index is None:
+        return
+    full = True
+    while True:
+        # Picks up sources added or removed by other processes (e.g. load_sources.py)
+        try:
+            await io_pool.run(index.sync, SessionLocal, full)
+            full = False
+        except Exception as e:
+            print(f"⚠️ Vector index sync failed: {e}")
+        await asyncio.sleep(VECTOR_INDEX_SYNC_SECONDS)
 
 # ✅ ONLY ONE FastAPI app instance
 app = FastAPI(
@@ -101,64 +157,60 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Reject oversized uploads with 413 while the body is being read
+app.add_middleware(MaxUploadSizeMiddleware)
+
 # Security
 security = HTTPBearer()
 
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def get_rag_service(request: Request) -> RAGService:
+    return request.app.state.rag_service
 
-def get_current_user(
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-):
+    db = Depends(get_request_db)
+) -> Principal:
     try:
         token_data = verify_token(credentials.credentials)
-        user = db.query(Student).filter(Student.email == token_data["email"]).first()
+        # Hot path: a recently verified user needs no database round trip
+        principal = principal_cache.get(token_data["user_id"], token_data["email"])
+        if principal is not None:
+            return principal
+        user = await run_db(db, find_student, token_data["email"])
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
-        return user
+        return principal_cache.put(Principal.from_student(user, token_data["role"]))
     except Exception as e:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-# Helper functions (keep as is)
-def extract_text_from_pdf(file_path: str) -> str:
-    try:
-        with open(file_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-        return text.strip()
-    except Exception as e:
-        print(f"PDF extraction error: {e}")
-        return ""
+# Helper functions (take a sync Session; routes call them through run_db)
+def find_student(db: Session, email: str) -> Optional[Student]:
+    return db.query(Student).filter(Student.email == email).first()
 
-def extract_text_from_docx(file_path: str) -> str:
-    try:
-        doc = docx.Document(file_path)
-        return "\n".join([para.text for para in doc.paragraphs if para.text])
-    except Exception as e:
-        print(f"DOCX extraction error: {e}")
-        return ""
+def prepare_assignment(text: str) -> dict:
+    """CPU work for queue_assignment (I/O pool), kept out of the run_db callback"""
+    return {
+        "content": prepare_text(text),
+        "word_count": len(text.split()),
+        "fingerprints": assignment_fingerprints(text)
+    }
 
-def save_upload_file(file: UploadFile, upload_dir: str = "./uploads") -> str:
-    """Save uploaded file to disk and return path"""
-    os.makedirs(upload_dir, exist_ok=True)
-    file_extension = file.filename.split('.')[-1].lower()
-    file_path = f"{upload_dir}/{uuid.uuid4()}.{file_extension}"
-    
-    with open(file_path, "wb") as buffer:
-        content = file.file.read()
-        buffer.write(content)
-    
-    return file_path
+def queue_assignment(db: Session, student_id: int, filename: str, prepared: dict):
+    """Create the assignment and its pending analysis job in one transaction"""
+    assignment = Assignment(
+        student_id=student_id,
+        filename=filename,
+        content_hash=store_prepared_text(db, prepared["content"]),
+        word_count=prepared["word_count"]
+    )
+    db.add(assignment)
+    db.flush()
+    # Searchable by later submissions right away, before its analysis runs
+    index_fingerprints(db, assignment.id, prepared["fingerprints"])
+    job = enqueue_job(db, assignment.id)
+    db.commit()
+    return assignment.id, job.id, job.status
 
 # Routes (update health endpoint)
 @app.post("/auth/register")
@@ -218,121 +270,221 @@ def login(
 
 @app.post("/upload")
 async def upload_assignment(
+    request: Request,
     file: UploadFile = File(...),
-    current_user: Student = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db = Depends(get_request_db)
 ):
     # Validate file type
     file_extension = file.filename.split('.')[-1].lower()
     if file_extension not in ['pdf', 'docx', 'txt']:
         raise HTTPException(status_code=400, detail="Unsupported file format")
     
-    # Save file
-    upload_dir = os.getenv("UPLOAD_DIR", "./uploads")
-    file_path = save_upload_file(file, upload_dir)
-    
-    # Extract text
+    # Extract text from Starlette's spooled upload; DOCX and TXT are read in
+    # place, PDFs are copied to UPLOAD_DIR in chunks and parsed by path in
+    # sandboxed processes that are killed at PDF_EXTRACT_TIMEOUT. Parsing and
+    # DB writes run on the bounded I/O pool so the event loop keeps serving
+    # other requests.
     try:
-        if file_extension == 'pdf':
-            text = extract_text_from_pdf(file_path)
-        elif file_extension == 'docx':
-            text = extract_text_from_docx(file_path)
-        else:  # txt
-            with open(file_path, 'r', encoding='utf-8') as f:
-                text = f.read()
+        text = await io_pool.run(extract_text, file.file, file_extension)
     except Exception as e:
-        os.remove(file_path)
         raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
     
-    # Create assignment record
-    assignment = Assignment(
-        student_id=current_user.id,
-        filename=file.filename,
-        original_text=text,
-        word_count=len(text.split())
+    prepared = await io_pool.run(prepare_assignment, text)
+    assignment_id, job_id, job_status = await run_db(
+        db, queue_assignment, current_user.id, file.filename, prepared
     )
-    db.add(assignment)
-    db.commit()
-    db.refresh(assignment)
     
-    # Analyze with RAG
-    rag_service = RAGService(db)
-    sources = rag_service.search_sources(text[:500])
-    analysis = rag_service.analyze_assignment(text, sources)
-    plagiarism = rag_service.detect_plagiarism(text, sources)
+    # Wake an idle worker instead of waiting for the next poll
+    request.app.state.job_pool.notify()
     
-    # Create analysis result
-    analysis_result = AnalysisResult(
-        assignment_id=assignment.id,
-        suggested_sources=sources,
-        plagiarism_score=plagiarism.get("plagiarism_score", 0.0),
-        flagged_sections=plagiarism.get("flagged_sections", []),
-        research_suggestions=analysis.get("suggestions", "Analysis complete."),
-        citation_recommendations=analysis.get("citation_recommendation", "APA"),
-        confidence_score=0.8 if plagiarism.get("confidence") == "high" else 0.5
+    return {
+        "job_id": str(job_id),
+        "message": "Assignment uploaded and queued for analysis",
+        "status": job_status,
+        "assignment_id": assignment_id
+    }
+
+@app.post("/upload/batch")
+async def upload_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    current_user: Principal = Depends(get_current_user),
+    db = Depends(get_request_db)
+):
+    """
+    Queue many submissions at once: several files and/or ZIP archives of pdf/docx/txt.
+    
+    Files that cannot be read are listed under "rejected" instead of failing
+    the batch; poll GET /batches/{batch_id} for progress.
+    """
+    # ZIP entries are streamed from the spooled upload and parsed in sandboxed processes
+    documents, rejected = await io_pool.run(
+        extract_batch, [(file.filename or "", file.file) for file in files]
     )
+    if not documents:
+        raise HTTPException(status_code=400, detail={"message": "No readable files in upload", "rejected": rejected})
     
-    db.add(analysis_result)
-    db.commit()
-    db.refresh(analysis_result)
+    prepared = await io_pool.run(prepare_batch, documents)
+    batch = await run_db(db, queue_batch, current_user.id, prepared, rejected)
     
-    # Clean up file
-    try:
-        os.remove(file_path)
-    except:
-        pass
+    # One wake-up for the whole batch; busy workers claim the rest as they finish
+    request.app.state.job_pool.notify()
     
-    return {
-        "job_id": str(analysis_result.id),
-        "message": "Assignment uploaded and analyzed successfully",
-        "status": "completed",
-        "assignment_id": assignment.id
-    }
+    batch["message"] = f"{batch['accepted']} assignments uploaded and queued for analysis"
+    return batch
 
-@app.get("/analysis/{analysis_id}")
-def get_analysis(
-    analysis_id: int,
-    current_user: Student = Depends(get_current_user),
-    db: Session = Depends(get_db)
+@app.get("/batches/{batch_id}")
+async def get_batch(
+    batch_id: int,
+    current_user: Principal = Depends(get_current_user),
+    db = Depends(get_request_db)
 ):
+    """Aggregated progress of a batch upload"""
+    batch = await run_db(db, load_batch, batch_id, current_user.id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
+
+def load_analysis(db: Session, job_id: int, student_id: int) -> Optional[dict]:
+    """Job status plus the stored result once it has completed"""
     # Check assignment belongs to user
-    analysis = db.query(AnalysisResult).filter(
-        AnalysisResult.id == analysis_id
-    ).join(Assignment).filter(Assignment.student_id == current_user.id).first()
+    job = db.query(AnalysisJob).filter(
+        AnalysisJob.id == job_id
+    ).join(Assignment).filter(Assignment.student_id == student_id).first()
     
-    if not analysis:
-        raise HTTPException(status_code=404, detail="Analysis not found")
+    if not job:
+        return None
     
-    return {
-        "id": analysis.id,
-        "assignment_id": analysis.assignment_id,
-        "suggested_sources": analysis.suggested_sources or [],
-        "plagiarism_score": analysis.plagiarism_score or 0.0,
-        "research_suggestions": analysis.research_suggestions or "",
-        "citation_recommendations": analysis.citation_recommendations or "",
-        "confidence_score": analysis.confidence_score or 0.0,
-        "analyzed_at": analysis.analyzed_at.isoformat() if analysis.analyzed_at else ""
+    response = {
+        "job_id": str(job.id),
+        "assignment_id": job.assignment_id,
+        "status": job.status,
+        "created_at": job.created_at.isoformat() if job.created_at else "",
+        "started_at": job.started_at.isoformat() if job.started_at else "",
+        "finished_at": job.finished_at.isoformat() if job.finished_at else ""
     }
+    
+    if job.status == "failed":
+        response["error"] = job.error or "Analysis failed"
+    
+    if job.status == "completed" and job.analysis_id:
+        analysis = db.query(AnalysisResult).filter(AnalysisResult.id == job.analysis_id).first()
+        if analysis:
+            response.update({
+                "id": analysis.id,
+                "suggested_sources": analysis.suggested_sources or [],
+                "plagiarism_score": analysis.plagiarism_score or 0.0,
+                "research_suggestions": analysis.research_suggestions or "",
+                "citation_recommendations": analysis.citation_recommendations or "",
+                "confidence_score": analysis.confidence_score or 0.0,
+                "analyzed_at": analysis.analyzed_at.isoformat() if analysis.analyzed_at else ""
+            })
+    
+    return response
+
+@app.get("/analysis/{job_id}")
+async def get_analysis(
+    job_id: int,
+    current_user: Principal = Depends(get_current_user),
+    db = Depends(get_request_db)
+):
+    response = await run_db(db, load_analysis, job_id, current_user.id)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return response
+
+@app.get("/assignments")
+async def get_assignments(
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    include: Optional[str] = None,
+    current_user: Principal = Depends(get_current_user),
+    db = Depends(get_request_db)
+):
+    """Uploaded assignments, newest first; pass next_cursor back as cursor for the next page"""
+    try:
+        after = decode_cursor(cursor, 2) if cursor else None
+        columns = parse_include(include, ASSIGNMENT_OPTIONAL_COLUMNS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    page = await run_db(db, list_assignments, current_user.id, limit, after, columns)
+    if "original_text" in columns:
+        page = await io_pool.run(decompress_page, page)
+    return page
+
+@app.get("/analyses")
+async def get_analyses(
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    include: Optional[str] = None,
+    current_user: Principal = Depends(get_current_user),
+    db = Depends(get_request_db)
+):
+    """Analysis results, newest assignment first; large JSON columns only with ?include="""
+    try:
+        after = decode_cursor(cursor, 3) if cursor else None
+        columns = parse_include(include, ANALYSIS_OPTIONAL_COLUMNS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await run_db(db, list_analyses, current_user.id, limit, after, columns)
+
+@app.post("/similarity/cohort")
+async def compare_cohort(
+    assignment_ids: Optional[List[int]] = Body(None),
+    batch_id: Optional[int] = Body(None),
+    threshold: float = Body(COHORT_SIMILARITY_THRESHOLD, gt=0, le=1),
+    current_user: Principal = Depends(get_current_user),
+    db = Depends(get_request_db)
+):
+    """Pairs and clusters of similar submissions among assignment_ids and/or a batch upload"""
+    if not assignment_ids and batch_id is None:
+        raise HTTPException(status_code=400, detail="Pass assignment_ids and/or batch_id")
+    try:
+        cohort = await run_db(db, load_cohort, current_user.id, assignment_ids, batch_id)
+        # Decompressing, signing and clustering stay off the run_db callback
+        return await io_pool.run(score_cohort, cohort, threshold)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/sources")
-def search_sources(
+async def search_sources(
     query: str,
     top_k: int = 5,
-    current_user: Student = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    mode: Optional[str] = None,
+    current_user: Principal = Depends(get_current_user),
+    db = Depends(get_request_db),
+    rag_service: RAGService = Depends(get_rag_service)
 ):
-    rag_service = RAGService(db)
-    sources = rag_service.search_sources(query, top_k)
+    mode = mode or SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(SEARCH_MODES)}")
+    if mode in ("vector", "hybrid") and rag_service.embedder is None:
+        raise HTTPException(status_code=400, detail=f"{mode} search requires USE_VECTOR=true or MEMORY_VECTOR_INDEX=true")
+    
+    # Embed the query on the I/O pool; the API backend makes a network call
+    query_embedding = None
+    if mode in ("vector", "hybrid"):
+        query_embedding = await io_pool.run(rag_service.embed_query, query)
+    sources = await run_db(db, rag_service.search_sources, query, top_k, query_embedding, mode)
     
     return {
         "query": query,
+        "mode": mode,
         "sources": sources
     }
 
+def ping_database(db: Session):
+    db.execute(text("SELECT 1"))
+
 @app.get("/health")
-def health_check(db: Session = Depends(get_db)):
+async def health_check(
+    request: Request,
+    db = Depends(get_request_db),
+    rag_service: RAGService = Depends(get_rag_service)
+):
     try:
-        db.execute(text("SELECT 1"))
+        await run_db(db, ping_database)
         db_status = "connected"
     except Exception as e:
         print(f"Database connection error: {e}")
@@ -342,7 +494,14 @@ def health_check(db: Session = Depends(get_db)):
         "status": "healthy",
         "service": "academic-assignment-helper",
         "database": db_status,
+        "database_pool": pool_stats(),
         "openai_configured": bool(os.getenv("OPENAI_API_KEY")),
+        "llm_connections": rag_service.connection_stats(),
+        "result_cache": request.app.state.result_cache.stats(),
+        "embeddings": rag_service.embedder.stats() if rag_service.embedder is not None else None,
+        "vector_index": rag_service.vector_index.stats() if rag_service.vector_index is not None else None,
+        "executors": executor_stats(),
+        "auth_cache": principal_cache.stats(),
         "version": "2.0.0"
     }
 
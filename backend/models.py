@@ -1,10 +1,26 @@
 #backend\models.py
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, JSON, ForeignKey, Index, LargeBinary, BigInteger, SmallInteger, Computed
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 
 Base = declarative_base()
 
+# Weighted full-text document for academic_sources (title A, abstract B, authors C).
+# coalesce keeps a row searchable when one of the fields is NULL.
+SEARCH_VECTOR_EXPRESSION = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(abstract, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(authors, '')), 'C')"
+)
+
+# Duplicate detection key for academic_sources: title lowercased with
+# punctuation collapsed, plus the year. NULL (never a duplicate) without a title.
+DEDUP_KEY_EXPRESSION = (
+    "NULLIF(lower(btrim(regexp_replace(coalesce(title, ''), '[^[:alnum:]]+', ' ', 'g'))), '') "
+    "|| '|' || coalesce(CAST(publication_year AS text), '')"
+)
+
 class Student(Base):
     __tablename__ = "students"
     
@@ -21,11 +37,33 @@ class Assignment(Base):
     id = Column(Integer, primary_key=True, index=True)
     student_id = Column(Integer, ForeignKey("students.id"))
     filename = Column(String)
-    original_text = Column(Text)
+    # Text is stored compressed in assignment_contents (see assignment_content.py)
+    content_hash = Column(String(64), ForeignKey("assignment_contents.content_hash"))
+    # Set for files of a POST /upload/batch: each one is a different author's
+    # work even though they share the uploader's student_id
+    batch_id = Column(Integer, ForeignKey("upload_batches.id"))
     topic = Column(String)
     academic_level = Column(String)
     word_count = Column(Integer)
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # MinHash signature of original_text (see plagiarism.py)
+    minhash_signature = Column(LargeBinary, nullable=True)
+    
+    # History pages are keyset scans of one student's rows (GET /assignments)
+    __table_args__ = (
+        Index("ix_assignments_student_uploaded", "student_id", "uploaded_at", "id"),
+    )
+
+class AssignmentContent(Base):
+    __tablename__ = "assignment_contents"
+    
+    # sha256 of the exact text; identical submissions share one row
+    content_hash = Column(String(64), primary_key=True)
+    compression = Column(String(8), nullable=False)  # zstd, zlib or none
+    data = Column(LargeBinary, nullable=False)
+    original_size = Column(Integer)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class AnalysisResult(Base):
     __tablename__ = "analysis_results"
@@ -39,6 +77,67 @@ class AnalysisResult(Base):
     citation_recommendations = Column(Text)
     confidence_score = Column(Float)
     analyzed_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_analysis_results_assignment", "assignment_id"),
+    )
+
+class UploadBatch(Base):
+    __tablename__ = "upload_batches"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    student_id = Column(Integer, ForeignKey("students.id"), nullable=False)
+    file_count = Column(Integer, nullable=False, default=0)
+    rejected = Column(JSON)  # [{"filename", "error"}] for files that were not queued
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    assignment_id = Column(Integer, ForeignKey("assignments.id"), nullable=False)
+    # Set for jobs queued by POST /upload/batch
+    batch_id = Column(Integer, ForeignKey("upload_batches.id"))
+    status = Column(String, nullable=False, default="pending")  # pending/running/completed/failed
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    analysis_id = Column(Integer, ForeignKey("analysis_results.id"))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    # A failed job waiting to be retried is not claimed before this
+    run_after = Column(DateTime(timezone=True))
+    
+    # Workers poll by (status, created_at) so claiming stays an index scan;
+    # history pages look up an assignment's latest job; batch progress counts by status
+    __table_args__ = (
+        Index("ix_analysis_jobs_status_created", "status", "created_at"),
+        Index("ix_analysis_jobs_assignment", "assignment_id", "id"),
+        Index("ix_analysis_jobs_batch", "batch_id", "status"),
+    )
+
+class CachedResult(Base):
+    __tablename__ = "result_cache"
+    
+    # sha256 of kind + model + prompt version + normalized assignment text
+    cache_key = Column(String(64), primary_key=True)
+    kind = Column(String, nullable=False)
+    model = Column(String)
+    payload = Column(JSON, nullable=False)
+    hit_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_accessed_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+class CachedEmbedding(Base):
+    __tablename__ = "embedding_cache"
+    
+    # sha256 of embedder, model, dimension, storage dtype and text
+    # (see embedding_service.py); vector is float16/float32 bytes
+    cache_key = Column(String(64), primary_key=True)
+    vector = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Refreshed on cache hits; eviction drops the least recently used rows
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
 
 class AcademicSource(Base):
     __tablename__ = "academic_sources"
@@ -51,6 +150,81 @@ class AcademicSource(Base):
     full_text = Column(Text)
     source_type = Column(String)
     
-    # Vector embedding column - will be ignored if not using pgvector
-    # For Neon DB, we'll use text search instead
-    embedding_data = Column(JSON, nullable=True)
\ No newline at end of file
+    # Embedding as EMBEDDING_STORAGE_DTYPE bytes for databases without
+    # pgvector (read with embeddings.vector_from_bytes); replaces the JSON
+    # embedding_data column, which embeddings.migrate_json_embeddings converts
+    embedding_blob = Column(LargeBinary, nullable=True)
+    
+    # With USE_VECTOR, an `embedding vector(EMBEDDING_DIM)` column and its
+    # HNSW index are added by schema.upgrade_schema (see embeddings.py)
+    
+    # MinHash signature of abstract + full_text (see plagiarism.py)
+    minhash_signature = Column(LargeBinary, nullable=True)
+    
+    # Stored so keyword search reads it from the GIN index instead of
+    # recomputing to_tsvector for every row
+    search_vector = Column(TSVECTOR, Computed(SEARCH_VECTOR_EXPRESSION, persisted=True))
+    
+    # Unique, so bulk loads skip sources already stored (see load_sources.py)
+    dedup_key = Column(Text, Computed(DEDUP_KEY_EXPRESSION, persisted=True))
+    
+    __table_args__ = (
+        Index("ix_academic_sources_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_academic_sources_dedup_key", "dedup_key", unique=True),
+    )
+
+class SourceChunk(Base):
+    __tablename__ = "source_chunks"
+    
+    # Overlapping passage of academic_sources.full_text (see chunking.py);
+    # offsets are character positions in full_text
+    id = Column(Integer, primary_key=True)
+    source_id = Column(Integer, ForeignKey("academic_sources.id", ondelete="CASCADE"), nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    start_offset = Column(Integer, nullable=False)
+    end_offset = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+    search_vector = Column(TSVECTOR, Computed("to_tsvector('english', content)", persisted=True))
+    
+    # With USE_VECTOR an `embedding` column and HNSW index are added by upgrade_schema
+    __table_args__ = (
+        Index("ix_source_chunks_source", "source_id", "chunk_index", unique=True),
+        Index("ix_source_chunks_search_vector", "search_vector", postgresql_using="gin"),
+    )
+
+class SourceLoad(Base):
+    __tablename__ = "source_loads"
+    
+    # Progress of a bulk load per input file, committed with each batch so
+    # an interrupted load resumes after the last stored record
+    source = Column(String, primary_key=True)
+    file_size = Column(BigInteger)
+    records_done = Column(BigInteger, nullable=False, default=0)
+    inserted = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class AssignmentFingerprint(Base):
+    __tablename__ = "assignment_fingerprints"
+    
+    # Winnowed shingle hashes (see plagiarism.winnow), written at upload;
+    # lookups hit the primary key on fingerprint. Rows go with their assignment.
+    fingerprint = Column(BigInteger, primary_key=True)
+    assignment_id = Column(Integer, ForeignKey("assignments.id", ondelete="CASCADE"), primary_key=True)
+    
+    __table_args__ = (
+        Index("ix_assignment_fingerprints_assignment", "assignment_id"),
+    )
+
+class LSHBucket(Base):
+    __tablename__ = "lsh_buckets"
+    
+    # One row per (band, document); lookups hit the primary key on band_key.
+    # doc_id points at either table, so deletes are cascaded by the
+    # lsh_buckets_cleanup triggers (schema.py) rather than a foreign key
+    band_key = Column(BigInteger, primary_key=True)
+    doc_type = Column(SmallInteger, primary_key=True)  # 0 = academic source, 1 = assignment
+    doc_id = Column(Integer, primary_key=True)
+    
+    __table_args__ = (
+        Index("ix_lsh_buckets_doc", "doc_type", "doc_id"),
+    )
\ No newline at end of file
@@ -0,0 +1,410 @@
+# backend/plagiarism.py
+import os
+import re
+import hashlib
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import logging
+
+from models import LSHBucket
+from assignment_content import load_texts, decompress_text
+
+logger = logging.getLogger(__name__)
+
+# "local" (shingling + MinHash/LSH, no network) or "llm"
+PLAGIARISM_ENGINE = os.getenv("PLAGIARISM_ENGINE", "local").lower()
+
+SHINGLE_SIZE = int(os.getenv("SHINGLE_SIZE", "5"))               # words per shingle
+MINHASH_PERMUTATIONS = int(os.getenv("MINHASH_PERMUTATIONS", "128"))
+LSH_BANDS = int(os.getenv("LSH_BANDS", "64"))                    # rows per band = permutations / bands
+LSH_MAX_CANDIDATES = int(os.getenv("LSH_MAX_CANDIDATES", "100"))
+PLAGIARISM_MAX_COMPARISONS = int(os.getenv("PLAGIARISM_MAX_COMPARISONS", "10"))
+PLAGIARISM_MIN_RUN = int(os.getenv("PLAGIARISM_MIN_RUN", "3"))   # consecutive shingles to flag
+# Shingles per winnowing window: copied runs of SHINGLE_SIZE + WINNOW_WINDOW - 1
+# words are always found by the fingerprint index
+WINNOW_WINDOW = int(os.getenv("WINNOW_WINDOW", "4"))
+# Fingerprints found in more assignments than this (assignment prompt,
+# template headers) are skipped at lookup; no more than this many rows
+# plus one are read for any fingerprint
+FINGERPRINT_MAX_DOC_FREQ = int(os.getenv("FINGERPRINT_MAX_DOC_FREQ", "100"))
+
+DOC_SOURCE = 0
+DOC_ASSIGNMENT = 1
+
+_TOKEN = re.compile(r"\w+")
+_SHINGLE_PRIME = np.uint64(1099511628211)
+_EMPTY_SLOT = np.uint32(0xFFFFFFFF)
+_HASH_CHUNK = 4096
+
+def _hash64(value: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), "little")
+
+# Permutation parameters are derived from fixed labels so every process
+# (and every ingestion run) produces identical signatures.
+_SEEDS = np.array([_hash64(f"minhash-seed-{i}".encode()) for i in range(MINHASH_PERMUTATIONS)], dtype=np.uint64)
+_MULTIPLIERS = np.array([_hash64(f"minhash-mult-{i}".encode()) | 1 for i in range(MINHASH_PERMUTATIONS)], dtype=np.uint64)
+
+if MINHASH_PERMUTATIONS % LSH_BANDS:
+    raise ValueError("MINHASH_PERMUTATIONS must be divisible by LSH_BANDS")
+
+def source_document_text(abstract: Optional[str], full_text: Optional[str]) -> str:
+    """Text of an academic source that is fingerprinted and compared"""
+    return "\n\n".join(part for part in (abstract, full_text) if part)
+
+def shingle(content: str, k: int = SHINGLE_SIZE) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Split text into k-word shingles.
+
+    Returns (hashes, starts, ends): a uint64 hash per shingle and the
+    character span each shingle covers in the original text.
+    """
+    token_hashes = []
+    token_starts = []
+    token_ends = []
+    seen = {}
+    for match in _TOKEN.finditer(content or ""):
+        word = match.group().lower()
+        h = seen.get(word)
+        if h is None:
+            h = seen[word] = _hash64(word.encode("utf-8"))
+        token_hashes.append(h)
+        token_starts.append(match.start())
+        token_ends.append(match.end())
+
+    n = len(token_hashes)
+    if n == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return np.empty(0, dtype=np.uint64), empty, empty
+
+    tokens = np.array(token_hashes, dtype=np.uint64)
+    starts = np.array(token_starts, dtype=np.int64)
+    ends = np.array(token_ends, dtype=np.int64)
+
+    width = min(k, n)
+    count = n - width + 1
+    # Polynomial rolling combination of token hashes (wraps mod 2**64)
+    hashes = tokens[:count].copy()
+    for j in range(1, width):
+        hashes = hashes * _SHINGLE_PRIME + tokens[j:j + count]
+    return hashes, starts[:count], ends[width - 1:width - 1 + count]
+
+def minhash_signature(shingle_hashes: np.ndarray) -> np.ndarray:
+    """MinHash signature (uint32 per permutation) of a set of shingle hashes"""
+    signature = np.full(MINHASH_PERMUTATIONS, _EMPTY_SLOT, dtype=np.uint32)
+    unique = np.unique(shingle_hashes)
+    for offset in range(0, unique.size, _HASH_CHUNK):
+        chunk = unique[offset:offset + _HASH_CHUNK]
+        # Multiply-shift hashing: one row per permutation, keep the top 32 bits
+        permuted = ((chunk[None, :] ^ _SEEDS[:, None]) * _MULTIPLIERS[:, None]) >> np.uint64(32)
+        signature = np.minimum(signature, permuted.min(axis=1).astype(np.uint32))
+    return signature
+
+def signature_for_text(content: str) -> np.ndarray:
+    hashes, _, _ = shingle(content)
+    return minhash_signature(hashes)
+
+def signature_to_bytes(signature: np.ndarray) -> bytes:
+    return signature.astype("<u4").tobytes()
+
+def signature_from_bytes(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype="<u4")
+
+def band_keys(signature: np.ndarray) -> List[int]:
+    """LSH band keys (signed 64-bit, to fit BIGINT) for a signature"""
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    bands = signature.astype("<u4").reshape(LSH_BANDS, rows)
+    keys = []
+    for b in range(LSH_BANDS):
+        digest = hashlib.blake2b(b.to_bytes(2, "little") + bands[b].tobytes(), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "little", signed=True))
+    return keys
+
+def winnow(shingle_hashes: np.ndarray, window: int = WINNOW_WINDOW) -> np.ndarray:
+    """
+    Winnowing fingerprints: the (rightmost) smallest hash of every window of
+    consecutive shingles, as sorted unique signed 64-bit values for BIGINT.
+
+    Any run of window shingles shared with another document shares at least
+    one fingerprint with it, whatever surrounds the run.
+    """
+    if shingle_hashes.size == 0:
+        return np.empty(0, dtype=np.int64)
+    window = max(1, min(window, shingle_hashes.size))
+    windows = np.lib.stride_tricks.sliding_window_view(shingle_hashes, window)
+    picked = np.arange(len(windows)) + (window - 1 - np.argmin(windows[:, ::-1], axis=1))
+    return np.unique(shingle_hashes[picked].view(np.int64))
+
+def assignment_fingerprints(content: str) -> np.ndarray:
+    hashes, _, _ = shingle(content)
+    return winnow(hashes)
+
+def index_fingerprints(db: Session, assignment_id: int, fingerprints: np.ndarray):
+    """Replace an assignment's rows in the fingerprint index (caller commits)"""
+    db.execute(text("DELETE FROM assignment_fingerprints WHERE assignment_id = :id"), {"id": assignment_id})
+    if fingerprints.size:
+        db.execute(text("""
+            INSERT INTO assignment_fingerprints (fingerprint, assignment_id)
+            SELECT unnest(CAST(:fingerprints AS bigint[])), :id
+        """), {"fingerprints": fingerprints.tolist(), "id": assignment_id})
+
+def index_unfingerprinted_assignments(session_factory, batch_size: int = 500) -> int:
+    """Add assignments stored before the fingerprint index existed"""
+    indexed = 0
+    last_id = 0
+    try:
+        with session_factory() as db:
+            while True:
+                ids = db.execute(text("""
+                    SELECT a.id FROM assignments a
+                    WHERE a.id > :after AND NOT EXISTS (
+                        SELECT 1 FROM assignment_fingerprints f WHERE f.assignment_id = a.id
+                    )
+                    ORDER BY a.id
+                    LIMIT :limit
+                """), {"after": last_id, "limit": batch_size}).scalars().all()
+                if not ids:
+                    break
+                for assignment_id, content in load_texts(db, ids).items():
+                    index_fingerprints(db, assignment_id, assignment_fingerprints(content))
+                db.commit()
+                indexed += len(ids)
+                last_id = ids[-1]
+    except Exception as e:
+        print(f"⚠️ Fingerprint index backfill stopped: {e}")
+    if indexed:
+        print(f"🔏 Added {indexed} assignments to the fingerprint index")
+    return indexed
+
+# Other assignments of the same owner are not plagiarism candidates (a
+# student resubmitting their own work), except files of a batch upload:
+# those share the uploader's student_id but each has its own author
+OWNER_FILTER = "(a.student_id IS DISTINCT FROM :student_id OR a.batch_id IS NOT NULL)"
+
+def find_fingerprint_matches(db: Session, fingerprints: np.ndarray, exclude_student_id: Optional[int],
+                             exclude_assignment_id: Optional[int],
+                             limit: int = LSH_MAX_CANDIDATES) -> Dict[Tuple[int, int], int]:
+    """
+    {(DOC_ASSIGNMENT, id): shared fingerprints} for other authors' assignments.
+
+    One primary-key probe per fingerprint that reads at most
+    FINGERPRINT_MAX_DOC_FREQ + 1 rows; fingerprints with more postings than
+    that are common text and are skipped. The cost grows with the log of the
+    index size, not with how many submissions share boilerplate.
+    """
+    if not fingerprints.size:
+        return {}
+    rows = db.execute(text(f"""
+        SELECT a.id, count(*) AS hits
+        FROM unnest(CAST(:fingerprints AS bigint[])) AS q(fingerprint)
+        CROSS JOIN LATERAL (
+            SELECT array_agg(f.assignment_id) AS ids
+            FROM (
+                SELECT assignment_id FROM assignment_fingerprints
+                WHERE fingerprint = q.fingerprint
+                LIMIT :max_doc_freq + 1
+            ) f
+        ) postings
+        CROSS JOIN LATERAL unnest(postings.ids) AS p(assignment_id)
+        JOIN assignments a ON a.id = p.assignment_id
+        WHERE cardinality(postings.ids) <= :max_doc_freq
+          AND a.id <> :exclude_id
+          AND {OWNER_FILTER}
+        GROUP BY a.id
+        ORDER BY hits DESC, a.id
+        LIMIT :limit
+    """), {"fingerprints": fingerprints.tolist(), "exclude_id": exclude_assignment_id or 0,
+           "student_id": exclude_student_id, "max_doc_freq": FINGERPRINT_MAX_DOC_FREQ,
+           "limit": limit}).fetchall()
+    return {(DOC_ASSIGNMENT, r[0]): r[1] for r in rows}
+
+def index_document(db: Session, doc_type: int, doc_id: int, content: str) -> bytes:
+    """Store a document's signature and LSH buckets (caller commits)"""
+    hashes, _, _ = shingle(content)
+    signature = minhash_signature(hashes)
+    signature_bytes = signature_to_bytes(signature)
+    table = "academic_sources" if doc_type == DOC_SOURCE else "assignments"
+
+    db.execute(text(f"UPDATE {table} SET minhash_signature = :sig WHERE id = :id"),
+               {"sig": signature_bytes, "id": doc_id})
+    db.execute(text("DELETE FROM lsh_buckets WHERE doc_type = :doc_type AND doc_id = :doc_id"),
+               {"doc_type": doc_type, "doc_id": doc_id})
+    # Empty documents share the all-empty signature; keep them out of the index
+    if hashes.size:
+        db.execute(LSHBucket.__table__.insert(), [
+            {"band_key": key, "doc_type": doc_type, "doc_id": doc_id}
+            for key in set(band_keys(signature))
+        ])
+    return signature_bytes
+
+def index_unsigned_documents(session_factory, batch_size: int = 500) -> int:
+    """Fingerprint sources and assignments stored before they were indexed"""
+    indexed = 0
+    queries = [
+        (DOC_SOURCE, "SELECT id, abstract, full_text FROM academic_sources WHERE minhash_signature IS NULL ORDER BY id LIMIT :limit"),
+        (DOC_ASSIGNMENT, "SELECT id, NULL, NULL FROM assignments WHERE minhash_signature IS NULL ORDER BY id LIMIT :limit"),
+    ]
+    try:
+        with session_factory() as db:
+            for doc_type, query in queries:
+                while True:
+                    rows = db.execute(text(query), {"limit": batch_size}).fetchall()
+                    if not rows:
+                        break
+                    texts = load_texts(db, [row[0] for row in rows]) if doc_type == DOC_ASSIGNMENT else {}
+                    for row in rows:
+                        content = source_document_text(row[1], row[2]) if doc_type == DOC_SOURCE else texts.get(row[0], "")
+                        index_document(db, doc_type, row[0], content)
+                    db.commit()
+                    indexed += len(rows)
+    except Exception as e:
+        print(f"⚠️ Fingerprint backfill stopped: {e}")
+    if indexed:
+        print(f"🔏 Fingerprinted {indexed} documents for plagiarism detection")
+    return indexed
+
+def find_candidates(db: Session, signature: np.ndarray, limit: int = LSH_MAX_CANDIDATES) -> List[Tuple[int, int]]:
+    """(doc_type, doc_id) pairs sharing LSH buckets, most shared bands first"""
+    rows = db.execute(text("""
+        SELECT doc_type, doc_id, count(*) AS hits
+        FROM lsh_buckets
+        WHERE band_key = ANY(:keys)
+        GROUP BY doc_type, doc_id
+        ORDER BY hits DESC, doc_type, doc_id
+        LIMIT :limit
+    """), {"keys": band_keys(signature), "limit": limit}).fetchall()
+    return [(r[0], r[1]) for r in rows]
+
+def _matched_spans(query_hashes: np.ndarray, starts: np.ndarray, ends: np.ndarray,
+                   other_hashes: np.ndarray) -> List[Tuple[int, int]]:
+    """Character spans of runs of consecutive query shingles found in the other document"""
+    matched = np.flatnonzero(np.isin(query_hashes, other_hashes))
+    if matched.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(matched) > 1)
+    run_starts = np.concatenate(([matched[0]], matched[breaks + 1]))
+    run_ends = np.concatenate((matched[breaks], [matched[-1]]))
+    return [
+        (int(starts[a]), int(ends[b]))
+        for a, b in zip(run_starts, run_ends)
+        if b - a + 1 >= PLAGIARISM_MIN_RUN
+    ]
+
+def _jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    a = np.unique(a)
+    b = np.unique(b)
+    if a.size == 0 or b.size == 0:
+        return 0.0
+    shared = np.intersect1d(a, b, assume_unique=True).size
+    return shared / (a.size + b.size - shared)
+
+def _load_candidates(db: Session, candidates: List[Tuple[int, int]],
+                     exclude_student_id: Optional[int], exclude_assignment_id: Optional[int]) -> Dict[Tuple[int, int], bytes]:
+    """Fetch stored signatures for candidate documents"""
+    source_ids = [doc_id for doc_type, doc_id in candidates if doc_type == DOC_SOURCE]
+    assignment_ids = [doc_id for doc_type, doc_id in candidates if doc_type == DOC_ASSIGNMENT]
+    signatures = {}
+    if source_ids:
+        for row in db.execute(text("""
+            SELECT id, minhash_signature FROM academic_sources
+            WHERE id = ANY(:ids) AND minhash_signature IS NOT NULL
+        """), {"ids": source_ids}):
+            signatures[(DOC_SOURCE, row[0])] = row[1]
+    if assignment_ids:
+        for row in db.execute(text(f"""
+            SELECT a.id, a.minhash_signature FROM assignments a
+            WHERE a.id = ANY(:ids) AND a.minhash_signature IS NOT NULL
+              AND a.id <> :exclude_id
+              AND {OWNER_FILTER}
+        """), {"ids": assignment_ids, "exclude_id": exclude_assignment_id or 0,
+               "student_id": exclude_student_id}):
+            signatures[(DOC_ASSIGNMENT, row[0])] = row[1]
+    return signatures
+
+def _load_texts(db: Session, keys: List[Tuple[int, int]]) -> Dict[Tuple[int, int], Tuple[str, str]]:
+    """Fetch (label, text) for the documents selected for exact comparison"""
+    texts = {}
+    source_ids = [doc_id for doc_type, doc_id in keys if doc_type == DOC_SOURCE]
+    assignment_ids = [doc_id for doc_type, doc_id in keys if doc_type == DOC_ASSIGNMENT]
+    if source_ids:
+        for row in db.execute(text("""
+            SELECT id, title, abstract, full_text FROM academic_sources WHERE id = ANY(:ids)
+        """), {"ids": source_ids}):
+            texts[(DOC_SOURCE, row[0])] = (row[1] or "", source_document_text(row[2], row[3]))
+    if assignment_ids:
+        for row in db.execute(text("""
+            SELECT a.id, a.filename, c.compression, c.data
+            FROM assignments a
+            LEFT JOIN assignment_contents c ON c.content_hash = a.content_hash
+            WHERE a.id = ANY(:ids)
+        """), {"ids": assignment_ids}):
+            texts[(DOC_ASSIGNMENT, row[0])] = (row[1] or "", decompress_text(row[2], row[3]))
+    return texts
+
+def detect_plagiarism_local(db: Session, content: str, sources: List[Dict],
+                            student_id: Optional[int] = None,
+                            assignment_id: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Deterministic plagiarism check against academic sources and other
+    students' assignments.
+
+    LSH buckets (whole-document similarity) and the fingerprint index
+    (shared passages) narrow the corpus to candidates; the sources already
+    retrieved for the assignment are candidates as well. Candidates are
+    ranked by estimated Jaccard or fingerprint containment alone and the best
+    PLAGIARISM_MAX_COMPARISONS are compared shingle by shingle to produce
+    flagged sections.
+    """
+    hashes, starts, ends = shingle(content)
+    if hashes.size == 0:
+        return {"plagiarism_score": 0.0, "flagged_sections": [], "confidence": "low", "engine": "local"}
+
+    signature = minhash_signature(hashes)
+    candidates = find_candidates(db, signature)
+    for source in sources:
+        if (DOC_SOURCE, source["id"]) not in candidates:
+            candidates.append((DOC_SOURCE, source["id"]))
+
+    signatures = _load_candidates(db, candidates, student_id, assignment_id)
+    scores = {key: float(np.mean(signature_from_bytes(sig) == signature)) for key, sig in signatures.items()}
+    # Submissions sharing passages, including ones not analyzed (signed) yet;
+    # scored by the share of this text's fingerprints they contain
+    fingerprints = winnow(hashes)
+    for key, hits in find_fingerprint_matches(db, fingerprints, student_id, assignment_id).items():
+        scores[key] = max(scores.get(key, 0.0), hits / fingerprints.size)
+    ranked = sorted(scores, key=lambda key: (-scores[key], key))[:PLAGIARISM_MAX_COMPARISONS]
+
+    texts = _load_texts(db, ranked)
+    covered = np.zeros(len(content), dtype=bool)
+    flagged_sections = []
+    for key in ranked:
+        if key not in texts:
+            continue
+        label, other_text = texts[key]
+        other_hashes, _, _ = shingle(other_text)
+        spans = _matched_spans(hashes, starts, ends, other_hashes)
+        if not spans:
+            continue
+        similarity = round(_jaccard(hashes, other_hashes), 4)
+        for start, end in spans:
+            covered[start:end] = True
+            flagged_sections.append({
+                "start": start,
+                "end": end,
+                "text": content[start:end][:500],
+                "source_type": "academic_source" if key[0] == DOC_SOURCE else "assignment",
+                "source_id": key[1],
+                "source": label,
+                "similarity": similarity
+            })
+
+    flagged_sections.sort(key=lambda section: (section["start"], -section["similarity"]))
+    unique_shingles = np.unique(hashes).size
+    confidence = "high" if unique_shingles >= 50 else "medium" if unique_shingles >= 10 else "low"
+    return {
+        "plagiarism_score": round(100.0 * float(covered.sum()) / max(len(content), 1), 2),
+        "flagged_sections": flagged_sections,
+        "confidence": confidence,
+        "engine": "local"
+    }
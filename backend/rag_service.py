@@ -1,31 +1,161 @@
 #backend\rag_service.py
 import os
 import json
-from typing import List, Dict, Any
+import math
+import asyncio
+from collections import defaultdict
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 import logging
 
+from embeddings import USE_VECTOR, MEMORY_VECTOR_INDEX, EMBED_SOURCES, HNSW_EF_SEARCH, get_embedder, to_pgvector
+from chunking import chunk_text
+from embedding_service import EmbeddingService
+from vector_index import VectorIndex
+
 logger = logging.getLogger(__name__)
 
+# Per-call timeout for chat completions (seconds)
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+
+# Bump whenever the analysis/plagiarism prompts change so cached results
+# produced by the old prompts are not reused
+PROMPT_VERSION = "1"
+
+# Shared HTTP connection pool for LLM calls
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+
+# Source search: keyword, vector, hybrid (vector modes need USE_VECTOR or
+# MEMORY_VECTOR_INDEX) or fuzzy (pg_trgm)
+SEARCH_MODES = ("keyword", "vector", "hybrid", "fuzzy")
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid") if EMBED_SOURCES else "keyword"
+# Candidates taken from each ranking before fusion, and the RRF damping constant
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Minimum pg_trgm word similarity for fuzzy matches (lower = more typo tolerant)
+FUZZY_THRESHOLD = float(os.getenv("FUZZY_THRESHOLD", "0.4"))
+
+# Stored weighted tsvector searched by keyword mode (GIN indexed, see models.py)
+SEARCH_DOCUMENT = "search_vector"
+
+# Passages (source_chunks) are searched alongside the source records; each
+# source is scored by its best match. Passages get more candidate slots
+# because one long source can contribute many of them.
+CHUNK_CANDIDATE_FACTOR = 4
+PASSAGE_PREVIEW_CHARS = 300
+
+# Retrieval for a whole assignment: it is split into at most
+# MAX_RETRIEVAL_QUERIES segments of at least SEGMENT_WORDS words, and each
+# segment's keyword query ORs its SEGMENT_QUERY_TERMS most frequent terms
+# that are not common across the corpus (more terms = better recall, but
+# every extra term widens the OR match and slows ranking)
+SEGMENT_WORDS = int(os.getenv("SEGMENT_WORDS", "150"))
+MAX_RETRIEVAL_QUERIES = int(os.getenv("MAX_RETRIEVAL_QUERIES", "8"))
+SEGMENT_QUERY_TERMS = int(os.getenv("SEGMENT_QUERY_TERMS", "8"))
+SEGMENT_CANDIDATES = 20
+COMMON_TERM_FREQUENCY = 0.01
+
+# Candidate CTEs yielding (id, score, chunk_id) per source; chunk_id is NULL
+# when the source record itself matched best
+KEYWORD_CANDIDATES = f"""
+    keyword_hits AS (
+        (SELECT id, ts_rank_cd({SEARCH_DOCUMENT}, query, 32) AS score, NULL::integer AS chunk_id
+         FROM academic_sources, plainto_tsquery('english', :query) AS query
+         WHERE {SEARCH_DOCUMENT} @@ query
+         ORDER BY score DESC
+         LIMIT :candidates)
+        UNION ALL
+        (SELECT c.source_id, ts_rank_cd(c.search_vector, query, 32), c.id
+         FROM source_chunks c, plainto_tsquery('english', :query) AS query
+         WHERE c.search_vector @@ query
+         ORDER BY 2 DESC
+         LIMIT :candidates * {CHUNK_CANDIDATE_FACTOR})
+    ),
+    keyword AS (
+        SELECT DISTINCT ON (id) id, score, chunk_id
+        FROM keyword_hits
+        ORDER BY id, score DESC
+    )"""
+
+VECTOR_CANDIDATES = f"""
+    vector_hits AS (
+        (SELECT id, embedding <=> CAST(CAST(:embedding AS text) AS vector) AS distance, NULL::integer AS chunk_id
+         FROM academic_sources
+         ORDER BY embedding <=> CAST(CAST(:embedding AS text) AS vector)
+         LIMIT :candidates)
+        UNION ALL
+        (SELECT source_id, embedding <=> CAST(CAST(:embedding AS text) AS vector), id
+         FROM source_chunks
+         ORDER BY embedding <=> CAST(CAST(:embedding AS text) AS vector)
+         LIMIT :candidates * {CHUNK_CANDIDATE_FACTOR})
+    ),
+    semantic AS (
+        SELECT DISTINCT ON (id) id, GREATEST(1 - distance, 0) AS score, chunk_id
+        FROM vector_hits
+        WHERE distance IS NOT NULL
+        ORDER BY id, distance
+    )"""
+
+# The same `semantic` CTE from VectorIndex results passed as arrays
+# (MEMORY_VECTOR_INDEX); passages are not in the in-process index
+MEMORY_VECTOR_CANDIDATES = """
+    semantic AS (
+        SELECT id, GREATEST(score, 0) AS score, NULL::integer AS chunk_id
+        FROM unnest(CAST(:vector_ids AS integer[]), CAST(:vector_scores AS double precision[])) AS v(id, score)
+    )"""
+
 class RAGService:
-    def __init__(self, db_session: Session):
-        self.db = db_session
+    """
+    Process-wide RAG service.
+
+    Created once in the app lifespan and shared by routes and workers; the
+    database session is passed to each call instead of held by the service.
+    """
+
+    def __init__(self, session_factory=None):
+        self.http_client = None
+        self.requests_sent = 0
+        self.connections_opened = 0
         self.client = self._init_openai_client()
+        # Cached and batched; session_factory enables the embedding_cache table
+        self.embedder = EmbeddingService(get_embedder(), session_factory) if EMBED_SOURCES else None
+        # Loaded from VECTOR_INDEX_DIR here and kept current by sync() (see main.py); the
+        # embedder's cache key of "" identifies model and dimension, so a new model rebuilds it
+        self.vector_index = None
+        if MEMORY_VECTOR_INDEX:
+            self.vector_index = VectorIndex.open(self.embedder.dim, self.embedder.cache_key(""))
         
     def _init_openai_client(self):
-        """Initialize OpenAI client"""
+        """Initialize async OpenAI client on a pooled keep-alive HTTP client"""
         try:
             # Try new OpenAI SDK (v1.0+)
-            from openai import OpenAI
+            import httpx
+            from openai import AsyncOpenAI
             
             api_key = os.getenv("OPENAI_API_KEY")
             if not api_key:
                 print("⚠️ OPENAI_API_KEY not found")
                 return None
             
-            # Initialize client WITHOUT proxies parameter
-            client = OpenAI(api_key=api_key)
+            self.http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                    keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(LLM_TIMEOUT, connect=10.0),
+                event_hooks={"request": [self._on_request]}
+            )
+            
+            # Initialize client WITHOUT proxies parameter.
+            # OPENAI_BASE_URL is honored by the SDK, so a local stub server
+            # can stand in for the chat-completions endpoint.
+            client = AsyncOpenAI(api_key=api_key, timeout=LLM_TIMEOUT, http_client=self.http_client)
             print("✅ OpenAI client initialized successfully")
             return client
             
@@ -36,53 +166,426 @@ class RAGService:
             print(f"❌ Failed to initialize OpenAI: {e}")
             return None
     
-    def search_sources(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
-        """Search for academic sources using text similarity"""
+    async def _on_request(self, request):
+        """Count requests and attach a trace hook that sees new connections"""
+        self.requests_sent += 1
+        request.extensions["trace"] = self._on_trace
+    
+    async def _on_trace(self, event_name: str, info: Dict[str, Any]):
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+    
+    def connection_stats(self) -> Dict[str, Any]:
+        """Connection reuse counters for /health"""
+        return {
+            "requests": self.requests_sent,
+            "connections_opened": self.connections_opened,
+            "connections_reused": max(self.requests_sent - self.connections_opened, 0),
+            "max_connections": LLM_MAX_CONNECTIONS
+        }
+    
+    async def aclose(self):
+        """Close pooled connections on shutdown"""
+        if self.http_client is not None:
+            await self.http_client.aclose()
+    
+    def embed_query(self, query: str) -> Optional[np.ndarray]:
+        """Query embedding for vector search, or None when sources are not embedded"""
+        if self.embedder is None:
+            return None
+        return self.embedder.embed([query])[0]
+    
+    def search_sources(self, db: Session, query: str, top_k: int = 5,
+                       query_embedding: Optional[np.ndarray] = None,
+                       mode: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Search for academic sources.
+        
+        mode is "keyword" (full-text rank), "vector" (cosine similarity,
+        needs USE_VECTOR or MEMORY_VECTOR_INDEX), "hybrid" (both fused with reciprocal rank
+        fusion) or "fuzzy" (trigram word similarity on title/abstract,
+        tolerates typos and partial titles); it defaults to SEARCH_MODE.
+        similarity_score is always on a 0-1 scale. Pass query_embedding
+        when it was computed off the calling thread.
+        """
+        mode = mode or SEARCH_MODE
         try:
-            # For Neon DB (no vector support), use text search
-            query_sql = text("""
-                SELECT id, title, authors, publication_year, abstract, source_type
-                FROM academic_sources 
-                WHERE to_tsvector('english', title || ' ' || abstract || ' ' || authors) 
-                      @@ plainto_tsquery('english', :query)
-                OR abstract ILIKE :query_like 
-                OR title ILIKE :query_like
-                LIMIT :limit
-            """)
-            
-            results = self.db.execute(
-                query_sql, 
-                {
-                    "query": query,
-                    "query_like": f"%{query}%",
-                    "limit": top_k
-                }
-            ).fetchall()
-            
-            sources = []
-            for r in results:
-                sources.append({
-                    "id": r[0],
-                    "title": r[1],
-                    "authors": r[2],
-                    "year": r[3],
-                    "abstract": r[4][:500] if r[4] else "",
-                    "type": r[5],
-                    "similarity_score": 0.8  # Placeholder for text search
-                })
-            
-            return sources
-            
+            if mode == "fuzzy":
+                return self._fuzzy_search(db, query, top_k)
+            if mode in ("vector", "hybrid") and self.embedder is not None:
+                if query_embedding is None:
+                    query_embedding = self.embed_query(query)
+                if mode == "vector":
+                    return self._vector_search(db, query_embedding, top_k)
+                return self._hybrid_search(db, query, query_embedding, top_k)
+        except Exception as e:
+            print(f"⚠️  {mode.capitalize()} search failed, using keyword search: {e}")
+            db.rollback()
+        
+        try:
+            return self._keyword_search(db, query, top_k)
         except Exception as e:
             print(f"⚠️  Source search failed: {e}")
+            db.rollback()
             # Fallback to simple search
-            return self._fallback_search(query, top_k)
+            return self._fallback_search(db, query, top_k)
+    
+    @staticmethod
+    def _source_row(r, score: float, **scores) -> Dict[str, Any]:
+        """
+        Response dict for an (id, title, authors, year, abstract, type, score,
+        passage start, passage end, passage text, ...) row.
+        """
+        source = {
+            "id": r[0],
+            "title": r[1],
+            "authors": r[2],
+            "year": r[3],
+            "abstract": r[4][:500] if r[4] else "",
+            "type": r[5],
+            "similarity_score": round(float(score), 4)
+        }
+        if len(r) > 9 and r[7] is not None:
+            # Best match was a passage of full_text rather than the title/abstract
+            source["passage"] = {"start": r[7], "end": r[8], "text": r[9][:PASSAGE_PREVIEW_CHARS]}
+        source.update({k: round(float(v), 4) if v is not None else None for k, v in scores.items()})
+        return source
+    
+    def _keyword_search(self, db: Session, query: str, top_k: int) -> List[Dict[str, Any]]:
+        """Full-text matches on sources and their passages, ordered by ts_rank_cd (0-1)"""
+        candidates = max(HYBRID_CANDIDATES, top_k)
+        results = db.execute(text(f"""
+            WITH {KEYWORD_CANDIDATES}
+            SELECT s.id, s.title, s.authors, s.publication_year, s.abstract, s.source_type,
+                   k.score, c.start_offset, c.end_offset, c.content
+            FROM keyword k
+            JOIN academic_sources s ON s.id = k.id
+            LEFT JOIN source_chunks c ON c.id = k.chunk_id
+            ORDER BY k.score DESC, s.id
+            LIMIT :limit
+        """), {"query": query, "candidates": candidates, "limit": top_k}).fetchall()
+        
+        if not results:
+            # Nothing matched as words (e.g. a title fragment): try a substring
+            # match, served by the pg_trgm indexes when the extension is installed
+            results = db.execute(text("""
+                SELECT id, title, authors, publication_year, abstract, source_type, 0.0
+                FROM academic_sources
+                WHERE title ILIKE :query_like OR abstract ILIKE :query_like
+                LIMIT :limit
+            """), {"query_like": f"%{query}%", "limit": top_k}).fetchall()
+        
+        return [self._source_row(r, r[6]) for r in results]
+    
+    def _fuzzy_search(self, db: Session, query: str, top_k: int) -> List[Dict[str, Any]]:
+        """
+        Sources whose title or abstract contains a close match for the query.
+        
+        `query <% column` is true when some run of words in the column has
+        trigram word similarity above the threshold; the gin_trgm_ops
+        indexes serve it, so partial or misspelled titles avoid a full scan.
+        """
+        db.execute(text("SELECT set_config('pg_trgm.word_similarity_threshold', :threshold, true)"),
+                   {"threshold": str(FUZZY_THRESHOLD)})
+        results = db.execute(text("""
+            SELECT id, title, authors, publication_year, abstract, source_type,
+                   GREATEST(word_similarity(:query, coalesce(title, '')),
+                            word_similarity(:query, coalesce(abstract, ''))) AS similarity
+            FROM academic_sources
+            WHERE :query <% title OR :query <% abstract
+            ORDER BY similarity DESC, id
+            LIMIT :limit
+        """), {"query": query, "limit": top_k}).fetchall()
+        
+        return [self._source_row(r, r[6]) for r in results]
+    
+    def _set_ef_search(self, db: Session, candidates: int):
+        """Larger ef_search = better recall from the HNSW graph (transaction-local)"""
+        db.execute(text("SELECT set_config('hnsw.ef_search', :ef, true)"),
+                   {"ef": str(max(HNSW_EF_SEARCH, candidates))})
+    
+    def _vector_candidates(self, db: Session, query_embedding: np.ndarray,
+                           candidates: int) -> Tuple[str, Dict[str, Any]]:
+        """The `semantic` CTE and its parameters: pgvector, or the in-process index"""
+        if self.vector_index is None:
+            self._set_ef_search(db, candidates * CHUNK_CANDIDATE_FACTOR)
+            return VECTOR_CANDIDATES, {"embedding": to_pgvector(query_embedding)}
+        hits = self.vector_index.search(query_embedding, candidates)
+        return MEMORY_VECTOR_CANDIDATES, {
+            "vector_ids": [source_id for source_id, _ in hits],
+            "vector_scores": [score for _, score in hits]
+        }
+    
+    def _vector_search(self, db: Session, query_embedding: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        """Nearest sources or passages by cosine distance, scored 1 - distance (clamped at 0)"""
+        candidates = max(HYBRID_CANDIDATES, top_k)
+        vector_candidates, vector_params = self._vector_candidates(db, query_embedding, candidates)
+        results = db.execute(text(f"""
+            WITH {vector_candidates}
+            SELECT s.id, s.title, s.authors, s.publication_year, s.abstract, s.source_type,
+                   v.score, c.start_offset, c.end_offset, c.content
+            FROM semantic v
+            JOIN academic_sources s ON s.id = v.id
+            LEFT JOIN source_chunks c ON c.id = v.chunk_id
+            ORDER BY v.score DESC, s.id
+            LIMIT :limit
+        """), {
+            **vector_params,
+            "candidates": candidates,
+            "limit": top_k
+        }).fetchall()
+        
+        return [self._source_row(r, r[6]) for r in results]
     
-    def _fallback_search(self, query: str, top_k: int) -> List[Dict[str, Any]]:
+    def _hybrid_search(self, db: Session, query: str, query_embedding: np.ndarray,
+                       top_k: int) -> List[Dict[str, Any]]:
+        """
+        Reciprocal rank fusion of the keyword and vector rankings.
+        
+        Both candidate lists come from their own indexes (GIN / HNSW, or
+        the in-process VectorIndex) in a single statement; each source scores sum(1 / (RRF_K + rank)). The
+        fused score is divided by its maximum, 2 / (RRF_K + 1), so 1.0 means
+        ranked first by both and scores are comparable across queries.
+        """
+        candidates = max(HYBRID_CANDIDATES, top_k)
+        vector_candidates, vector_params = self._vector_candidates(db, query_embedding, candidates)
+        results = db.execute(text(f"""
+            WITH {KEYWORD_CANDIDATES},
+            {vector_candidates},
+            fused AS (
+                SELECT COALESCE(k.id, v.id) AS id,
+                       COALESCE(1.0 / (:rrf_k + k.position), 0)
+                     + COALESCE(1.0 / (:rrf_k + v.position), 0) AS rrf,
+                       k.score AS keyword_score,
+                       v.score AS vector_score,
+                       COALESCE(k.chunk_id, v.chunk_id) AS chunk_id
+                FROM (SELECT *, row_number() OVER (ORDER BY score DESC, id) AS position FROM keyword) k
+                FULL OUTER JOIN
+                     (SELECT *, row_number() OVER (ORDER BY score DESC, id) AS position FROM semantic) v
+                  ON v.id = k.id
+            )
+            SELECT s.id, s.title, s.authors, s.publication_year, s.abstract, s.source_type,
+                   f.rrf * (:rrf_k + 1) / 2.0 AS score, c.start_offset, c.end_offset, c.content,
+                   f.keyword_score, f.vector_score
+            FROM fused f
+            JOIN academic_sources s ON s.id = f.id
+            LEFT JOIN source_chunks c ON c.id = f.chunk_id
+            ORDER BY f.rrf DESC, s.id
+            LIMIT :limit
+        """), {
+            **vector_params,
+            "query": query,
+            "candidates": candidates,
+            "rrf_k": RRF_K,
+            "limit": top_k
+        }).fetchall()
+        
+        return [self._source_row(r, r[6], keyword_score=r[10], vector_score=r[11]) for r in results]
+    
+    @staticmethod
+    def split_segments(content: str) -> List[Tuple[int, int, str]]:
+        """
+        Cover the whole text with at most MAX_RETRIEVAL_QUERIES segments.
+    
+        Segments grow past SEGMENT_WORDS when the text is long, so the
+        number of queries stays bounded and nothing is left unsearched.
+        """
+        words = len((content or "").split())
+        if not words:
+            return []
+        size = max(SEGMENT_WORDS, math.ceil(words / MAX_RETRIEVAL_QUERIES))
+        return chunk_text(content, size=size, overlap=0)
+    
+    def search_sources_multi(self, db: Session, content: str, top_k: int = 5,
+                             mode: Optional[str] = None,
+                             segment_embeddings: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        Search for sources relevant to any part of a long text.
+    
+        The text is split into segments and every segment is searched in a
+        single statement (unnest ... WITH ORDINALITY + LATERAL). A segment's
+        keyword query ORs its most frequent lexemes, since requiring all of
+        its words would match nothing. Rankings are fused across segments
+        (and across keyword/vector in hybrid mode) with reciprocal rank
+        fusion, so sources that several parts of the text point to rank
+        first. Each result lists matched_segments with character offsets
+        into content. Fuzzy mode is not used here; it falls back to keyword.
+        """
+        mode = mode or SEARCH_MODE
+        if mode not in ("vector", "hybrid") or self.embedder is None:
+            mode = "keyword"
+        segments = self.split_segments(content)
+        if not segments:
+            return []
+    
+        try:
+            if mode != "keyword" and segment_embeddings is None:
+                segment_embeddings = self.embedder.embed([seg[2] for seg in segments])
+            hits = self._segment_hits(db, segments, segment_embeddings if mode != "keyword" else None, mode)
+            return self._fuse_segment_hits(db, hits, segments, mode, top_k)
+        except Exception as e:
+            print(f"⚠️  Multi-query search failed, searching the first segment only: {e}")
+            db.rollback()
+            return self.search_sources(db, segments[0][2][:500], top_k, mode="keyword")
+    
+    def _segment_hits(self, db: Session, segments: List[Tuple[int, int, str]],
+                      embeddings: Optional[np.ndarray], mode: str) -> List[Tuple]:
+        """(segment, source_id, score, chunk_id, position) for every segment and ranking, one round trip"""
+        hits = []
+        if embeddings is not None and self.vector_index is not None:
+            # One matrix product for all segments; only keyword rankings go to SQL
+            for segment, matches in enumerate(self.vector_index.search_many(embeddings, SEGMENT_CANDIDATES), 1):
+                hits.extend((segment, source_id, max(score, 0.0), None, position)
+                            for position, (source_id, score) in enumerate(matches, 1))
+            embeddings = None
+            if mode == "vector":
+                return hits
+        params = {
+            "segments": [seg[2] for seg in segments],
+            "terms": SEGMENT_QUERY_TERMS,
+            "candidates": SEGMENT_CANDIDATES,
+            "common_frequency": COMMON_TERM_FREQUENCY,
+        }
+        rankings = []
+        if mode in ("keyword", "hybrid"):
+            rankings.append(f"""
+                SELECT g.segment, hit.id, hit.score, hit.chunk_id,
+                       row_number() OVER (PARTITION BY g.segment ORDER BY hit.score DESC, hit.id) AS position
+                FROM segments g
+                CROSS JOIN LATERAL (
+                    SELECT DISTINCT ON (id) id, score, chunk_id
+                    FROM ((SELECT id, ts_rank_cd({SEARCH_DOCUMENT}, g.query, 32) AS score, NULL::integer AS chunk_id
+                           FROM academic_sources
+                           WHERE {SEARCH_DOCUMENT} @@ g.query
+                           ORDER BY score DESC
+                           LIMIT :candidates)
+                          UNION ALL
+                          (SELECT source_id, ts_rank_cd(search_vector, g.query, 32), id
+                           FROM source_chunks
+                           WHERE search_vector @@ g.query
+                           ORDER BY 2 DESC
+                           LIMIT :candidates * {CHUNK_CANDIDATE_FACTOR})) keyword_hits
+                    ORDER BY id, score DESC
+                ) hit
+                WHERE g.query IS NOT NULL""")
+        if embeddings is not None:
+            params["embeddings"] = [to_pgvector(v) for v in embeddings]
+            self._set_ef_search(db, SEGMENT_CANDIDATES * CHUNK_CANDIDATE_FACTOR)
+            rankings.append(f"""
+                SELECT g.segment, hit.id, hit.score, hit.chunk_id,
+                       row_number() OVER (PARTITION BY g.segment ORDER BY hit.score DESC, hit.id) AS position
+                FROM segments g
+                CROSS JOIN LATERAL (
+                    SELECT DISTINCT ON (id) id, GREATEST(1 - distance, 0) AS score, chunk_id
+                    FROM ((SELECT id, embedding <=> g.embedding AS distance, NULL::integer AS chunk_id
+                           FROM academic_sources
+                           ORDER BY embedding <=> g.embedding
+                           LIMIT :candidates)
+                          UNION ALL
+                          (SELECT source_id, embedding <=> g.embedding, id
+                           FROM source_chunks
+                           ORDER BY embedding <=> g.embedding
+                           LIMIT :candidates * {CHUNK_CANDIDATE_FACTOR})) vector_hits
+                    WHERE distance IS NOT NULL
+                    ORDER BY id, distance
+                ) hit""")
+    
+        if embeddings is not None:
+            inputs = "unnest(CAST(:segments AS text[]), CAST(:embeddings AS text[])) WITH ORDINALITY AS s(content, embedding, segment)"
+            embedding = "CAST(s.embedding AS vector)"
+        else:
+            inputs = "unnest(CAST(:segments AS text[])) WITH ORDINALITY AS s(content, segment)"
+            embedding = "NULL::vector" if USE_VECTOR else "NULL"
+        # Lexemes that ANALYZE found in more than COMMON_TERM_FREQUENCY of the
+        # sources are left out of the keyword query (they match most of the
+        # table and say little); quotes and backslashes are skipped, not escaped
+        return hits + db.execute(text(f"""
+            WITH common AS MATERIALIZED (
+                SELECT e.lexeme
+                FROM pg_stats st,
+                     unnest(CAST(CAST(st.most_common_elems AS text) AS text[]), st.most_common_elem_freqs)
+                         AS e(lexeme, frequency)
+                WHERE st.schemaname = current_schema() AND st.tablename = 'academic_sources'
+                  AND st.attname = '{SEARCH_DOCUMENT}' AND e.frequency > :common_frequency
+            ),
+            segments AS MATERIALIZED (
+                SELECT s.segment, {embedding} AS embedding,
+                       (SELECT CAST(string_agg(quote_literal(t.lexeme), ' | ') AS tsquery)
+                        FROM (SELECT l.lexeme FROM unnest(to_tsvector('english', s.content)) l
+                              WHERE strpos(l.lexeme, chr(39)) = 0 AND strpos(l.lexeme, chr(92)) = 0
+                                AND NOT EXISTS (SELECT 1 FROM common c WHERE c.lexeme = l.lexeme)
+                              ORDER BY array_length(l.positions, 1) DESC NULLS LAST, l.lexeme
+                              LIMIT :terms) t) AS query
+                FROM {inputs}
+            )
+            {" UNION ALL ".join(rankings)}
+        """), params).fetchall()
+    
+    def _fuse_segment_hits(self, db: Session, hits: List[Tuple], segments: List[Tuple[int, int, str]],
+                           mode: str, top_k: int) -> List[Dict[str, Any]]:
+        """
+        Rank sources by sum(1 / (RRF_K + position)) over segments and rankings.
+    
+        similarity_score is the best single segment's score: the raw score
+        in keyword/vector mode, the normalized RRF score (as in
+        _hybrid_search) in hybrid mode.
+        """
+        fused = defaultdict(float)
+        per_segment = defaultdict(lambda: {"rrf": 0.0, "score": -1.0, "chunk_id": None})
+        for segment, source_id, score, chunk_id, position in hits:
+            contribution = 1.0 / (RRF_K + position)
+            fused[source_id] += contribution
+            match = per_segment[(source_id, segment)]
+            match["rrf"] += contribution
+            if score > match["score"]:
+                match["score"], match["chunk_id"] = float(score), chunk_id
+    
+        ranked = sorted(fused, key=lambda source_id: (-fused[source_id], source_id))[:top_k]
+        if not ranked:
+            return []
+    
+        provenance = {source_id: [] for source_id in ranked}
+        for (source_id, segment), match in per_segment.items():
+            if source_id not in provenance:
+                continue
+            start, end, _ = segments[segment - 1]
+            score = match["rrf"] * (RRF_K + 1) / 2.0 if mode == "hybrid" else match["score"]
+            provenance[source_id].append(
+                {"segment": segment, "start": start, "end": end, "score": score, "chunk_id": match["chunk_id"]}
+            )
+        for matches in provenance.values():
+            matches.sort(key=lambda m: (-m["score"], m["segment"]))
+    
+        rows = db.execute(text("""
+            SELECT s.id, s.title, s.authors, s.publication_year, s.abstract, s.source_type,
+                   0.0, c.start_offset, c.end_offset, c.content
+            FROM unnest(CAST(:ids AS integer[]), CAST(:chunk_ids AS integer[])) AS r(id, chunk_id)
+            JOIN academic_sources s ON s.id = r.id
+            LEFT JOIN source_chunks c ON c.id = r.chunk_id
+        """), {
+            "ids": ranked,
+            "chunk_ids": [provenance[source_id][0]["chunk_id"] for source_id in ranked]
+        }).fetchall()
+        by_id = {r[0]: r for r in rows}
+    
+        results = []
+        for source_id in ranked:
+            if source_id not in by_id:
+                continue
+            matches = provenance[source_id]
+            source = self._source_row(by_id[source_id], matches[0]["score"])
+            source["matched_segments"] = [
+                {"segment": m["segment"], "start": m["start"], "end": m["end"], "score": round(m["score"], 4)}
+                for m in matches
+            ]
+            results.append(source)
+        return results
+    
+    def _fallback_search(self, db: Session, query: str, top_k: int) -> List[Dict[str, Any]]:
         """Fallback search when text search fails"""
         try:
             from models import AcademicSource
-            sources = self.db.query(AcademicSource).limit(top_k).all()
+            sources = db.query(AcademicSource).limit(top_k).all()
             return [
                 {
                     "id": s.id,
@@ -98,7 +601,23 @@ class RAGService:
         except:
             return []
     
-    def analyze_assignment(self, text: str, sources: List[Dict]) -> Dict[str, Any]:
+    async def _chat_json(self, system_prompt: str, prompt: str, temperature: float) -> Dict[str, Any]:
+        """Run a JSON chat completion, cancelling it after LLM_TIMEOUT seconds"""
+        response = await asyncio.wait_for(
+            self.client.chat.completions.create(
+                model=LLM_MODEL,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=temperature,
+                response_format={ "type": "json_object" }
+            ),
+            timeout=LLM_TIMEOUT
+        )
+        return json.loads(response.choices[0].message.content)
+    
+    async def analyze_assignment(self, text: str, sources: List[Dict]) -> Dict[str, Any]:
         """Analyze assignment text with AI"""
         if not self.client:
             return self._mock_analysis()
@@ -124,30 +643,19 @@ class RAGService:
             suggestions, citation_recommendation.
             """
             
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are an academic research assistant."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-                response_format={ "type": "json_object" }
-            )
-            
-            return json.loads(response.choices[0].message.content)
+            return await self._chat_json("You are an academic research assistant.", prompt, 0.3)
             
+        except asyncio.TimeoutError:
+            print(f"⚠️  OpenAI analysis timed out after {LLM_TIMEOUT}s")
+            return self._mock_analysis()
         except Exception as e:
             print(f"⚠️  OpenAI analysis failed: {e}")
             return self._mock_analysis()
     
-    def detect_plagiarism(self, text: str, sources: List[Dict]) -> Dict[str, Any]:
+    async def detect_plagiarism(self, text: str, sources: List[Dict]) -> Dict[str, Any]:
         """Check for potential plagiarism"""
         if not self.client:
-            return {
-                "plagiarism_score": 0.0,
-                "flagged_sections": [],
-                "confidence": "low"
-            }
+            return self._default_plagiarism()
         
         try:
             prompt = f"""
@@ -161,25 +669,23 @@ class RAGService:
             Sources: {json.dumps(sources[:3], indent=2)}
             """
             
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a plagiarism detection system."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                response_format={ "type": "json_object" }
-            )
-            
-            return json.loads(response.choices[0].message.content)
+            return await self._chat_json("You are a plagiarism detection system.", prompt, 0.1)
             
+        except asyncio.TimeoutError:
+            print(f"⚠️  Plagiarism detection timed out after {LLM_TIMEOUT}s")
+            return self._default_plagiarism()
         except Exception as e:
             print(f"⚠️  Plagiarism detection failed: {e}")
-            return {
-                "plagiarism_score": 0.0,
-                "flagged_sections": [],
-                "confidence": "low"
-            }
+            return self._default_plagiarism()
+    
+    def _default_plagiarism(self) -> Dict[str, Any]:
+        """Return an empty plagiarism report when OpenAI is not available"""
+        return {
+            "plagiarism_score": 0.0,
+            "flagged_sections": [],
+            "confidence": "low",
+            "fallback": True
+        }
     
     def _mock_analysis(self) -> Dict[str, Any]:
         """Return mock analysis when OpenAI is not available"""
@@ -189,5 +695,6 @@ class RAGService:
             "research_questions": ["How can AI improve student outcomes?"],
             "academic_level": "Undergraduate",
             "suggestions": "Add more specific examples and references.",
-            "citation_recommendation": "APA"
+            "citation_recommendation": "APA",
+            "fallback": True
         }
\ No newline at end of file
@@ -26,7 +26,9 @@ def setup_render_database():
             
             # Import models
             from models import Base
+            from schema import upgrade_schema
             Base.metadata.create_all(bind=engine)
+            upgrade_schema(engine)
             print("✅ Tables created/verified!")
             
             # Check for existing data
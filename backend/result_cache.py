@@ -0,0 +1,176 @@
+# backend/result_cache.py
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict, defaultdict
+from typing import Optional, Dict, Any, List
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import logging
+
+from rag_service import LLM_MODEL, PROMPT_VERSION
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 3600)))
+RESULT_CACHE_MAX_ROWS = int(os.getenv("RESULT_CACHE_MAX_ROWS", "50000"))
+RESULT_CACHE_MEMORY_ITEMS = int(os.getenv("RESULT_CACHE_MEMORY_ITEMS", "1024"))
+
+# Run LRU eviction on the table after this many writes
+EVICT_EVERY_N_PUTS = 200
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_text(content: str) -> str:
+    """Normalize text so trivially different copies hash the same"""
+    content = unicodedata.normalize("NFKC", content or "")
+    return _WHITESPACE.sub(" ", content).strip()
+
+def content_hash(content: str) -> str:
+    """sha256 of the normalized text"""
+    return hashlib.sha256(normalize_text(content).encode("utf-8")).hexdigest()
+
+def analysis_digest(content: str, sources: List[Dict[str, Any]]) -> str:
+    """
+    content_hash of the text plus the retrieved sources it is analysed
+    against: their ids and every field the prompts include, so a result is
+    not reused once retrieval returns other sources or a source is edited.
+    """
+    retrieved = json.dumps(sources, sort_keys=True, default=str)
+    return hashlib.sha256(f"{content_hash(content)}:{retrieved}".encode("utf-8")).hexdigest()
+
+def cache_key(kind: str, digest: str) -> str:
+    """Key on result kind, model and prompt version as well as content"""
+    return hashlib.sha256(f"{kind}:{LLM_MODEL}:{PROMPT_VERSION}:{digest}".encode("utf-8")).hexdigest()
+
+class ResultCache:
+    """
+    Two-tier cache for LLM results keyed by normalized assignment text and
+    the sources it was analysed against (analysis_digest).
+
+    An in-process LRU answers repeats without a round trip; the result_cache
+    table shares results across processes and restarts. Both tiers honor
+    RESULT_CACHE_TTL, and the table is trimmed to RESULT_CACHE_MAX_ROWS by
+    last access time.
+    """
+
+    def __init__(self, memory_items: int = RESULT_CACHE_MEMORY_ITEMS,
+                 ttl: int = RESULT_CACHE_TTL, max_rows: int = RESULT_CACHE_MAX_ROWS):
+        self.memory_items = memory_items
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._stats = defaultdict(lambda: {"memory_hits": 0, "db_hits": 0, "misses": 0})
+
+    def get(self, db: Session, kind: str, digest: str) -> Optional[Dict[str, Any]]:
+        """Return a cached payload for (kind, digest) or None"""
+        key = cache_key(kind, digest)
+
+        payload = self._memory_get(key)
+        if payload is not None:
+            self._count(kind, "memory_hits")
+            return payload
+
+        try:
+            row = db.execute(text("""
+                UPDATE result_cache
+                SET last_accessed_at = now(), hit_count = hit_count + 1
+                WHERE cache_key = :key
+                  AND created_at > now() - make_interval(secs => :ttl)
+                RETURNING payload
+            """), {"key": key, "ttl": self.ttl}).fetchone()
+            db.commit()
+        except Exception as e:
+            print(f"⚠️  Result cache lookup failed: {e}")
+            db.rollback()
+            row = None
+
+        if row is None:
+            self._count(kind, "misses")
+            return None
+
+        self._count(kind, "db_hits")
+        self._memory_put(key, row[0])
+        return row[0]
+
+    def put(self, db: Session, kind: str, digest: str, payload: Dict[str, Any]):
+        """Store a payload in both tiers"""
+        key = cache_key(kind, digest)
+        self._memory_put(key, payload)
+
+        try:
+            db.execute(text("""
+                INSERT INTO result_cache (cache_key, kind, model, payload, hit_count, created_at, last_accessed_at)
+                VALUES (:key, :kind, :model, CAST(:payload AS json), 0, now(), now())
+                ON CONFLICT (cache_key) DO UPDATE
+                SET payload = EXCLUDED.payload, created_at = now(), last_accessed_at = now()
+            """), {"key": key, "kind": kind, "model": LLM_MODEL, "payload": json.dumps(payload)})
+            db.commit()
+        except Exception as e:
+            print(f"⚠️  Result cache write failed: {e}")
+            db.rollback()
+            return
+
+        with self._lock:
+            self._puts += 1
+            evict = self._puts % EVICT_EVERY_N_PUTS == 0
+        if evict:
+            self.evict(db)
+
+    def evict(self, db: Session):
+        """Drop expired rows, then the least recently used rows over max_rows"""
+        try:
+            db.execute(text("""
+                DELETE FROM result_cache
+                WHERE created_at < now() - make_interval(secs => :ttl)
+            """), {"ttl": self.ttl})
+            db.execute(text("""
+                DELETE FROM result_cache
+                WHERE cache_key IN (
+                    SELECT cache_key FROM result_cache
+                    ORDER BY last_accessed_at DESC
+                    OFFSET :max_rows
+                )
+            """), {"max_rows": self.max_rows})
+            db.commit()
+        except Exception as e:
+            print(f"⚠️  Result cache eviction failed: {e}")
+            db.rollback()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters per cached call, for /health"""
+        with self._lock:
+            return {
+                "memory_items": len(self._memory),
+                "endpoints": {kind: dict(counts) for kind, counts in self._stats.items()}
+            }
+
+    def _memory_get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            stored_at, payload = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return payload
+
+    def _memory_put(self, key: str, payload: Dict[str, Any]):
+        with self._lock:
+            self._memory[key] = (time.monotonic(), payload)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _count(self, kind: str, field: str):
+        with self._lock:
+            self._stats[kind][field] += 1
@@ -0,0 +1,152 @@
+# backend/schema.py
+from sqlalchemy import text
+
+from embeddings import USE_VECTOR, vector_schema_statements, check_vector_dimensions
+from chunking import vector_chunk_statements
+from models import SEARCH_VECTOR_EXPRESSION, DEDUP_KEY_EXPRESSION
+
+# lsh_buckets.doc_id references academic_sources (doc_type 0) or assignments
+# (doc_type 1), which a foreign key cannot express; statement-level triggers
+# delete the buckets of removed rows instead
+LSH_CLEANUP_FUNCTION = """
+    CREATE OR REPLACE FUNCTION lsh_buckets_cleanup() RETURNS trigger AS $$
+    BEGIN
+        DELETE FROM lsh_buckets b USING removed r
+        WHERE b.doc_type = TG_ARGV[0]::smallint AND b.doc_id = r.id;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql
+"""
+LSH_CLEANUP_TRIGGERS = """
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'academic_sources_lsh_cleanup') THEN
+            CREATE TRIGGER academic_sources_lsh_cleanup AFTER DELETE ON academic_sources
+            REFERENCING OLD TABLE AS removed FOR EACH STATEMENT EXECUTE FUNCTION lsh_buckets_cleanup('0');
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'assignments_lsh_cleanup') THEN
+            CREATE TRIGGER assignments_lsh_cleanup AFTER DELETE ON assignments
+            REFERENCING OLD TABLE AS removed FOR EACH STATEMENT EXECUTE FUNCTION lsh_buckets_cleanup('1');
+        END IF;
+    END $$
+"""
+
+# Idempotent DDL for databases created before a column/index existed.
+# Base.metadata.create_all only creates missing tables, so columns added to
+# existing tables are listed here and applied on every startup.
+UPGRADE_STATEMENTS = [
+    "ALTER TABLE academic_sources ADD COLUMN IF NOT EXISTS minhash_signature BYTEA",
+    "ALTER TABLE assignments ADD COLUMN IF NOT EXISTS minhash_signature BYTEA",
+    # Text moves to assignment_contents (finalize_migrations.py drops original_text)
+    "ALTER TABLE assignments ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64) "
+    "REFERENCES assignment_contents (content_hash)",
+    # Already compressed; keep TOAST from trying again
+    "ALTER TABLE assignment_contents ALTER COLUMN data SET STORAGE EXTERNAL",
+    # Binary embeddings; JSON embedding_data is converted by migrate_json_embeddings
+    # and dropped by finalize_migrations.py
+    "ALTER TABLE academic_sources ADD COLUMN IF NOT EXISTS embedding_blob BYTEA",
+    # Stored weighted tsvector replaces the per-row to_tsvector expression index
+    f"ALTER TABLE academic_sources ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    f"GENERATED ALWAYS AS ({SEARCH_VECTOR_EXPRESSION}) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_academic_sources_search_vector ON academic_sources USING gin (search_vector)",
+    "DROP INDEX IF EXISTS idx_academic_sources_search",
+    # Keyset-paginated history (GET /assignments, GET /analyses); the composite
+    # index also serves the lookups the single-column student index did
+    "CREATE INDEX IF NOT EXISTS ix_assignments_student_uploaded ON assignments (student_id, uploaded_at, id)",
+    "DROP INDEX IF EXISTS idx_assignments_student_id",
+    "CREATE INDEX IF NOT EXISTS ix_analysis_results_assignment ON analysis_results (assignment_id)",
+    "CREATE INDEX IF NOT EXISTS ix_analysis_jobs_assignment ON analysis_jobs (assignment_id, id)",
+    "ALTER TABLE analysis_jobs ADD COLUMN IF NOT EXISTS batch_id INTEGER REFERENCES upload_batches (id)",
+    "CREATE INDEX IF NOT EXISTS ix_analysis_jobs_batch ON analysis_jobs (batch_id, status)",
+    # Retry backoff for failed analysis jobs
+    "ALTER TABLE analysis_jobs ADD COLUMN IF NOT EXISTS run_after TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE assignments ADD COLUMN IF NOT EXISTS batch_id INTEGER REFERENCES upload_batches (id)",
+    # Embedding cache eviction is by last use rather than age
+    "ALTER TABLE embedding_cache ADD COLUMN IF NOT EXISTS last_used_at TIMESTAMP WITH TIME ZONE DEFAULT now()",
+    "CREATE INDEX IF NOT EXISTS ix_embedding_cache_last_used_at ON embedding_cache (last_used_at)",
+    "DROP INDEX IF EXISTS ix_embedding_cache_created_at",
+    # Batch items stored before assignments.batch_id existed
+    "UPDATE assignments a SET batch_id = j.batch_id FROM analysis_jobs j "
+    "WHERE j.assignment_id = a.id AND j.batch_id IS NOT NULL AND a.batch_id IS NULL",
+    # Fingerprint rows are deleted with their assignment
+    """
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'assignment_fingerprints_assignment_id_fkey') THEN
+            DELETE FROM assignment_fingerprints f
+            WHERE NOT EXISTS (SELECT 1 FROM assignments a WHERE a.id = f.assignment_id);
+            ALTER TABLE assignment_fingerprints ADD CONSTRAINT assignment_fingerprints_assignment_id_fkey
+                FOREIGN KEY (assignment_id) REFERENCES assignments (id) ON DELETE CASCADE;
+        END IF;
+    END $$
+    """,
+    # LSH buckets are deleted with the source or assignment they belong to
+    LSH_CLEANUP_FUNCTION,
+    LSH_CLEANUP_TRIGGERS,
+    # Bulk-load deduplication (load_sources.py inserts with ON CONFLICT (dedup_key)).
+    # Older databases may already hold duplicates, so the unique index is
+    # built by finalize_migrations.py, not here
+    f"ALTER TABLE academic_sources ADD COLUMN IF NOT EXISTS dedup_key text "
+    f"GENERATED ALWAYS AS ({DEDUP_KEY_EXPRESSION}) STORED",
+    # Trigram indexes for fuzzy search and ILIKE '%...%' (skipped if pg_trgm is unavailable)
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_academic_sources_title_trgm ON academic_sources USING gin (title gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_academic_sources_abstract_trgm ON academic_sources USING gin (abstract gin_trgm_ops)",
+]
+
+def upgrade_schema(engine):
+    """
+    Apply UPGRADE_STATEMENTS (plus pgvector DDL when USE_VECTOR); each runs in
+    its own transaction. Raises RuntimeError if the result cannot be used.
+    """
+    vector_statements = vector_schema_statements() + vector_chunk_statements() if USE_VECTOR else []
+    statements = UPGRADE_STATEMENTS + vector_statements
+    for statement in statements:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(statement))
+        except Exception as e:
+            print(f"⚠️ Schema upgrade skipped ({statement[:60]}...): {e}")
+    if not dedup_index_exists(engine):
+        print("⚠️ academic_sources has no unique index on dedup_key; bulk loads are refused "
+              "until an operator runs finalize_migrations.py --only dedup_key")
+    if USE_VECTOR:
+        check_vector_dimensions(engine)
+
+def dedup_index_exists(engine) -> bool:
+    """True if ix_academic_sources_dedup_key exists and is usable by ON CONFLICT (dedup_key)"""
+    with engine.connect() as conn:
+        return bool(conn.execute(text("""
+            SELECT indisunique AND indisvalid FROM pg_index
+            WHERE indexrelid = to_regclass('ix_academic_sources_dedup_key')
+        """)).scalar())
+
+def build_dedup_index(engine) -> int:
+    """
+    Operator step (finalize_migrations.py): build the unique dedup_key index
+    on a database whose sources predate it. Of each group of sources with
+    the same dedup_key (normalized title and year; a missing year counts as
+    one value) the lowest id is kept and the others are moved, unchanged, to
+    academic_sources_duplicates. Their passages and LSH buckets are derived
+    and are deleted with them. Returns the number of rows moved.
+    """
+    if dedup_index_exists(engine):
+        return 0
+    with engine.begin() as conn:
+        # Writes wait until the index exists, so no new duplicate slips in
+        conn.execute(text("LOCK TABLE academic_sources IN SHARE ROW EXCLUSIVE MODE"))
+        conn.execute(text("DROP INDEX IF EXISTS ix_academic_sources_dedup_key"))
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS academic_sources_duplicates AS
+            SELECT * FROM academic_sources WITH NO DATA
+        """))
+        moved = conn.execute(text("""
+            WITH removed AS (
+                DELETE FROM academic_sources s USING academic_sources k
+                WHERE s.dedup_key = k.dedup_key AND s.id > k.id
+                RETURNING s.*
+            )
+            INSERT INTO academic_sources_duplicates SELECT * FROM removed
+        """)).rowcount
+        conn.execute(text("CREATE UNIQUE INDEX ix_academic_sources_dedup_key ON academic_sources (dedup_key)"))
+    if moved:
+        print(f"🗂️ Moved {moved} duplicate sources to academic_sources_duplicates")
+    print("✅ Built ix_academic_sources_dedup_key")
+    return moved
@@ -5,8 +5,8 @@ from sqlalchemy.exc import SQLAlchemyError
 from dotenv import load_dotenv
 import sys
 
-# Add the parent directory to path for imports
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Add the backend directory to path; its modules import each other by bare name
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 load_dotenv()
 
@@ -26,10 +26,12 @@ def setup_database():
             print("✅ Connected to database successfully!")
             
             # Import here to avoid circular imports
-            from backend.models import Base
+            from models import Base
+            from schema import upgrade_schema
             
             # Create all tables
             Base.metadata.create_all(bind=engine)
+            upgrade_schema(engine)
             print("✅ Tables created/verified successfully!")
             
             # Check if we have sample data
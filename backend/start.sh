@@ -27,10 +27,12 @@ sys.path.insert(0, '/app')
 
 from sqlalchemy import create_engine, text
 from models import Base
+from schema import upgrade_schema
 
 try:
     engine = create_engine(os.getenv('DATABASE_URL'))
     Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
     print('✅ Database tables verified')
     
     # Test connection
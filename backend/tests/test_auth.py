@@ -0,0 +1,80 @@
+# backend/tests/test_auth.py
+import uuid
+
+import pytest
+
+import auth
+from auth import Principal, PrincipalCache, principal_cache
+from models import Student
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(auth.time, "monotonic", clock)
+    return clock
+
+def _principal(user_id: int, email: str = None) -> Principal:
+    return Principal(user_id, email or f"{user_id}@test.invalid", "Name", None)
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = PrincipalCache(ttl=60, max_items=10)
+    cache.put(_principal(1))
+    clock.now += 60
+    assert cache.get(1, "1@test.invalid").id == 1
+    clock.now += 0.5
+    assert cache.get(1, "1@test.invalid") is None
+    # Expired entries are dropped, not kept around
+    assert cache.stats() == {"items": 0, "hits": 1, "misses": 1}
+
+def test_least_recently_used_is_evicted(clock):
+    cache = PrincipalCache(ttl=60, max_items=2)
+    cache.put(_principal(1))
+    cache.put(_principal(2))
+    # Reading 1 makes 2 the least recently used
+    assert cache.get(1, "1@test.invalid") is not None
+    cache.put(_principal(3))
+    assert cache.get(2, "2@test.invalid") is None
+    assert cache.get(1, "1@test.invalid") is not None
+    assert cache.get(3, "3@test.invalid") is not None
+    assert cache.stats()["items"] == 2
+
+def test_a_token_for_another_email_misses(clock):
+    cache = PrincipalCache(ttl=60, max_items=10)
+    cache.put(_principal(1, "old@test.invalid"))
+    # The email in the token no longer matches (e.g. the id was reused)
+    assert cache.get(1, "new@test.invalid") is None
+    assert cache.get(1, "old@test.invalid") is None
+    assert cache.get(None, "old@test.invalid") is None
+
+@pytest.fixture
+def orm_student(db):
+    student = Student(email=f"{uuid.uuid4().hex}@test.invalid", password_hash="x", full_name="Before")
+    db.add(student)
+    db.commit()
+    yield student
+    db.rollback()
+    if db.get(Student, student.id) is not None:
+        db.delete(student)
+        db.commit()
+    principal_cache.invalidate(student.id)
+
+def test_orm_update_invalidates(db, orm_student):
+    principal_cache.put(Principal.from_student(orm_student))
+    assert principal_cache.get(orm_student.id, orm_student.email) is not None
+    orm_student.password_hash = "changed"
+    db.commit()
+    assert principal_cache.get(orm_student.id, orm_student.email) is None
+
+def test_orm_delete_invalidates(db, orm_student):
+    principal_cache.put(Principal.from_student(orm_student))
+    student_id, email = orm_student.id, orm_student.email
+    db.delete(orm_student)
+    db.commit()
+    assert principal_cache.get(student_id, email) is None
@@ -0,0 +1,110 @@
+# backend/tests/test_batch_upload.py
+import io
+import zipfile
+
+import pytest
+
+import batch_upload
+from batch_upload import iter_documents, extract_batch
+
+def _zip(entries):
+    """ZIP of {name: bytes}, as the spooled upload would hold it"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in entries.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+def _encrypt_flag(buffer: io.BytesIO) -> io.BytesIO:
+    """Mark every entry as encrypted (general purpose flag bit 0), as zip -e would"""
+    data = bytearray(buffer.getvalue())
+    for signature, flag_offset in ((b"PK\x03\x04", 6), (b"PK\x01\x02", 8)):
+        position = data.find(signature)
+        while position != -1:
+            data[position + flag_offset] |= 0x01
+            position = data.find(signature, position + 4)
+    return io.BytesIO(bytes(data))
+
+def _results(files):
+    return [(name, extension, data, error) for name, extension, data, error in iter_documents(files)]
+
+@pytest.fixture
+def opened(monkeypatch):
+    """Names of the ZIP entries opened for reading"""
+    names = []
+    real_open = zipfile.ZipFile.open
+
+    def tracking_open(self, name, mode="r", *args, **kwargs):
+        if mode == "r":
+            names.append(getattr(name, "filename", name))
+        return real_open(self, name, mode, *args, **kwargs)
+
+    monkeypatch.setattr(zipfile.ZipFile, "open", tracking_open)
+    return names
+
+def test_nested_paths_folders_and_metadata(opened):
+    archive = _zip({
+        "essays/": b"",
+        "essays/week 1/a.txt": b"first",
+        "essays/week 2/b.TXT": b"second",
+        "__MACOSX/essays/._a.txt": b"junk",
+        "essays/.DS_Store": b"junk",
+        "essays/notes.md": b"unsupported",
+    })
+    results = _results([("essays.zip", archive), ("c.txt", io.BytesIO(b"third"))])
+    assert results == [
+        ("essays/week 1/a.txt", "txt", b"first", None),
+        ("essays/week 2/b.TXT", "txt", b"second", None),
+        ("essays/notes.md", "md", None, "Unsupported file format"),
+        ("c.txt", "txt", b"third", None),
+    ]
+    assert opened == ["essays/week 1/a.txt", "essays/week 2/b.TXT"]
+
+def test_file_cap_stops_before_opening_more_entries(monkeypatch, opened):
+    monkeypatch.setattr(batch_upload, "MAX_BATCH_FILES", 2)
+    archive = _zip({f"{i}.txt": b"x" for i in range(5)})
+    later = io.BytesIO(b"never read")
+    results = _results([("batch.zip", archive), ("later.txt", later)])
+    assert [error for _, _, _, error in results] == [
+        None, None, "Batch limit of 2 files reached; later files were skipped"
+    ]
+    assert results[2][0] == "2.txt"
+    assert opened == ["0.txt", "1.txt"]
+    assert later.tell() == 0
+
+    # Plain files are capped the same way
+    streams = [io.BytesIO(b"x") for _ in range(3)]
+    results = _results([(f"{i}.txt", stream) for i, stream in enumerate(streams)])
+    assert [error is None for _, _, _, error in results] == [True, True, False]
+    assert streams[2].tell() == 0
+
+def test_per_file_size_cap(monkeypatch):
+    monkeypatch.setattr(batch_upload, "MAX_UPLOAD_BYTES", 10)
+    archive = _zip({"small.txt": b"x" * 10, "big.txt": b"x" * 11})
+    results = _results([("batch.zip", archive), ("big.pdf", io.BytesIO(b"x" * 50))])
+    assert [(name, error) for name, _, _, error in results] == [
+        ("small.txt", None), ("big.txt", "File too large"), ("big.pdf", "File too large")
+    ]
+
+def test_encrypted_and_broken_archives():
+    encrypted = _encrypt_flag(_zip({"secret.txt": b"hidden"}))
+    results = _results([("locked.zip", encrypted), ("broken.zip", io.BytesIO(b"not a zip"))])
+    assert results[0][:3] == ("secret.txt", "txt", None)
+    assert results[0][3].startswith("Could not read entry") and "encrypted" in results[0][3]
+    assert results[1] == ("broken.zip", "zip", None, "Not a valid ZIP archive")
+
+def test_extract_batch_keeps_order_and_reports_rejections():
+    from test_text_extraction import _pdf
+    archive = _zip({
+        "a.txt": "café essay".encode("utf-8"),
+        "b.txt": "café essay".encode("latin-1"),
+        "c.pdf": _pdf(["pdf essay"]),
+        "d.txt": b"   ",
+    })
+    documents, rejected = extract_batch([("batch.zip", archive), ("e.docx", io.BytesIO(b"not a docx"))])
+    assert documents == [("a.txt", "café essay"), ("c.pdf", "pdf essay")]
+    errors = {item["filename"]: item["error"] for item in rejected}
+    assert set(errors) == {"b.txt", "d.txt", "e.docx"}
+    assert errors["b.txt"].startswith("Error reading file") and "utf-8" in errors["b.txt"]
+    assert errors["d.txt"] == errors["e.docx"] == "No text could be extracted"
@@ -0,0 +1,38 @@
+# backend/tests/test_chunking.py
+from chunking import chunk_text
+
+def _text(words: int) -> str:
+    return "  ".join(f"word{i}," for i in range(words))
+
+def test_offsets_point_into_the_text():
+    content = _text(23)
+    for start, end, passage in chunk_text(content, size=5, overlap=2):
+        assert content[start:end] == passage
+        assert not passage.startswith(" ") and not passage.endswith(" ")
+
+def test_passages_overlap_and_cover_every_word():
+    content = _text(23)
+    chunks = chunk_text(content, size=5, overlap=2)
+    words = [passage.split() for _, _, passage in chunks]
+    assert all(len(w) == 5 for w in words[:-1]) and 1 <= len(words[-1]) <= 5
+    for previous, current in zip(words, words[1:]):
+        assert previous[-2:] == current[:2]
+    covered = {w for passage in words for w in passage}
+    assert covered == set(content.split())
+    # The last passage ends at the last word; no passage repeats only overlap
+    assert chunks[-1][1] == len(content)
+    assert len(chunks) == 7
+
+def test_exact_fit_has_no_trailing_overlap_chunk():
+    assert len(chunk_text(_text(8), size=5, overlap=2)) == 2
+    assert len(chunk_text(_text(5), size=5, overlap=2)) == 1
+
+def test_short_and_empty_text():
+    assert chunk_text(_text(3), size=5, overlap=2) == [(0, len(_text(3)), _text(3))]
+    assert chunk_text("") == []
+    assert chunk_text(None) == []
+    assert chunk_text(" \n\t ") == []
+
+def test_without_overlap():
+    chunks = chunk_text(_text(10), size=5, overlap=0)
+    assert [len(p.split()) for _, _, p in chunks] == [5, 5]
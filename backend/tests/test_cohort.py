@@ -0,0 +1,103 @@
+# backend/tests/test_cohort.py
+import random
+
+import numpy as np
+
+import cohort
+from cohort import banding, candidate_pairs, connected_components, estimated_similarity, score_cohort
+from plagiarism import MINHASH_PERMUTATIONS, signature_for_text, signature_to_bytes
+
+def _essay(seed: int, words: int = 300) -> str:
+    rng = random.Random(seed)
+    return " ".join(f"w{rng.randrange(20000)}" for _ in range(words))
+
+def _pairs(pairs: np.ndarray):
+    return sorted(map(tuple, pairs.tolist()))
+
+def test_banding_meets_recall_at_threshold():
+    for threshold in (0.3, 0.5, 0.8):
+        bands, rows = banding(threshold)
+        assert bands * rows == MINHASH_PERMUTATIONS
+        assert 1 - (1 - threshold ** rows) ** bands >= cohort.LSH_RECALL_AT_THRESHOLD
+
+def test_candidate_pairs_share_a_band():
+    signatures = np.array([
+        [1, 2, 3, 4],
+        [1, 2, 9, 9],  # first band equals row 0
+        [7, 7, 3, 4],  # second band equals row 0
+        [5, 6, 7, 8],
+        [5, 6, 7, 8],
+    ], dtype=np.uint32)
+    assert _pairs(candidate_pairs(signatures, 2, 2)) == [(0, 1), (0, 2), (3, 4)]
+    # Same values in different bands do not collide
+    assert _pairs(candidate_pairs(np.array([[1, 1, 2, 2], [2, 2, 1, 1]], dtype=np.uint32), 2, 2)) == []
+    assert candidate_pairs(np.empty((0, 4), dtype=np.uint32), 2, 2).shape == (0, 2)
+
+def test_large_buckets_are_linked_to_their_first_member(monkeypatch):
+    monkeypatch.setattr(cohort, "MAX_BUCKET_SIZE", 3)
+    signatures = np.tile(np.array([1, 2], dtype=np.uint32), (5, 1))
+    assert _pairs(candidate_pairs(signatures, 1, 2)) == [(0, 1), (0, 2), (0, 3), (0, 4)]
+
+def test_estimated_similarity_is_the_share_of_equal_slots(monkeypatch):
+    monkeypatch.setattr(cohort, "SCORE_CHUNK", 1)
+    signatures = np.array([[1, 2, 3, 4], [1, 2, 0, 0], [1, 2, 3, 4]], dtype=np.uint32)
+    assert estimated_similarity(signatures, np.array([[0, 1], [0, 2], [1, 2]])).tolist() == [0.5, 1.0, 0.5]
+
+def test_connected_components():
+    labels = connected_components(7, np.array([[0, 3], [3, 5], [1, 2], [5, 6]]))
+    assert labels.tolist() == [0, 1, 1, 0, 4, 0, 0]
+    assert connected_components(3, np.empty((0, 2), dtype=np.int64)).tolist() == [0, 1, 2]
+    # A long chain given in reverse order still collapses to one label
+    chain = np.array([[i, i + 1] for i in reversed(range(99))])
+    assert set(connected_components(100, chain).tolist()) == {0}
+
+def test_score_cohort_clusters_near_copies():
+    base = _essay(1)
+    words = base.split()
+    copies = []
+    for seed in range(3):
+        changed = list(words)
+        rng = random.Random(seed)
+        for index in rng.sample(range(len(changed)), 15):
+            changed[index] = "edit"
+        copies.append(" ".join(changed))
+    texts = [base, _essay(2), copies[0], _essay(3), copies[1], copies[2]]
+    ids = [10, 11, 12, 13, 14, 15]
+    result = score_cohort({
+        "requested": ids + [99],
+        "ids": ids,
+        "filenames": [f"{i}.txt" for i in ids],
+        "signatures": [signature_to_bytes(signature_for_text(t)) for t in texts],
+        "unsigned_texts": {}
+    }, threshold=0.5)
+
+    assert result["compared"] == 6 and result["missing"] == [99]
+    assert [c["assignment_ids"] for c in result["clusters"]] == [[10, 12, 14, 15]]
+    # Each copy is close to the base; copies edited in different places
+    # may fall under the threshold with each other
+    assert {(10, 12), (10, 14), (10, 15)} <= {tuple(p["assignment_ids"]) for p in result["pairs"]}
+    assert all(p["similarity"] >= 0.5 for p in result["pairs"])
+    assert result["pairs"] == sorted(result["pairs"], key=lambda p: -p["similarity"])
+
+def test_score_cohort_signs_unsigned_texts_and_skips_empty_ones():
+    from assignment_content import compress_text
+    text = _essay(4)
+    result = score_cohort({
+        "requested": [1, 2, 3, 4],
+        "ids": [1, 2, 3, 4],
+        "filenames": ["a", "b", "c", "d"],
+        "signatures": [signature_to_bytes(signature_for_text(text)), None, None, None],
+        "unsigned_texts": {2: compress_text(text), 3: compress_text(""), 4: compress_text("")}
+    })
+    # Two empty documents would look identical; they are not paired
+    assert [p["assignment_ids"] for p in result["pairs"]] == [[1, 2]]
+    assert result["pairs"][0]["similarity"] == 1.0
+
+def test_pool_signing_matches_inline_and_avoids_fork(monkeypatch):
+    from executors import parse_pool
+    monkeypatch.setattr(cohort, "PARSE_WORKERS", 2)
+    monkeypatch.setattr(cohort, "SIGNATURE_CHUNK", 2)
+    texts = [f"essay {i} about the causes of the first world war" for i in range(5)]
+    assert np.array_equal(cohort._sign_texts(texts), cohort.signatures_for_texts(texts))
+    # Children of this threaded process must not inherit its locks
+    assert parse_pool.executor._mp_context.get_start_method() != "fork"
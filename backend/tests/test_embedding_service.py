@@ -0,0 +1,164 @@
+# backend/tests/test_embedding_service.py
+import uuid
+import hashlib
+import threading
+import time
+
+import numpy as np
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from embedding_service import EmbeddingService
+
+DIM = 4
+
+class FakeEmbedder:
+    """Deterministic vectors; the first call can be held open to let callers queue behind it"""
+    name = "fake"
+    model = "test"
+    dim = DIM
+
+    def __init__(self, fail: bool = False):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+        self.fail = fail
+
+    def embed(self, texts):
+        self.calls.append(list(texts))
+        self.release.wait(10)
+        if self.fail:
+            raise RuntimeError("embedder down")
+        return np.stack([self.vector(t) for t in texts])
+
+    @staticmethod
+    def vector(content: str) -> np.ndarray:
+        seed = int.from_bytes(hashlib.sha256(content.encode()).digest()[:4], "little")
+        return np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+
+def _wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+def _embed_concurrently(service, embedder, count):
+    """count callers, each embedding its own text, while the first embedder call is held"""
+    embedder.release.clear()
+    results, errors = {}, {}
+
+    def call(i):
+        try:
+            results[i] = service.embed([f"text {i}"])
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    threads[0].start()
+    _wait_for(lambda: len(embedder.calls) == 1)
+    for thread in threads[1:]:
+        thread.start()
+    _wait_for(lambda: len(service._queue) == count - 1)
+    embedder.release.set()
+    for thread in threads:
+        thread.join(10)
+    return results, errors
+
+def test_concurrent_misses_share_embedder_calls():
+    embedder = FakeEmbedder()
+    service = EmbeddingService(embedder, max_batch=64)
+    results, errors = _embed_concurrently(service, embedder, 20)
+    assert not errors
+    # The held call, then one call for everyone who queued behind it
+    assert len(embedder.calls) <= 2
+    assert sorted(t for call in embedder.calls for t in call) == sorted(f"text {i}" for i in range(20))
+    for i, vectors in results.items():
+        assert vectors.shape == (1, DIM)
+        assert np.allclose(vectors[0], FakeEmbedder.vector(f"text {i}"), atol=1e-2)
+    assert service.stats()["embed_calls"] == len(embedder.calls)
+
+def test_batches_are_capped_at_max_batch():
+    embedder = FakeEmbedder()
+    service = EmbeddingService(embedder, max_batch=5)
+    results, errors = _embed_concurrently(service, embedder, 12)
+    assert not errors and len(results) == 12
+    assert max(len(call) for call in embedder.calls) <= 5
+    assert service.stats()["largest_batch"] <= 5
+
+def test_cached_texts_skip_the_embedder():
+    embedder = FakeEmbedder()
+    service = EmbeddingService(embedder)
+    first = service.embed(["a", "b", "a"])
+    assert embedder.calls == [["a", "b"]]
+    assert np.array_equal(first[0], first[2])
+    again = service.embed(["b", "a", "c"])
+    assert embedder.calls[1:] == [["c"]]
+    assert np.array_equal(again[0], first[1]) and np.array_equal(again[1], first[0])
+    assert service.embed([]).shape == (0, DIM)
+
+def test_embedder_errors_reach_every_waiting_caller():
+    embedder = FakeEmbedder(fail=True)
+    service = EmbeddingService(embedder)
+    results, errors = _embed_concurrently(service, embedder, 5)
+    assert not results and len(errors) == 5
+    assert all(isinstance(e, RuntimeError) for e in errors.values())
+    # Nothing is left queued, and the next caller leads again
+    embedder.fail = False
+    assert service.embed(["later"]).shape == (1, DIM)
+
+@pytest.fixture
+def stored(engine):
+    """A DB-backed service with its own namespace; its embedding_cache rows are removed afterwards"""
+    embedder = FakeEmbedder()
+    embedder.model = f"test-{uuid.uuid4().hex}"
+    service = EmbeddingService(embedder, sessionmaker(bind=engine), memory_items=0)
+    yield service
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM embedding_cache WHERE cache_key = ANY(:keys)"),
+                     {"keys": [service.cache_key(f"text {i}") for i in range(10)]})
+
+def _last_used(engine, service, texts):
+    with engine.begin() as conn:
+        rows = dict(conn.execute(text("""
+            SELECT cache_key, last_used_at > now() - interval '1 minute'
+            FROM embedding_cache WHERE cache_key = ANY(:keys)
+        """), {"keys": [service.cache_key(t) for t in texts]}).fetchall())
+    return [rows.get(service.cache_key(t)) for t in texts]
+
+def _age(engine, service, texts):
+    """Mark texts as last used long ago, the first one longest"""
+    with engine.begin() as conn:
+        for i, content in enumerate(texts):
+            conn.execute(text("""
+                UPDATE embedding_cache SET last_used_at = '2000-01-01'::timestamptz + make_interval(days => :i)
+                WHERE cache_key = :key
+            """), {"key": service.cache_key(content), "i": i})
+
+def test_hits_refresh_last_used_at(engine, stored):
+    stored.embed(["text 0", "text 1"])
+    _age(engine, stored, ["text 0", "text 1"])
+    assert _last_used(engine, stored, ["text 0", "text 1"]) == [False, False]
+
+    stored.embed(["text 0"])
+    assert stored.embedder.calls == [["text 0", "text 1"]]
+    assert _last_used(engine, stored, ["text 0", "text 1"]) == [True, False]
+
+def test_eviction_drops_the_least_recently_used_rows(engine, stored):
+    texts = [f"text {i}" for i in range(5)]
+    stored.embed(texts)
+    # text 3 was used most recently of all, text 1 least
+    _age(engine, stored, ["text 1", "text 0", "text 2", "text 4", "text 3"])
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE embedding_cache"))
+        total = conn.execute(text("SELECT count(*) FROM embedding_cache")).scalar()
+        # Every other row was used more recently than these
+        conn.execute(text("UPDATE embedding_cache SET last_used_at = now() WHERE NOT cache_key = ANY(:keys)"),
+                     {"keys": [stored.cache_key(t) for t in texts]})
+
+    with stored.session_factory() as db:
+        stored.max_rows = total
+        assert stored.evict(db) == 0
+        stored.max_rows = total - 2
+        assert stored.evict(db) == 2
+    assert _last_used(engine, stored, texts) == [None, None, False, False, False]
@@ -0,0 +1,86 @@
+# backend/tests/test_fingerprint_index.py
+import random
+
+from batch_upload import prepare_batch, queue_batch
+from plagiarism import detect_plagiarism_local
+
+def _essay(seed: int, words: int = 400) -> str:
+    rng = random.Random(seed)
+    return " ".join(f"w{rng.randrange(20000)}" for _ in range(words))
+
+def test_files_of_one_batch_flag_each_other(db, student):
+    original = _essay(1)
+    words = original.split()
+    words[100:105] = ["changed"] * 5
+    copy = " ".join(words)
+    batch = queue_batch(db, student, prepare_batch([("a.txt", original), ("b.txt", copy)]), [])
+    first, second = (a["assignment_id"] for a in batch["assignments"])
+
+    # Same uploader, but batch files are different authors
+    for content, own_id, other_id in ((original, first, second), (copy, second, first)):
+        result = detect_plagiarism_local(db, content, [], student, own_id)
+        assert {s["source_id"] for s in result["flagged_sections"]} == {other_id}
+        assert result["plagiarism_score"] > 90
+
+def test_own_single_uploads_are_not_candidates(db, student):
+    from main import prepare_assignment, queue_assignment
+    content = _essay(2)
+    first, _, _ = queue_assignment(db, student, "a.txt", prepare_assignment(content))
+    second, _, _ = queue_assignment(db, student, "b.txt", prepare_assignment(content))
+    result = detect_plagiarism_local(db, content, [], student, second)
+    assert not [s for s in result["flagged_sections"] if s["source_type"] == "assignment"]
+
+def test_common_fingerprints_are_skipped(db, student, monkeypatch):
+    import plagiarism
+    from plagiarism import assignment_fingerprints, find_fingerprint_matches
+    prompt = _essay(3, 60)
+    batch = queue_batch(db, student, prepare_batch([(f"s{i}.txt", prompt + " " + _essay(10 + i)) for i in range(4)]), [])
+    ids = [a["assignment_id"] for a in batch["assignments"]]
+    query = assignment_fingerprints(prompt + " " + _essay(99))
+
+    assert set(find_fingerprint_matches(db, query, None, None)) >= {(1, i) for i in ids}
+    # Text in more than FINGERPRINT_MAX_DOC_FREQ assignments is boilerplate
+    monkeypatch.setattr(plagiarism, "FINGERPRINT_MAX_DOC_FREQ", 3)
+    assert not set(find_fingerprint_matches(db, query, None, None)) & {(1, i) for i in ids}
+
+def test_comparisons_go_to_the_closest_candidates(db, student, monkeypatch):
+    from sqlalchemy import text
+    import plagiarism
+    from plagiarism import DOC_SOURCE, index_document
+    original = _essay(5)
+    batch = queue_batch(db, student, prepare_batch([("a.txt", original), ("b.txt", original)]), [])
+    first, second = (a["assignment_id"] for a in batch["assignments"])
+    # A retrieved source that shares one passage
+    passage = " ".join(original.split()[:30])
+    source_id = db.execute(text("INSERT INTO academic_sources (title, abstract) VALUES ('Partial', :abstract) RETURNING id"),
+                           {"abstract": passage}).scalar()
+    index_document(db, DOC_SOURCE, source_id, passage)
+    db.commit()
+    try:
+        result = detect_plagiarism_local(db, original, [{"id": source_id}], student, first)
+        assert {s["source_type"] for s in result["flagged_sections"]} == {"academic_source", "assignment"}
+
+        # Retrieval does not reserve a comparison; the full copy scores higher
+        monkeypatch.setattr(plagiarism, "PLAGIARISM_MAX_COMPARISONS", 1)
+        result = detect_plagiarism_local(db, original, [{"id": source_id}], student, first)
+        assert {(s["source_type"], s["source_id"]) for s in result["flagged_sections"]} == {("assignment", second)}
+    finally:
+        db.rollback()
+        db.execute(text("DELETE FROM lsh_buckets WHERE doc_type = :doc_type AND doc_id = :id"),
+                   {"doc_type": DOC_SOURCE, "id": source_id})
+        db.execute(text("DELETE FROM academic_sources WHERE id = :id"), {"id": source_id})
+        db.commit()
+
+def test_index_rows_are_deleted_with_the_assignment(db, student):
+    from sqlalchemy import text
+    from plagiarism import DOC_ASSIGNMENT, index_document
+    batch = queue_batch(db, student, prepare_batch([("a.txt", _essay(4))]), [])
+    assignment_id = batch["assignments"][0]["assignment_id"]
+    index_document(db, DOC_ASSIGNMENT, assignment_id, _essay(4))
+    db.execute(text("DELETE FROM analysis_jobs WHERE assignment_id = :id"), {"id": assignment_id})
+    db.execute(text("DELETE FROM assignments WHERE id = :id"), {"id": assignment_id})
+    db.commit()
+    assert not db.execute(text("SELECT 1 FROM assignment_fingerprints WHERE assignment_id = :id"),
+                          {"id": assignment_id}).first()
+    assert not db.execute(text("SELECT 1 FROM lsh_buckets WHERE doc_type = 1 AND doc_id = :id"),
+                          {"id": assignment_id}).first()
@@ -0,0 +1,76 @@
+# backend/tests/test_history.py
+from datetime import datetime, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from auth import Principal
+from history import encode_cursor, decode_cursor
+
+@pytest.fixture
+def client():
+    """
+    (client, principal) for the app without its lifespan (no workers or
+    backfills), authenticated as principal; routes get no DB session unless
+    a test overrides get_request_db.
+    """
+    from main import app, get_current_user
+    from database import get_request_db
+    principal = Principal(0, "history@test.invalid", None, None)
+    app.dependency_overrides[get_current_user] = lambda: principal
+    app.dependency_overrides[get_request_db] = lambda: None
+    yield TestClient(app), principal
+    app.dependency_overrides.clear()
+
+def test_cursor_round_trip():
+    uploaded_at = datetime(2026, 3, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    cursor = encode_cursor(uploaded_at, 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, 2) == [uploaded_at, 42]
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 3)
+
+@pytest.mark.parametrize("path", ["/assignments", "/analyses"])
+@pytest.mark.parametrize("cursor", ["not a cursor", encode_cursor("yesterday", 1), encode_cursor(1, 2, 3, 4)])
+def test_bad_cursor_is_400(client, path, cursor):
+    response = client[0].get(path, params={"cursor": cursor})
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Invalid cursor")
+
+def test_unknown_include_is_400(client):
+    response = client[0].get("/assignments", params={"include": "original_text,secret"})
+    assert response.status_code == 400
+
+def test_pages_follow_next_cursor(client, db, student):
+    from main import app, prepare_assignment, queue_assignment
+    from database import get_request_db
+    http, principal = client
+    principal.id = student
+    app.dependency_overrides[get_request_db] = lambda: db
+    ids = [
+        queue_assignment(db, student, f"{i}.txt", prepare_assignment(f"essay number {i}"))[0]
+        for i in range(5)
+    ]
+
+    seen, sizes, cursor = [], [], None
+    while True:
+        params = {"limit": 2, "include": "original_text"}
+        if cursor:
+            params["cursor"] = cursor
+        response = http.get("/assignments", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        sizes.append(len(page["assignments"]))
+        seen.extend(page["assignments"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert sizes == [2, 2, 1]
+    assert [a["id"] for a in seen] == ids[::-1]
+    assert [a["original_text"] for a in seen] == [f"essay number {i}" for i in reversed(range(5))]
+    assert all(a["status"] == "pending" and a["job_id"] for a in seen)
+
+    # The text is only read when asked for
+    page = http.get("/assignments", params={"limit": 5}).json()
+    assert page["next_cursor"] is None
+    assert "original_text" not in page["assignments"][0]
@@ -0,0 +1,119 @@
+# backend/tests/test_job_queue.py
+import asyncio
+import uuid
+
+import pytest
+from sqlalchemy import text
+
+import job_queue
+from job_queue import claim_job, mark_failed, _store_result, JobWorkerPool
+from result_cache import ResultCache
+
+@pytest.fixture
+def queued(db, student):
+    """
+    Queue one job for a fresh assignment and return its id. Jobs already in
+    the table are row-locked meanwhile, so claim_job (SKIP LOCKED) only sees
+    this one.
+    """
+    from main import prepare_assignment, queue_assignment
+    with db.get_bind().connect() as conn, conn.begin():
+        conn.execute(text("""
+            SELECT id FROM analysis_jobs
+            WHERE NOT (status = 'running' AND attempts >= :max_attempts)
+            FOR UPDATE
+        """), {"max_attempts": job_queue.JOB_MAX_ATTEMPTS})
+        _, job_id, _ = queue_assignment(db, student, "retry.txt", prepare_assignment(f"essay {uuid.uuid4().hex}"))
+        yield job_id
+
+def _job(db, job_id):
+    db.rollback()
+    return db.execute(text("""
+        SELECT status, attempts, error, started_at, finished_at,
+               extract(epoch FROM run_after - now())
+        FROM analysis_jobs WHERE id = :id
+    """), {"id": job_id}).fetchone()
+
+def test_failed_job_is_retried_with_backoff(db, queued, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(job_queue, "JOB_RETRY_DELAY", 60)
+    job = claim_job(db)
+    assert job["id"] == queued and job["attempts"] == 1
+
+    assert mark_failed(db, job, "LLM timeout")
+    status, attempts, error, started_at, finished_at, wait = _job(db, queued)
+    assert (status, attempts, error, started_at, finished_at) == ("pending", 1, "LLM timeout", None, None)
+    assert 55 < wait <= 60
+    # Not claimable until run_after
+    assert claim_job(db) is None
+
+    db.execute(text("UPDATE analysis_jobs SET run_after = now() WHERE id = :id"), {"id": queued})
+    db.commit()
+    job = claim_job(db)
+    assert job["id"] == queued and job["attempts"] == 2
+    assert mark_failed(db, job, "LLM timeout")
+    # The delay doubles
+    assert 115 < _job(db, queued)[5] <= 120
+
+    db.execute(text("UPDATE analysis_jobs SET run_after = now() WHERE id = :id"), {"id": queued})
+    db.commit()
+    job = claim_job(db)
+    assert job["attempts"] == 3
+    assert not mark_failed(db, job, "LLM timeout")
+    status, attempts, error, started_at, finished_at, wait = _job(db, queued)
+    assert status == "failed" and attempts == 3 and finished_at is not None
+
+def test_a_stale_claim_writes_nothing(db, queued):
+    job = claim_job(db)
+    assert job["id"] == queued
+    # Its lease expired and another worker claimed the job again
+    db.execute(text("UPDATE analysis_jobs SET attempts = attempts + 1, started_at = now() WHERE id = :id"),
+               {"id": queued})
+    db.commit()
+
+    analysis = {"suggestions": "stale"}
+    assert _store_result(db, job, "essay", [], analysis, {}) is None
+    assert mark_failed(db, job, "stale failure") is None
+    status, attempts, error, *_ = _job(db, queued)
+    assert (status, attempts, error) == ("running", 2, None)
+    results = db.execute(text("SELECT count(*) FROM analysis_results WHERE assignment_id = :id"),
+                         {"id": job["assignment_id"]}).scalar()
+    assert results == 0
+
+    # The current claim completes it
+    current = dict(job, attempts=2)
+    stored = _store_result(db, current, "essay", [], analysis, {})
+    status, attempts, error, *_ = _job(db, queued)
+    assert status == "completed" and stored.research_suggestions == "stale"
+    assert db.execute(text("SELECT analysis_id FROM analysis_jobs WHERE id = :id"), {"id": queued}).scalar() == stored.id
+
+class HangingRAG:
+    """Retrieval succeeds; the analysis LLM call never returns"""
+
+    def __init__(self):
+        self.analysing = asyncio.Event()
+
+    def search_sources_multi(self, db, content):
+        return []
+
+    async def analyze_assignment(self, content, sources):
+        self.analysing.set()
+        await asyncio.Event().wait()
+
+def test_stop_releases_claimed_jobs(queued, monkeypatch):
+    from database import SessionLocal
+    monkeypatch.setattr(job_queue, "PLAGIARISM_ENGINE", "local")
+    monkeypatch.setattr(job_queue, "detect_plagiarism_local", lambda *args: {})
+
+    async def run():
+        rag = HangingRAG()
+        pool = JobWorkerPool(SessionLocal, rag, ResultCache(), num_workers=1)
+        pool.start()
+        await asyncio.wait_for(rag.analysing.wait(), 10)
+        await pool.stop()
+
+    asyncio.run(run())
+    with SessionLocal() as db:
+        status, attempts, error, started_at, finished_at, wait = _job(db, queued)
+    # Back in the queue, runnable now, and the interrupted attempt is not counted
+    assert (status, attempts, started_at, wait) == ("pending", 0, None, None)
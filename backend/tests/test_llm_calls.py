@@ -0,0 +1,123 @@
+# backend/tests/test_llm_calls.py
+import json
+import time
+import uuid
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+from sqlalchemy import text
+
+import job_queue
+import rag_service
+from job_queue import run_analysis
+from rag_service import RAGService
+from result_cache import ResultCache, analysis_digest, cache_key
+
+DELAY = 1.0
+SOURCES = [{"id": 1, "title": "A source", "authors": "A. Author", "year": 2020,
+            "abstract": "An abstract.", "type": "article", "similarity_score": 0.5}]
+
+class StubLLM(BaseHTTPRequestHandler):
+    """/v1/chat/completions that answers after server.delay seconds and logs (kind, start, end)"""
+
+    def do_POST(self):
+        started = time.monotonic()
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        system = body["messages"][0]["content"]
+        kind = "plagiarism" if "plagiarism" in system else "analysis"
+        time.sleep(self.server.delay)
+        content = {"plagiarism_score": 12.0, "flagged_sections": [], "confidence": "high"} \
+            if kind == "plagiarism" else {"suggestions": "From the stub", "citation_recommendation": "MLA"}
+        payload = json.dumps({
+            "id": "stub", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": json.dumps(content)}}]
+        }).encode()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except OSError:
+            pass  # the client timed out and hung up
+        self.server.calls.append((kind, started, time.monotonic()))
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubLLM)
+    server.delay = DELAY
+    server.calls = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    # Both calls go to the LLM, run concurrently by run_analysis
+    monkeypatch.setattr(job_queue, "PLAGIARISM_ENGINE", "llm")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def job(db, student):
+    """A running job for a fresh assignment (unique text, so nothing is cached yet)"""
+    from main import prepare_assignment, queue_assignment
+    content = f"essay {uuid.uuid4().hex}"
+    assignment_id, job_id, _ = queue_assignment(db, student, "llm.txt", prepare_assignment(content))
+    db.execute(text("UPDATE analysis_jobs SET status = 'running', attempts = 1, started_at = now() WHERE id = :id"),
+               {"id": job_id})
+    db.commit()
+    digest = analysis_digest(content, SOURCES)
+    yield {"id": job_id, "assignment_id": assignment_id, "attempts": 1}, digest
+    db.rollback()
+    keys = [cache_key(kind, digest) for kind in ("analyze_assignment", "detect_plagiarism")]
+    db.execute(text("DELETE FROM result_cache WHERE cache_key = ANY(:keys)"), {"keys": keys})
+    db.commit()
+
+def _analyse(db, job):
+    """(seconds, stored result, cache) for one run_analysis against the stub"""
+    async def run():
+        rag = RAGService()
+        rag.search_sources_multi = lambda db, content: SOURCES
+        cache = ResultCache()
+        try:
+            started = time.monotonic()
+            result = await run_analysis(db, rag, cache, job)
+            return time.monotonic() - started, result, cache
+        finally:
+            await rag.aclose()
+    return asyncio.run(run())
+
+def test_calls_overlap_so_latency_is_the_max_not_the_sum(db, stub_llm, job):
+    job, digest = job
+    elapsed, result, cache = _analyse(db, job)
+
+    assert DELAY <= elapsed < 1.5 * DELAY
+    assert sorted(kind for kind, _, _ in stub_llm.calls) == ["analysis", "plagiarism"]
+    (_, first_start, first_end), (_, second_start, _) = sorted(stub_llm.calls, key=lambda call: call[1])
+    assert second_start < first_end
+    assert result.research_suggestions == "From the stub" and result.plagiarism_score == 12.0
+
+    # Real results are cached, so the same text and sources skip the LLM next time
+    assert cache.get(db, "analyze_assignment", digest)["suggestions"] == "From the stub"
+    assert cache.get(db, "detect_plagiarism", digest)["confidence"] == "high"
+
+def test_timeouts_fall_back_and_are_not_cached(db, stub_llm, job, monkeypatch):
+    job, digest = job
+    monkeypatch.setattr(rag_service, "LLM_TIMEOUT", 0.3)
+    elapsed, result, cache = _analyse(db, job)
+
+    # Both calls were cut off at the timeout, concurrently
+    assert elapsed < DELAY
+    assert result.research_suggestions == RAGService._mock_analysis(None)["suggestions"]
+    assert result.plagiarism_score == 0.0 and result.confidence_score == 0.5
+    assert cache.get(db, "analyze_assignment", digest) is None
+    assert cache.get(db, "detect_plagiarism", digest) is None
+    assert db.execute(text("SELECT count(*) FROM result_cache WHERE cache_key = ANY(:keys)"), {
+        "keys": [cache_key(kind, digest) for kind in ("analyze_assignment", "detect_plagiarism")]
+    }).scalar() == 0
@@ -0,0 +1,94 @@
+# backend/tests/test_plagiarism.py
+import random
+
+import numpy as np
+
+from plagiarism import (
+    MINHASH_PERMUTATIONS, LSH_BANDS, SHINGLE_SIZE, WINNOW_WINDOW, shingle, minhash_signature,
+    signature_for_text, signature_to_bytes, signature_from_bytes, band_keys, winnow, assignment_fingerprints
+)
+
+def _words(seed: int, count: int):
+    rng = random.Random(seed)
+    return [f"w{rng.randrange(50000)}" for _ in range(count)]
+
+def test_shingle_spans_cover_k_words():
+    content = "The quick  brown fox, jumps over the lazy dog"
+    hashes, starts, ends = shingle(content, k=3)
+    assert hashes.dtype == np.uint64
+    assert len(hashes) == len(starts) == len(ends) == 7
+    assert content[starts[0]:ends[0]] == "The quick  brown"
+    assert content[starts[-1]:ends[-1]] == "the lazy dog"
+
+def test_shingle_ignores_case_and_punctuation():
+    assert np.array_equal(shingle("Hello, World! again and again")[0], shingle("hello world again AND again")[0])
+
+def test_short_and_empty_text():
+    hashes, starts, ends = shingle("two words", k=5)
+    assert len(hashes) == 1 and (starts[0], ends[0]) == (0, 9)
+    for content in ("", None, "  ...  "):
+        assert shingle(content)[0].size == 0
+
+def test_shingles_are_stable_across_calls():
+    # Stored signatures and fingerprints depend on these exact values
+    assert np.array_equal(shingle("a b c d e f")[0], shingle("a b c d e f")[0])
+    assert shingle("a b c d e")[0][0] != shingle("a b c d f")[0][0]
+
+def test_minhash_signature_shape_and_set_semantics():
+    hashes, _, _ = shingle(" ".join(_words(1, 200)))
+    signature = minhash_signature(hashes)
+    assert signature.dtype == np.uint32 and signature.shape == (MINHASH_PERMUTATIONS,)
+    # Order and repetition do not change a set's signature
+    assert np.array_equal(signature, minhash_signature(np.concatenate((hashes[::-1], hashes))))
+
+def test_minhash_estimates_jaccard():
+    words = _words(2, 1000)
+    a = set(shingle(" ".join(words))[0].tolist())
+    changed = words[:700] + _words(3, 300)
+    b = set(shingle(" ".join(changed))[0].tolist())
+    jaccard = len(a & b) / len(a | b)
+    estimate = np.mean(signature_for_text(" ".join(words)) == signature_for_text(" ".join(changed)))
+    assert abs(estimate - jaccard) < 0.15
+    assert np.mean(signature_for_text(" ".join(words)) == signature_for_text(" ".join(_words(4, 1000)))) < 0.05
+
+def test_empty_signature_and_bytes_round_trip():
+    empty = minhash_signature(np.empty(0, dtype=np.uint64))
+    assert (empty == 0xFFFFFFFF).all()
+    signature = signature_for_text(" ".join(_words(5, 50)))
+    data = signature_to_bytes(signature)
+    assert len(data) == 4 * MINHASH_PERMUTATIONS
+    assert np.array_equal(signature_from_bytes(data), signature)
+
+def test_band_keys_match_for_equal_bands():
+    signature = signature_for_text(" ".join(_words(6, 300)))
+    keys = band_keys(signature)
+    assert len(keys) == LSH_BANDS
+    assert all(-2 ** 63 <= key < 2 ** 63 for key in keys)
+    altered = signature.copy()
+    altered[0] ^= 1
+    # Only the first band changes
+    assert band_keys(altered)[1:] == keys[1:] and band_keys(altered)[0] != keys[0]
+
+def test_winnow_picks_the_minimum_of_every_window():
+    hashes = np.array([9, 4, 7, 4, 8, 1, 6, 3], dtype=np.uint64)
+    # Windows of 3: (9,4,7) (4,7,4) (7,4,8) (4,8,1) (8,1,6) (1,6,3)
+    assert winnow(hashes, 3).tolist() == [1, 4]
+    assert winnow(hashes, 1).tolist() == sorted(set(hashes.tolist()))
+    # A window wider than the document covers all of it
+    assert winnow(hashes, 100).tolist() == [1]
+    assert winnow(np.empty(0, dtype=np.uint64)).size == 0
+
+def test_winnow_fingerprints_fit_bigint():
+    fingerprints = winnow(np.array([2 ** 64 - 1, 2 ** 63, 5], dtype=np.uint64), 1)
+    assert fingerprints.dtype == np.int64
+    assert fingerprints.tolist() == [-2 ** 63, -1, 5]
+
+def test_shared_run_shares_a_fingerprint():
+    run = " ".join(_words(7, SHINGLE_SIZE + WINNOW_WINDOW - 1))
+    for seed in range(20):
+        first = " ".join(_words(100 + seed, 300)) + " " + run + " " + " ".join(_words(200 + seed, 300))
+        second = " ".join(_words(300 + seed, 50)) + " " + run
+        assert np.intersect1d(assignment_fingerprints(first), assignment_fingerprints(second)).size
+    unrelated = np.intersect1d(assignment_fingerprints(" ".join(_words(8, 500))),
+                               assignment_fingerprints(" ".join(_words(9, 500))))
+    assert unrelated.size == 0
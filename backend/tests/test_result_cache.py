@@ -0,0 +1,28 @@
+# backend/tests/test_result_cache.py
+import copy
+
+from result_cache import analysis_digest
+
+SOURCES = [
+    {"id": 1, "title": "Learning at scale", "authors": "A. Author", "year": 2020,
+     "abstract": "An abstract.", "type": "article", "similarity_score": 0.81},
+    {"id": 2, "title": "Tutoring systems", "authors": "B. Author", "year": 2018,
+     "abstract": "Another abstract.", "type": "article", "similarity_score": 0.64,
+     "passage": {"start": 10, "end": 90, "text": "A passage."}},
+]
+
+def test_digest_ignores_whitespace_and_key_order():
+    reordered = [dict(reversed(list(source.items()))) for source in SOURCES]
+    assert analysis_digest("An  essay\n about AI ", SOURCES) == analysis_digest("An essay about AI", reordered)
+
+def test_digest_changes_with_the_retrieved_sources():
+    digest = analysis_digest("An essay", SOURCES)
+    assert analysis_digest("Another essay", SOURCES) != digest
+    # Other sources, other ranking, or none
+    assert analysis_digest("An essay", SOURCES[:1]) != digest
+    assert analysis_digest("An essay", SOURCES[::-1]) != digest
+    assert analysis_digest("An essay", []) != digest
+    # The same source after an edit
+    edited = copy.deepcopy(SOURCES)
+    edited[1]["passage"]["text"] = "A revised passage."
+    assert analysis_digest("An essay", edited) != digest
@@ -0,0 +1,79 @@
+# backend/tests/test_schema.py
+import sys
+import uuid
+
+import pytest
+from sqlalchemy import text
+
+from schema import upgrade_schema, dedup_index_exists, build_dedup_index
+
+def _sql(engine, statement, **params):
+    with engine.begin() as conn:
+        result = conn.execute(text(statement), params)
+        return result.fetchall() if result.returns_rows else None
+
+@pytest.fixture
+def title(engine):
+    """A title no other source has; its rows (any case, in either table) are removed afterwards"""
+    title = f"Dedup test {uuid.uuid4().hex}"
+    yield title
+    for table in ("academic_sources", "academic_sources_duplicates"):
+        if _sql(engine, f"SELECT to_regclass('{table}')")[0][0]:
+            _sql(engine, f"DELETE FROM {table} WHERE lower(title) LIKE lower(:title) || '%'", title=title)
+
+@pytest.fixture
+def without_dedup_index(engine):
+    """Drop the dedup_key index for the test; the operator step rebuilds it"""
+    _sql(engine, "DROP INDEX ix_academic_sources_dedup_key")
+    yield
+    build_dedup_index(engine)
+    assert dedup_index_exists(engine)
+
+def _years(engine, table, title):
+    return [year for _, year in _sql(engine, f"""
+        SELECT id, publication_year FROM {table}
+        WHERE lower(title) LIKE lower(:title) || '%' ORDER BY id
+    """, title=title)]
+
+def test_startup_only_warns_and_the_operator_step_deduplicates(engine, title, without_dedup_index, capsys):
+    for year in (2001, 2001, 2001, 2002, None, None):
+        _sql(engine, """
+            INSERT INTO academic_sources (title, publication_year, abstract)
+            VALUES (:title, :year, 'abstract')
+        """, title=title, year=year)
+    # Same title once punctuation and case are normalized
+    _sql(engine, "INSERT INTO academic_sources (title, publication_year) VALUES (:title, 2001)",
+         title=title.upper() + "!")
+
+    upgrade_schema(engine)
+    assert "finalize_migrations.py --only dedup_key" in capsys.readouterr().out
+    assert not dedup_index_exists(engine)
+    assert len(_years(engine, "academic_sources", title)) == 7
+
+    assert build_dedup_index(engine) == 4
+    assert dedup_index_exists(engine)
+    assert _years(engine, "academic_sources", title) == [2001, 2002, None]
+    assert _years(engine, "academic_sources_duplicates", title) == [2001, 2001, None, 2001]
+    # Already built: nothing to do
+    assert build_dedup_index(engine) == 0
+
+def test_load_sources_refuses_without_the_index(engine, without_dedup_index, monkeypatch):
+    import load_sources
+    monkeypatch.setattr(sys, "argv", ["load_sources.py", "missing.json"])
+    with pytest.raises(SystemExit, match="finalize_migrations.py --only dedup_key"):
+        load_sources.main()
+
+def test_embedding_column_size_must_match_embedding_dim(engine):
+    from embeddings import check_vector_dimensions
+    columns = _sql(engine, """
+        SELECT attrelid::regclass::text, atttypmod FROM pg_attribute
+        WHERE attrelid IN (to_regclass('academic_sources'), to_regclass('source_chunks'))
+          AND attname = 'embedding' AND format_type(atttypid, NULL) = 'vector'
+    """)
+    if not columns:
+        pytest.skip("no pgvector embedding column (USE_VECTOR has never run here)")
+    table, size = columns[0]
+    if all(other == size for _, other in columns):
+        check_vector_dimensions(engine, size)
+    with pytest.raises(RuntimeError, match=rf"{table}.embedding is vector\({size}\).* but EMBEDDING_DIM={size + 1}"):
+        check_vector_dimensions(engine, size + 1)
@@ -0,0 +1,118 @@
+# backend/tests/test_segment_search.py
+from types import SimpleNamespace
+
+import pytest
+
+import rag_service
+from rag_service import RAGService, RRF_K
+
+class FakeDB:
+    """Answers _fuse_segment_hits' source lookup; passages come back for any chunk_id"""
+
+    def __init__(self):
+        self.rolled_back = False
+
+    def execute(self, statement, params):
+        rows = [
+            (source_id, f"Source {source_id}", "An Author", 2020, "An abstract.", "article", 0.0,
+             *((0, 20, f"passage {chunk_id}") if chunk_id is not None else (None, None, None)))
+            for source_id, chunk_id in zip(params["ids"], params["chunk_ids"])
+        ]
+        return SimpleNamespace(fetchall=lambda: rows)
+
+    def rollback(self):
+        self.rolled_back = True
+
+@pytest.fixture
+def rag():
+    return RAGService()
+
+def _text(words: int) -> str:
+    return " ".join(f"w{i}" for i in range(words))
+
+@pytest.fixture
+def small_segments(monkeypatch):
+    monkeypatch.setattr(rag_service, "SEGMENT_WORDS", 5)
+    monkeypatch.setattr(rag_service, "MAX_RETRIEVAL_QUERIES", 3)
+
+def test_split_segments_boundaries(small_segments):
+    assert RAGService.split_segments("") == []
+    assert RAGService.split_segments(None) == []
+    content = _text(4)
+    assert RAGService.split_segments(content) == [(0, len(content), content)]
+    # Up to MAX_RETRIEVAL_QUERIES segments of SEGMENT_WORDS words
+    assert [len(s.split()) for _, _, s in RAGService.split_segments(_text(15))] == [5, 5, 5]
+    assert [len(s.split()) for _, _, s in RAGService.split_segments(_text(11))] == [5, 5, 1]
+    # Longer texts get longer segments rather than more queries
+    assert [len(s.split()) for _, _, s in RAGService.split_segments(_text(16))] == [6, 6, 4]
+
+def test_segments_cover_the_text_without_overlap(small_segments):
+    content = "  ".join(f"word{i}." for i in range(47))
+    segments = RAGService.split_segments(content)
+    assert len(segments) == 3
+    for start, end, segment in segments:
+        assert content[start:end] == segment
+    for (_, previous_end, _), (next_start, _, _) in zip(segments, segments[1:]):
+        assert previous_end < next_start
+    assert " ".join(s for _, _, s in segments).split() == content.split()
+
+SEGMENTS = [(0, 10, "first"), (11, 20, "second"), (21, 30, "third")]
+
+def test_sources_found_by_several_segments_rank_first(rag):
+    # (segment, source_id, score, chunk_id, position)
+    hits = [
+        (1, 7, 0.9, None, 1),
+        (1, 3, 0.5, None, 2), (2, 3, 0.4, None, 2), (3, 3, 0.3, None, 3),
+        (2, 5, 0.8, None, 1),
+    ]
+    results = rag._fuse_segment_hits(FakeDB(), hits, SEGMENTS, "keyword", 5)
+    assert [r["id"] for r in results] == [3, 5, 7]
+    # Equal fused scores are ordered by id
+    tied = rag._fuse_segment_hits(FakeDB(), [(1, 9, 0.5, None, 1), (2, 4, 0.5, None, 1)], SEGMENTS, "keyword", 5)
+    assert [r["id"] for r in tied] == [4, 9]
+    assert len(rag._fuse_segment_hits(FakeDB(), hits, SEGMENTS, "keyword", 2)) == 2
+    assert rag._fuse_segment_hits(FakeDB(), [], SEGMENTS, "keyword", 5) == []
+
+def test_one_result_per_source_with_its_matched_segments(rag):
+    hits = [
+        (1, 3, 0.2, None, 1),
+        (2, 3, 0.6, 41, 1),
+        (3, 3, 0.4, None, 2),
+    ]
+    [source] = rag._fuse_segment_hits(FakeDB(), hits, SEGMENTS, "keyword", 5)
+    # Best segment first; its score and passage describe the source
+    assert [m["segment"] for m in source["matched_segments"]] == [2, 3, 1]
+    assert source["matched_segments"][0] == {"segment": 2, "start": 11, "end": 20, "score": 0.6}
+    assert source["similarity_score"] == 0.6
+    assert source["passage"]["text"] == "passage 41"
+
+def test_hybrid_scores_are_normalized_rrf(rag):
+    # Ranked first by both keyword and vector in segment 1; second by one of them in segment 2
+    hits = [
+        (1, 3, 0.2, None, 1), (1, 3, 0.9, None, 1),
+        (2, 3, 0.5, None, 2),
+    ]
+    [source] = rag._fuse_segment_hits(FakeDB(), hits, SEGMENTS, "hybrid", 5)
+    scores = {m["segment"]: m["score"] for m in source["matched_segments"]}
+    assert scores[1] == 1.0
+    assert scores[2] == round((RRF_K + 1) / 2.0 / (RRF_K + 2), 4)
+    assert source["similarity_score"] == 1.0
+
+def test_failed_multi_query_falls_back_to_the_first_segment(rag, small_segments, monkeypatch):
+    calls = []
+
+    def broken(*args):
+        raise RuntimeError("statement timeout")
+
+    def search_sources(db, query, top_k, mode=None):
+        calls.append((query, top_k, mode))
+        return ["fallback result"]
+
+    monkeypatch.setattr(rag, "_segment_hits", broken)
+    monkeypatch.setattr(rag, "search_sources", search_sources)
+    db = FakeDB()
+    content = _text(12)
+    assert rag.search_sources_multi(db, content, top_k=4, mode="hybrid") == ["fallback result"]
+    assert db.rolled_back
+    assert calls == [(RAGService.split_segments(content)[0][2], 4, "keyword")]
+    assert rag.search_sources_multi(db, "   ") == []
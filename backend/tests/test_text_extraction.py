@@ -0,0 +1,101 @@
+# backend/tests/test_text_extraction.py
+import io
+import os
+import time
+
+import pytest
+
+import text_extraction
+from executors import run_isolated
+from text_extraction import extract_text_from_pdf, extract_document
+
+def _pdf(pages):
+    """Minimal PDF with one line of Helvetica text per page"""
+    font = 3 + 2 * len(pages)
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages))), len(pages))
+    ]
+    for i, line in enumerate(pages):
+        stream = f"BT /F1 12 Tf 72 720 Td ({line}) Tj ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 {font} 0 R >> >> /Contents {4 + 2 * i} 0 R >>")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    data += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return data
+
+def _lines(content):
+    return [line for line in content.splitlines() if line]
+
+def test_pdf_text_is_extracted_in_a_worker():
+    assert _lines(extract_text_from_pdf(io.BytesIO(_pdf(["page 0", "page 1"])))) == ["page 0", "page 1"]
+
+def test_uploads_are_spooled_in_chunks_and_removed(monkeypatch, tmp_path):
+    monkeypatch.setattr(text_extraction, "UPLOAD_DIR", str(tmp_path))
+    spooled = []
+    real_parse_until = text_extraction._parse_until
+
+    def parse_until(deadline, fn, document, *args):
+        spooled.append(document)
+        return real_parse_until(deadline, fn, document, *args)
+
+    monkeypatch.setattr(text_extraction, "_parse_until", parse_until)
+    assert _lines(extract_text_from_pdf(io.BytesIO(_pdf(["page 0"])))) == ["page 0"]
+    # The worker got a path in UPLOAD_DIR, not the bytes, and the copy is gone
+    assert isinstance(spooled[0], str) and os.path.dirname(spooled[0]) == str(tmp_path)
+    assert os.listdir(tmp_path) == []
+
+def test_files_on_disk_are_not_copied(monkeypatch, tmp_path):
+    spool_dir = tmp_path / "spool"
+    monkeypatch.setattr(text_extraction, "UPLOAD_DIR", str(spool_dir))
+    path = tmp_path / "a.pdf"
+    path.write_bytes(_pdf(["page 0"]))
+    assert _lines(extract_text_from_pdf(str(path))) == ["page 0"]
+    with open(path, "rb") as fp:
+        assert _lines(extract_text_from_pdf(fp)) == ["page 0"]
+    assert not spool_dir.exists() and path.exists()
+
+def test_page_cap(monkeypatch):
+    monkeypatch.setattr(text_extraction, "PDF_MAX_PAGES", 2)
+    content = extract_text_from_pdf(io.BytesIO(_pdf([f"page {i}" for i in range(5)])))
+    assert _lines(content) == ["page 0", "page 1"]
+
+def test_page_cap_with_page_ranges(monkeypatch, tmp_path):
+    monkeypatch.setattr(text_extraction, "PDF_MAX_PAGES", 7)
+    monkeypatch.setattr(text_extraction, "PARSE_WORKERS", 2)
+    monkeypatch.setattr(text_extraction, "PDF_PARALLEL_MIN_PAGES", 4)
+    monkeypatch.setattr(text_extraction, "PDF_PAGES_PER_TASK", 3)
+    monkeypatch.setattr(text_extraction, "UPLOAD_DIR", str(tmp_path))
+    content = extract_text_from_pdf(io.BytesIO(_pdf([f"page {i}" for i in range(10)])))
+    assert _lines(content) == [f"page {i}" for i in range(7)]
+    # The spooled copy for the range workers is removed
+    assert os.listdir(tmp_path) == []
+
+def test_time_cap_stops_between_pages(monkeypatch):
+    monkeypatch.setattr(text_extraction, "PDF_EXTRACT_TIMEOUT", 0)
+    assert extract_text_from_pdf(io.BytesIO(_pdf([f"page {i}" for i in range(5)]))) == ""
+
+def test_time_cap_kills_a_stuck_parser(monkeypatch):
+    monkeypatch.setattr(text_extraction, "PDF_KILL_GRACE", 0.5)
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        # Stands in for a parser stuck inside a single page
+        text_extraction._parse_until(time.monotonic(), time.sleep, 30)
+    assert time.monotonic() - started < 5
+
+def test_dead_worker_is_reported():
+    with pytest.raises(RuntimeError, match="exited with code 3"):
+        run_isolated(5, os._exit, 3)
+
+def test_batch_documents_are_parsed_in_the_worker_process():
+    assert _lines(run_isolated(30, extract_document, _pdf(["only page"]), "pdf")) == ["only page"]
@@ -0,0 +1,74 @@
+# backend/tests/test_uploads.py
+import io
+
+import pytest
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.testclient import TestClient
+
+from uploads import MaxUploadSizeMiddleware, spool_to_disk
+
+LIMIT = 1000
+BATCH_LIMIT = 5000
+
+def _client():
+    app = FastAPI()
+    app.add_middleware(MaxUploadSizeMiddleware, max_bytes=LIMIT, batch_max_bytes=BATCH_LIMIT)
+    app.state.handled = 0
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        app.state.handled += 1
+        return {"size": len(await file.read())}
+
+    @app.post("/upload/batch")
+    async def upload_batch(file: UploadFile = File(...)):
+        app.state.handled += 1
+        return {"size": len(await file.read())}
+
+    return TestClient(app), app
+
+def _chunks(total: int, size: int = 100):
+    """Body without a Content-Length (sent chunked)"""
+    for offset in range(0, total, size):
+        yield b"x" * min(size, total - offset)
+
+def test_small_upload_passes():
+    client, app = _client()
+    response = client.post("/upload", files={"file": ("a.txt", b"x" * 500)})
+    assert response.status_code == 200 and response.json() == {"size": 500}
+
+def test_content_length_over_limit_is_refused_before_the_route():
+    client, app = _client()
+    response = client.post("/upload", files={"file": ("a.txt", b"x" * (LIMIT + 1))})
+    assert response.status_code == 413
+    assert "max" in response.json()["detail"]
+    assert app.state.handled == 0
+
+def test_streamed_body_over_limit_is_refused_while_reading():
+    client, app = _client()
+    response = client.post("/upload", content=_chunks(LIMIT * 3),
+                           headers={"content-type": "multipart/form-data; boundary=b"})
+    assert response.status_code == 413
+    assert app.state.handled == 0
+
+def test_batch_path_has_its_own_limit():
+    client, app = _client()
+    response = client.post("/upload/batch", files={"file": ("a.zip", b"x" * (LIMIT * 3))})
+    assert response.status_code == 200
+    response = client.post("/upload/batch", files={"file": ("a.zip", b"x" * (BATCH_LIMIT + 1))})
+    assert response.status_code == 413
+    response = client.post("/upload/batch", content=_chunks(BATCH_LIMIT * 2),
+                           headers={"content-type": "multipart/form-data; boundary=b"})
+    assert response.status_code == 413
+
+def test_spool_to_disk_reports_its_own_limit(tmp_path):
+    path = spool_to_disk(io.BytesIO(b"x" * LIMIT), str(tmp_path), "txt", max_bytes=LIMIT)
+    assert open(path, "rb").read() == b"x" * LIMIT
+
+    limit = 2 * 1024 * 1024
+    with pytest.raises(HTTPException) as error:
+        spool_to_disk(io.BytesIO(b"x" * (limit + 1)), str(tmp_path), "txt", max_bytes=limit)
+    assert error.value.status_code == 413
+    assert error.value.detail == "File too large (max 2 MB)"
+    # The partial file is removed
+    assert [p.name for p in tmp_path.iterdir()] == [path.rsplit("/", 1)[1]]
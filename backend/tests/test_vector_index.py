@@ -0,0 +1,103 @@
+# backend/tests/test_vector_index.py
+import json
+import os
+
+import numpy as np
+import pytest
+
+import vector_index
+from vector_index import VectorIndex
+
+DIM = 8
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).standard_normal((50, DIM)).astype(np.float32)
+
+def _exact(vectors, ids, query, k):
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = unit @ (query / np.linalg.norm(query))
+    order = np.argsort(-scores)[:k]
+    return [ids[i] for i in order], scores[order]
+
+def test_search_matches_brute_force(vectors):
+    ids = list(range(100, 150))
+    index = VectorIndex(DIM)
+    index.add(ids, vectors)
+    assert len(index) == 50
+    query = vectors[7] + 0.1
+    expected_ids, expected_scores = _exact(vectors, ids, query, 5)
+    results = index.search(query, 5)
+    assert [source_id for source_id, _ in results] == expected_ids
+    assert np.allclose([score for _, score in results], expected_scores, atol=1e-5)
+    # Its own vector is the best match, at cosine 1
+    assert index.search(vectors[3], 1)[0][0] == 103
+    assert index.search(vectors[3], 1)[0][1] == pytest.approx(1.0, abs=1e-5)
+
+def test_search_many_and_edge_cases(vectors):
+    index = VectorIndex(DIM)
+    assert index.search(vectors[0], 3) == []
+    index.add([1, 2, 3], vectors[:3])
+    assert len(index.search(vectors[0], 10)) == 3
+    assert index.search(vectors[0], 0) == []
+    # A zero query does not divide by zero
+    assert len(index.search(np.zeros(DIM), 2)) == 2
+    for batched, query in zip(index.search_many(vectors[:3], 2), vectors[:3]):
+        single = index.search(query, 2)
+        assert [i for i, _ in batched] == [i for i, _ in single]
+        assert np.allclose([s for _, s in batched], [s for _, s in single], atol=1e-6)
+
+def test_add_replaces_by_id(vectors):
+    index = VectorIndex(DIM)
+    index.add([1, 2], vectors[:2])
+    index.add([1], vectors[10:11])
+    assert len(index) == 2
+    assert index.search(vectors[10], 1)[0][0] == 1
+    assert [source_id for source_id, _ in index.search(vectors[0], 5)].count(1) == 1
+
+def test_removed_ids_are_tombstoned_then_compacted(vectors, monkeypatch):
+    monkeypatch.setattr(vector_index, "COMPACT_FRACTION", 0.25)
+    ids = list(range(40))
+    index = VectorIndex(DIM)
+    index.add(ids, vectors[:40])
+    index.remove([5, 6, 7, 999])
+    stats = index.stats()
+    assert stats["vectors"] == 37 and stats["removed_rows"] == 3
+    found = {source_id for source_id, _ in index.search(vectors[5], 40)}
+    assert found == set(ids) - {5, 6, 7}
+    # Past COMPACT_FRACTION of the rows the tombstones are dropped
+    index.remove(list(range(10, 20)))
+    assert index.stats()["removed_rows"] == 0
+    found = {source_id for source_id, _ in index.search(vectors[0], 40)}
+    assert found == set(ids) - {5, 6, 7} - set(range(10, 20))
+    assert index.search(vectors[25], 1)[0][0] == 25
+
+def test_save_and_load(vectors, tmp_path):
+    directory = str(tmp_path)
+    index = VectorIndex(DIM, "model-a", directory)
+    index.add(list(range(20)), vectors[:20])
+    index.remove([3])
+    index.save()
+    assert json.load(open(os.path.join(directory, "meta.json")))["count"] == 19
+
+    loaded = VectorIndex.open(DIM, "model-a", directory)
+    assert loaded.stats()["memory_mapped"] and len(loaded) == 19
+    for query in vectors[:5]:
+        assert loaded.search(query, 4) == index.search(query, 4)
+    # A mapped index still takes additions and removals
+    loaded.add([100], vectors[30:31])
+    loaded.remove([0])
+    assert loaded.search(vectors[30], 1)[0][0] == 100
+    assert 0 not in {source_id for source_id, _ in loaded.search(vectors[0], 30)}
+
+def test_load_rejects_another_embedder_or_partial_files(vectors, tmp_path):
+    directory = str(tmp_path)
+    index = VectorIndex(DIM, "model-a", directory)
+    index.add([1, 2], vectors[:2])
+    index.save()
+    assert len(VectorIndex.open(DIM, "model-b", directory)) == 0
+    assert len(VectorIndex.open(DIM * 2, "model-a", directory)) == 0
+    with open(os.path.join(directory, "meta.json"), "w") as fp:
+        json.dump({"namespace": "model-a", "dim": DIM, "count": 5}, fp)
+    assert len(VectorIndex.open(DIM, "model-a", directory)) == 0
+    assert len(VectorIndex.open(DIM, "model-a", str(tmp_path / "missing"))) == 0
@@ -0,0 +1,160 @@
+# backend/text_extraction.py
+import io
+import os
+import time
+from concurrent.futures import wait
+from typing import Any, Callable, Iterator, List, Optional, Tuple, Union, BinaryIO
+import PyPDF2
+import docx
+import logging
+
+from uploads import spool_to_disk
+from executors import sandbox_pool, run_isolated, preload_in_sandbox, PARSE_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Caps so a single pathological PDF cannot stall a worker: pages past
+# PDF_MAX_PAGES are ignored, and text extracted by PDF_EXTRACT_TIMEOUT is kept
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "500"))
+PDF_EXTRACT_TIMEOUT = float(os.getenv("PDF_EXTRACT_TIMEOUT", "60"))
+# Parsing runs in sandboxed processes (executors.run_isolated); one stuck
+# inside a single page is killed this long after the deadline
+PDF_KILL_GRACE = 2.0
+
+# Documents with at least this many pages are split across sandboxed processes
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "50"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "25"))
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
+
+# Sandboxed parsers would otherwise import PyPDF2 and python-docx per job
+preload_in_sandbox(__name__)
+
+# Extractors accept a path or an open binary file object (e.g. UploadFile.file)
+Source = Union[str, BinaryIO]
+
+def iter_pdf_pages(reader: PyPDF2.PdfReader, start: int, stop: int,
+                   deadline: Optional[float] = None) -> Iterator[str]:
+    """Yield the text of pages [start, stop), stopping early at the deadline"""
+    for index in range(start, stop):
+        if deadline is not None and time.monotonic() > deadline:
+            print(f"⚠️ PDF extraction hit its time limit at page {index}")
+            return
+        page_text = reader.pages[index].extract_text()
+        if page_text:
+            yield page_text
+
+def read_pdf(document: Union[str, bytes], max_pages: int, deadline: float,
+             split_at: Optional[int] = None) -> Tuple[int, Optional[str]]:
+    """
+    Sandbox task: (pages to extract, text) of a PDF path or bytes.
+
+    Text is None when the document has at least split_at pages; the caller
+    then extracts it in page ranges.
+    """
+    reader = PyPDF2.PdfReader(io.BytesIO(document) if isinstance(document, bytes) else document)
+    page_count = len(reader.pages)
+    if page_count > max_pages:
+        print(f"⚠️ PDF has {page_count} pages; extracting the first {max_pages}")
+        page_count = max_pages
+    if split_at is not None and page_count >= split_at:
+        return page_count, None
+    return page_count, "\n".join(iter_pdf_pages(reader, 0, page_count, deadline)).strip()
+
+def _extract_page_range(file_path: str, start: int, stop: int, deadline: float) -> List[str]:
+    """Sandbox task: text of one page range"""
+    # time.monotonic() is system-wide on Linux, so the parent's deadline applies here
+    reader = PyPDF2.PdfReader(file_path)
+    return list(iter_pdf_pages(reader, start, stop, deadline))
+
+def _pdf_path(source: Source) -> Tuple[str, bool]:
+    """
+    (path, is_copy) of a PDF for the sandboxed parsers. A file object with
+    no file of its own (BytesIO, a SpooledTemporaryFile) is copied to
+    UPLOAD_DIR in UPLOAD_CHUNK_SIZE chunks, so it is never held in memory.
+    """
+    if isinstance(source, str):
+        return source, False
+    name = getattr(source, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name, False
+    return spool_to_disk(source, UPLOAD_DIR, "pdf"), True
+
+def _parse_until(deadline: float, fn: Callable, *args) -> Any:
+    """Sandbox-pool task: fn(*args) in its own process, killed PDF_KILL_GRACE seconds after the deadline"""
+    return run_isolated(max(deadline - time.monotonic(), 0) + PDF_KILL_GRACE, fn, *args)
+
+def extract_text_from_pdf(source: Source, parallel: bool = True) -> str:
+    """Text of an untrusted PDF; nothing is parsed in the calling process"""
+    spooled_path = None
+    try:
+        deadline = time.monotonic() + PDF_EXTRACT_TIMEOUT
+        # Workers open the PDF by path; only the path is sent to them
+        file_path, is_copy = _pdf_path(source)
+        spooled_path = file_path if is_copy else None
+        # Split only when there is more than one process to split across
+        split_at = PDF_PARALLEL_MIN_PAGES if parallel and PARSE_WORKERS >= 2 else None
+        page_count, content = sandbox_pool.submit(
+            _parse_until, deadline, read_pdf, file_path, PDF_MAX_PAGES, deadline, split_at
+        ).result()
+        if content is not None:
+            return content
+
+        futures = [
+            sandbox_pool.submit(_parse_until, deadline, _extract_page_range, file_path, start,
+                                min(start + PDF_PAGES_PER_TASK, page_count), deadline)
+            for start in range(0, page_count, PDF_PAGES_PER_TASK)
+        ]
+        done, pending = wait(futures, timeout=max(deadline - time.monotonic(), 0) + PDF_KILL_GRACE)
+        for future in pending:
+            future.cancel()
+        if pending:
+            print(f"⚠️ PDF extraction timed out; {len(pending)} page ranges skipped")
+
+        # Keep page order; ranges that timed out, failed or were killed are dropped
+        pages = []
+        for future in futures:
+            if future in done and future.exception() is None:
+                pages.extend(future.result())
+        return "\n".join(pages).strip()
+    except Exception as e:
+        print(f"PDF extraction error: {e}")
+        return ""
+    finally:
+        if spooled_path:
+            try:
+                os.remove(spooled_path)
+            except OSError:
+                pass
+
+def extract_text_from_docx(source: Source) -> str:
+    try:
+        doc = docx.Document(source)
+        return "\n".join([para.text for para in doc.paragraphs if para.text])
+    except Exception as e:
+        print(f"DOCX extraction error: {e}")
+        return ""
+
+def extract_text_from_txt(source: Source) -> str:
+    if isinstance(source, str):
+        with open(source, 'r', encoding='utf-8') as f:
+            return f.read()
+    return source.read().decode('utf-8')
+
+def extract_text(source: Source, file_extension: str, parallel: bool = True) -> str:
+    """Extract text from a pdf/docx/txt path or file object"""
+    if file_extension == 'pdf':
+        return extract_text_from_pdf(source, parallel)
+    if file_extension == 'docx':
+        return extract_text_from_docx(source)
+    return extract_text_from_txt(source)
+
+def extract_document(data: bytes, file_extension: str) -> str:
+    """Sandbox task: text of one in-memory document (batch uploads), parsed in this process"""
+    if file_extension == 'pdf':
+        try:
+            return read_pdf(data, PDF_MAX_PAGES, time.monotonic() + PDF_EXTRACT_TIMEOUT)[1]
+        except Exception as e:
+            print(f"PDF extraction error: {e}")
+            return ""
+    return extract_text(io.BytesIO(data), file_extension)
@@ -0,0 +1,85 @@
+# backend/uploads.py
+import os
+import uuid
+from typing import BinaryIO
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+# Largest request body accepted (uploads included)
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "25")) * 1024 * 1024)
+# Whole request for POST /upload/batch (each file in it is still held to MAX_UPLOAD_BYTES)
+MAX_BATCH_UPLOAD_BYTES = int(float(os.getenv("MAX_BATCH_UPLOAD_MB", "500")) * 1024 * 1024)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Paths allowed the larger request body
+BATCH_UPLOAD_PATHS = ("/upload/batch",)
+
+def _too_large(max_bytes: int = MAX_UPLOAD_BYTES) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File too large (max {max_bytes / (1024 * 1024):g} MB)"
+    )
+
+class MaxUploadSizeMiddleware:
+    """
+    Reject oversized request bodies with 413 while they are being read.
+
+    A Content-Length over the limit is refused before any of the body is
+    read; bodies without one (chunked encoding) are counted as they stream
+    in and rejected as soon as they cross the limit, so Starlette never
+    spools more than MAX_UPLOAD_BYTES to its temporary file.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES,
+                 batch_max_bytes: int = MAX_BATCH_UPLOAD_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.batch_max_bytes = batch_max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self.batch_max_bytes if scope["path"] in BATCH_UPLOAD_PATHS else self.max_bytes
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+            error = _too_large(max_bytes)
+            response = JSONResponse({"detail": error.detail}, status_code=error.status_code)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    # FastAPI re-raises HTTPExceptions from body parsing
+                    raise _too_large(max_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+def spool_to_disk(stream: BinaryIO, upload_dir: str, extension: str,
+                  max_bytes: int = MAX_UPLOAD_BYTES) -> str:
+    """Copy a file object to upload_dir in fixed-size chunks and return the path"""
+    os.makedirs(upload_dir, exist_ok=True)
+    file_path = os.path.join(upload_dir, f"{uuid.uuid4()}.{extension}")
+    written = 0
+    try:
+        with open(file_path, "wb") as buffer:
+            while True:
+                chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise _too_large(max_bytes)
+                buffer.write(chunk)
+    except Exception:
+        os.remove(file_path)
+        raise
+    return file_path
@@ -0,0 +1,218 @@
+# backend/vector_index.py
+import os
+import json
+import threading
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+from sqlalchemy import text
+
+from embeddings import EMBEDDING_STORAGE_DTYPE
+
+# Directory the index is saved to on shutdown and memory-mapped from on
+# start; empty = rebuild from embedding_blob on every start
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "")
+# Seconds between checks for sources added or removed by other processes
+VECTOR_INDEX_SYNC_SECONDS = float(os.getenv("VECTOR_INDEX_SYNC_SECONDS", "60"))
+
+# Rows of embedding_blob fetched per query while syncing
+SYNC_BATCH_SIZE = 10000
+# Compact once this fraction of rows are removed
+COMPACT_FRACTION = 0.25
+
+class VectorIndex:
+    """
+    Exact cosine-similarity index over academic_sources.embedding_blob.
+
+    Vectors are L2-normalized rows of one contiguous float32 matrix, so a
+    query is a single matrix-vector product plus argpartition for the top
+    k. Rows are only ever appended or tombstoned (id set to -1), and both
+    happen outside the range a running search reads, so searches take no
+    lock; removed rows are compacted away in bulk. 1M sources at 384
+    dimensions take 1.5 GB.
+    """
+
+    def __init__(self, dim: int, namespace: str = "", directory: str = VECTOR_INDEX_DIR):
+        self.dim = dim
+        self.namespace = namespace
+        self.directory = directory
+        self._lock = threading.Lock()
+        # (matrix, ids, count) replaced as a whole, so readers see a consistent snapshot
+        self._state = (np.zeros((0, dim), np.float32), np.zeros(0, np.int64), 0)
+        self._rows: Dict[int, int] = {}
+        self._removed = 0
+
+    @classmethod
+    def open(cls, dim: int, namespace: str = "", directory: str = VECTOR_INDEX_DIR) -> "VectorIndex":
+        """Index loaded from directory when it was saved for the same embedder, else empty"""
+        index = cls(dim, namespace, directory)
+        if directory:
+            try:
+                index.load()
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"⚠️ Could not load the vector index from {directory}: {e}")
+        return index
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, ids: Sequence[int], vectors: np.ndarray):
+        """Insert or replace vectors by source id"""
+        if not len(ids):
+            return
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms > 0, norms, 1)
+        with self._lock:
+            self._remove_locked(ids)
+            matrix, id_array, count = self._state
+            if count + len(ids) > len(id_array):
+                capacity = max(2 * len(id_array), count + len(ids), 1024)
+                grown = np.zeros((capacity, self.dim), np.float32)
+                grown[:count] = matrix[:count]
+                grown_ids = np.full(capacity, -1, np.int64)
+                grown_ids[:count] = id_array[:count]
+                matrix, id_array = grown, grown_ids
+            matrix[count:count + len(ids)] = vectors
+            id_array[count:count + len(ids)] = ids
+            for offset, source_id in enumerate(ids):
+                self._rows[int(source_id)] = count + offset
+            self._state = (matrix, id_array, count + len(ids))
+            self._compact_if_needed()
+
+    def remove(self, ids: Sequence[int]):
+        with self._lock:
+            self._remove_locked(ids)
+            self._compact_if_needed()
+
+    def _remove_locked(self, ids: Sequence[int]):
+        id_array = self._state[1]
+        for source_id in ids:
+            row = self._rows.pop(int(source_id), None)
+            if row is not None:
+                id_array[row] = -1
+                self._removed += 1
+
+    def _compact_if_needed(self):
+        matrix, id_array, count = self._state
+        if self._removed <= COMPACT_FRACTION * count:
+            return
+        keep = np.flatnonzero(id_array[:count] >= 0)
+        self._state = (np.ascontiguousarray(matrix[keep]), id_array[keep].copy(), len(keep))
+        self._rows = {int(source_id): row for row, source_id in enumerate(self._state[1])}
+        self._removed = 0
+
+    def search(self, query: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """(source id, cosine similarity) of the k nearest sources, best first"""
+        return self.search_many(np.asarray(query).reshape(1, -1), k)[0]
+
+    def search_many(self, queries: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+        """search() for each row of queries, with one matrix product"""
+        matrix, id_array, count = self._state
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        if not count or k <= 0:
+            return [[] for _ in queries]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1)
+        ids = id_array[:count]
+        # One row of scores per query (row-major makes argpartition faster)
+        scores = np.ascontiguousarray((matrix[:count] @ queries.T).T)
+        if self._removed:
+            scores[:, ids < 0] = -np.inf
+        k = min(k, count)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for query_scores, rows in zip(scores, top):
+            rows = rows[np.argsort(-query_scores[rows], kind="stable")]
+            results.append([(int(ids[row]), float(query_scores[row])) for row in rows if ids[row] >= 0])
+        return results
+
+    def stats(self) -> Dict[str, object]:
+        """Size counters, for /health"""
+        matrix, id_array, count = self._state
+        return {
+            "vectors": len(self._rows),
+            "removed_rows": self._removed,
+            "capacity": len(id_array),
+            "memory_mb": round(matrix.nbytes / 2**20, 1),
+            "memory_mapped": isinstance(matrix, np.memmap),
+        }
+
+    def sync(self, session_factory, full: bool = False) -> int:
+        """
+        Match the index to the sources that have an embedding_blob.
+
+        Unless full, a count and max(id) comparison skips the id diff when
+        nothing was added or removed. Returns the number of vectors loaded.
+        """
+        with session_factory() as db:
+            count, max_id = db.execute(text("""
+                SELECT count(*), coalesce(max(id), 0) FROM academic_sources
+                WHERE embedding_blob IS NOT NULL
+            """)).first()
+            with self._lock:
+                indexed = np.fromiter(self._rows, dtype=np.int64, count=len(self._rows))
+            if not full and count == len(indexed) and max_id == (indexed.max() if len(indexed) else 0):
+                return 0
+            stored = np.array(db.execute(text("""
+                SELECT id FROM academic_sources WHERE embedding_blob IS NOT NULL
+            """)).scalars().all(), dtype=np.int64)
+            self.remove(np.setdiff1d(indexed, stored, assume_unique=True).tolist())
+            missing = np.setdiff1d(stored, indexed, assume_unique=True)
+            loaded = 0
+            itemsize = np.dtype(EMBEDDING_STORAGE_DTYPE).itemsize * self.dim
+            for offset in range(0, len(missing), SYNC_BATCH_SIZE):
+                rows = db.execute(text("""
+                    SELECT id, embedding_blob FROM academic_sources WHERE id = ANY(:ids)
+                """), {"ids": missing[offset:offset + SYNC_BATCH_SIZE].tolist()}).fetchall()
+                # Blobs written with another dimension or dtype are skipped
+                rows = [(source_id, blob) for source_id, blob in rows if blob is not None and len(blob) == itemsize]
+                if not rows:
+                    continue
+                vectors = np.frombuffer(b"".join(bytes(blob) for _, blob in rows),
+                                        dtype="<f2" if EMBEDDING_STORAGE_DTYPE == "float16" else "<f4")
+                self.add([source_id for source_id, _ in rows], vectors.reshape(len(rows), self.dim))
+                loaded += len(rows)
+        if loaded:
+            print(f"🧮 Vector index: loaded {loaded} embeddings ({len(self)} total)")
+        return loaded
+
+    def save(self):
+        """Write live rows to directory (vectors.npy is memory-mapped by load)"""
+        if not self.directory:
+            return
+        matrix, id_array, count = self._state
+        keep = np.flatnonzero(id_array[:count] >= 0)
+        os.makedirs(self.directory, exist_ok=True)
+        vectors = np.lib.format.open_memmap(os.path.join(self.directory, "vectors.npy.tmp"),
+                                            mode="w+", dtype=np.float32, shape=(len(keep), self.dim))
+        vectors[:] = matrix[keep]
+        vectors.flush()
+        del vectors
+        with open(os.path.join(self.directory, "ids.npy.tmp"), "wb") as fp:
+            np.save(fp, id_array[keep])
+        for name in ("vectors.npy", "ids.npy"):
+            os.replace(os.path.join(self.directory, name + ".tmp"), os.path.join(self.directory, name))
+        # Written last: a load only trusts files whose row count matches
+        with open(os.path.join(self.directory, "meta.json"), "w") as fp:
+            json.dump({"namespace": self.namespace, "dim": self.dim, "count": len(keep)}, fp)
+        print(f"💾 Saved vector index ({len(keep)} vectors) to {self.directory}")
+
+    def load(self):
+        """Memory-map a saved index (copy-on-write; pages are read on first use)"""
+        with open(os.path.join(self.directory, "meta.json")) as fp:
+            meta = json.load(fp)
+        if meta.get("namespace") != self.namespace or meta.get("dim") != self.dim:
+            print("⚠️ Saved vector index was built with another embedder; rebuilding")
+            return
+        matrix = np.load(os.path.join(self.directory, "vectors.npy"), mmap_mode="c")
+        ids = np.load(os.path.join(self.directory, "ids.npy"))
+        if len(ids) != meta["count"] or matrix.shape != (len(ids), self.dim):
+            print("⚠️ Saved vector index is incomplete; rebuilding")
+            return
+        with self._lock:
+            self._state = (matrix, ids, len(ids))
+            self._rows = {int(source_id): row for row, source_id in enumerate(ids)}
+            self._removed = 0
+        print(f"🧮 Vector index: mapped {len(ids)} embeddings from {self.directory}")
@@ -1,5 +1,7 @@
 -- Enable pgvector extension
 CREATE EXTENSION IF NOT EXISTS vector;
+-- Trigram matching for fuzzy title/abstract search
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- Create tables
 CREATE TABLE IF NOT EXISTS students (
@@ -11,15 +13,26 @@ CREATE TABLE IF NOT EXISTS students (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Compressed assignment text, shared by identical submissions
+CREATE TABLE IF NOT EXISTS assignment_contents (
+    content_hash VARCHAR(64) PRIMARY KEY,
+    compression VARCHAR(8) NOT NULL,
+    data BYTEA NOT NULL,
+    original_size INTEGER,
+    created_at TIMESTAMPTZ DEFAULT now()
+);
+ALTER TABLE assignment_contents ALTER COLUMN data SET STORAGE EXTERNAL;
+
 CREATE TABLE IF NOT EXISTS assignments (
     id SERIAL PRIMARY KEY,
     student_id INTEGER REFERENCES students(id),
     filename TEXT,
-    original_text TEXT,
+    content_hash VARCHAR(64) REFERENCES assignment_contents(content_hash),
     topic TEXT,
     academic_level TEXT,
     word_count INTEGER,
-    uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    minhash_signature BYTEA
 );
 
 CREATE TABLE IF NOT EXISTS analysis_results (
@@ -34,6 +47,40 @@ CREATE TABLE IF NOT EXISTS analysis_results (
     analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE TABLE IF NOT EXISTS upload_batches (
+    id SERIAL PRIMARY KEY,
+    student_id INTEGER NOT NULL REFERENCES students(id),
+    file_count INTEGER NOT NULL DEFAULT 0,
+    rejected JSON,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE assignments ADD COLUMN IF NOT EXISTS batch_id INTEGER REFERENCES upload_batches(id);
+
+CREATE TABLE IF NOT EXISTS analysis_jobs (
+    id SERIAL PRIMARY KEY,
+    assignment_id INTEGER NOT NULL REFERENCES assignments(id),
+    batch_id INTEGER REFERENCES upload_batches(id),
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    analysis_id INTEGER REFERENCES analysis_results(id),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    run_after TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS result_cache (
+    cache_key VARCHAR(64) PRIMARY KEY,
+    kind TEXT NOT NULL,
+    model TEXT,
+    payload JSON NOT NULL,
+    hit_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ DEFAULT now(),
+    last_accessed_at TIMESTAMPTZ DEFAULT now()
+);
+
 CREATE TABLE IF NOT EXISTS academic_sources (
     id SERIAL PRIMARY KEY,
     title TEXT,
@@ -42,11 +89,99 @@ CREATE TABLE IF NOT EXISTS academic_sources (
     abstract TEXT,
     full_text TEXT,
     source_type TEXT,
-    embedding_data JSONB
+    embedding_blob BYTEA,
+    -- Must match EMBEDDING_DIM; the API refuses to start against another size
+    embedding vector(384),
+    minhash_signature BYTEA,
+    -- Weighted document for keyword search (title A, abstract B, authors C)
+    search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(abstract, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(authors, '')), 'C')
+    ) STORED,
+    -- Normalized title + year; unique so bulk loads skip known sources
+    dedup_key TEXT GENERATED ALWAYS AS (
+        NULLIF(lower(btrim(regexp_replace(coalesce(title, ''), '[^[:alnum:]]+', ' ', 'g'))), '')
+        || '|' || coalesce(CAST(publication_year AS text), '')
+    ) STORED
+);
+
+CREATE TABLE IF NOT EXISTS source_loads (
+    source TEXT PRIMARY KEY,
+    file_size BIGINT,
+    records_done BIGINT NOT NULL DEFAULT 0,
+    inserted BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS source_chunks (
+    id SERIAL PRIMARY KEY,
+    source_id INTEGER NOT NULL REFERENCES academic_sources(id) ON DELETE CASCADE,
+    chunk_index INTEGER NOT NULL,
+    start_offset INTEGER NOT NULL,
+    end_offset INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    search_vector tsvector GENERATED ALWAYS AS (to_tsvector('english', content)) STORED,
+    embedding vector(384)  -- EMBEDDING_DIM
+);
+
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    cache_key VARCHAR(64) PRIMARY KEY,
+    vector BYTEA NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    last_used_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS lsh_buckets (
+    band_key BIGINT NOT NULL,
+    doc_type SMALLINT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    PRIMARY KEY (band_key, doc_type, doc_id)
+);
+
+CREATE TABLE IF NOT EXISTS assignment_fingerprints (
+    fingerprint BIGINT NOT NULL,
+    assignment_id INTEGER NOT NULL REFERENCES assignments(id) ON DELETE CASCADE,
+    PRIMARY KEY (fingerprint, assignment_id)
 );
 
 -- Create indexes for text search
 CREATE INDEX IF NOT EXISTS idx_students_email ON students(email);
-CREATE INDEX IF NOT EXISTS idx_assignments_student_id ON assignments(student_id);
-CREATE INDEX IF NOT EXISTS idx_academic_sources_search 
-ON academic_sources USING gin(to_tsvector('english', title || ' ' || abstract || ' ' || authors));
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS ix_assignments_student_uploaded ON assignments(student_id, uploaded_at, id);
+CREATE INDEX IF NOT EXISTS ix_analysis_results_assignment ON analysis_results(assignment_id);
+CREATE INDEX IF NOT EXISTS ix_analysis_jobs_status_created ON analysis_jobs(status, created_at);
+CREATE INDEX IF NOT EXISTS ix_analysis_jobs_assignment ON analysis_jobs(assignment_id, id);
+CREATE INDEX IF NOT EXISTS ix_analysis_jobs_batch ON analysis_jobs(batch_id, status);
+CREATE INDEX IF NOT EXISTS ix_result_cache_last_accessed_at ON result_cache(last_accessed_at);
+CREATE INDEX IF NOT EXISTS ix_lsh_buckets_doc ON lsh_buckets(doc_type, doc_id);
+CREATE INDEX IF NOT EXISTS ix_assignment_fingerprints_assignment ON assignment_fingerprints(assignment_id);
+CREATE INDEX IF NOT EXISTS ix_embedding_cache_last_used_at ON embedding_cache(last_used_at);
+CREATE INDEX IF NOT EXISTS ix_academic_sources_embedding
+ON academic_sources USING hnsw (embedding vector_cosine_ops);
+CREATE INDEX IF NOT EXISTS ix_academic_sources_search_vector
+ON academic_sources USING gin(search_vector);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_academic_sources_dedup_key ON academic_sources(dedup_key);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_source_chunks_source ON source_chunks(source_id, chunk_index);
+CREATE INDEX IF NOT EXISTS ix_source_chunks_search_vector ON source_chunks USING gin(search_vector);
+CREATE INDEX IF NOT EXISTS ix_source_chunks_embedding
+ON source_chunks USING hnsw (embedding vector_cosine_ops);
+CREATE INDEX IF NOT EXISTS ix_academic_sources_title_trgm
+ON academic_sources USING gin(title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_academic_sources_abstract_trgm
+ON academic_sources USING gin(abstract gin_trgm_ops);
+
+-- lsh_buckets.doc_id points at academic_sources (doc_type 0) or assignments
+-- (doc_type 1); delete the buckets of removed rows
+CREATE OR REPLACE FUNCTION lsh_buckets_cleanup() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM lsh_buckets b USING removed r
+    WHERE b.doc_type = TG_ARGV[0]::smallint AND b.doc_id = r.id;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS academic_sources_lsh_cleanup ON academic_sources;
+CREATE TRIGGER academic_sources_lsh_cleanup AFTER DELETE ON academic_sources
+REFERENCING OLD TABLE AS removed FOR EACH STATEMENT EXECUTE FUNCTION lsh_buckets_cleanup('0');
+DROP TRIGGER IF EXISTS assignments_lsh_cleanup ON assignments;
+CREATE TRIGGER assignments_lsh_cleanup AFTER DELETE ON assignments
+REFERENCING OLD TABLE AS removed FOR EACH STATEMENT EXECUTE FUNCTION lsh_buckets_cleanup('1');